@@ -3,6 +3,7 @@ import json
 from textwrap import dedent
 import pendulum
 import os
+import re
 from airflow import DAG
 from airflow.operators.python import PythonOperator
 
@@ -21,7 +22,9 @@ with DAG(
     
     def training(**kwargs):
         from sensor.pipeline.training_pipeline import start_training_pipeline
-        start_training_pipeline()
+        # the id of the DAG run is the same for every retry of the task, so a retry resumes the
+        # run from the stage which failed instead of starting a new one
+        start_training_pipeline(run_id=re.sub(r"[^\w.-]", "_", kwargs["run_id"]))
     
     def sync_artifact_to_s3_bucket(**kwargs):
         bucket_name = os.getenv("BUCKET_NAME")
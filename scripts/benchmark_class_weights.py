@@ -0,0 +1,72 @@
+# Benchmark of the resampling methods of the data transformation : SMOTE + Tomek links against
+# class weights and no resampling at all
+#
+# usage : python scripts/benchmark_class_weights.py [csv file] [--copies 1,4] [--test-size F]
+#
+# The csv file is split into train and test sets, stratified, and transformed by the pipeline
+# of the data transformation. The training set is repeated 'copies' times, every copy but the
+# first one moved by a little noise, to time larger inputs. For every method the training set
+# is resampled by SMOTETomek ("smote_tomek") or weighted by DataTransformation.get_class_weights
+# ("class_weight"), and the model is trained by ModelTrainer.train_model as in the pipeline.
+# The seconds of the resampling and of the fit, the training rows and the F1 on the test set,
+# never resampled, are printed.
+
+import os
+import sys
+import time
+import argparse
+import warnings
+import numpy as np
+from imblearn.combine import SMOTETomek
+from sklearn.metrics import f1_score
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import LabelEncoder
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sensor import utils
+from sensor.config import TARGET_COLUMN
+from sensor.entity.config_entity import ModelTrainingConfig, TrainingPipelineConfig
+from sensor.components.data_transformation import DataTransformation
+from sensor.components.model_trainer import ModelTrainer
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file_path", nargs="?", default=os.path.join(os.getcwd(), "aps_failure_training_set1.csv"))
+    parser.add_argument("--copies", default="1,4", help="number of copies of the training set of every run")
+    parser.add_argument("--test-size", type=float, default=0.2)
+    args = parser.parse_args()
+
+    # the imputer warns about the columns without any value
+    warnings.simplefilter("ignore", UserWarning)
+    df = utils.read_sensor_csv(args.file_path)
+    label_encoder = LabelEncoder()
+    y = label_encoder.fit_transform(df.pop(TARGET_COLUMN))
+    train_df, test_df, y_train, y_test = train_test_split(df, y, test_size=args.test_size, stratify=y, random_state=42)
+    transformer = DataTransformation.get_data_transformer_object().fit(train_df)
+    x_train = transformer.transform(train_df).astype(np.float32)
+    x_test = transformer.transform(test_df).astype(np.float32)
+
+    trainer = ModelTrainer(ModelTrainingConfig(TrainingPipelineConfig()), data_transformation_artifact=None)
+    data_transformation = DataTransformation(data_transformation_config=None, data_ingestion_artifact=None)
+    rng = np.random.default_rng(0)
+    print(f"{'rows in':>8} {'method':>12} {'resample s':>11} {'fit s':>7} {'rows out':>9} {'test f1':>8}")
+    for n_copies in [int(n) for n in args.copies.split(",")]:
+        x = np.concatenate([x_train] + [x_train + rng.normal(0, 0.01, x_train.shape).astype(np.float32)
+                                        for _ in range(n_copies - 1)])
+        y = np.tile(y_train, n_copies)
+        for method in ["smote_tomek", "class_weight", "none"]:
+            start_time = time.perf_counter()
+            x_fit, y_fit, class_weights = x, y, None
+            if method == "smote_tomek":
+                x_fit, y_fit = SMOTETomek(sampling_strategy="minority", random_state=42).fit_resample(x, y)
+            elif method == "class_weight":
+                class_weights = data_transformation.get_class_weights(y, label_encoder)
+            resample_seconds = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            model = trainer.train_model(x_fit, y_fit, class_weights=class_weights)
+            fit_seconds = time.perf_counter() - start_time
+            f1 = f1_score(y_test, trainer.predict(model, x_test))
+            print(f"{x.shape[0]:>8} {method:>12} {resample_seconds:>11.2f} {fit_seconds:>7.2f} {x_fit.shape[0]:>9} {f1:>8.4f}")
@@ -0,0 +1,98 @@
+# Benchmark of the partitioned reads of sensor.utils.get_dataframe_from_collection
+#
+# usage : python scripts/benchmark_collection_read.py [csv file] [--rows N] [--workers 1,2,4] [--batch-size N]
+#                                                     [--executor thread|process]
+#
+# The csv file is loaded into a benchmark collection of the mongod at MONGODB_URL, or of an in
+# process mongomock client when MONGODB_URL is not set. Every read is checked against the
+# single cursor read, and its time, rows per second, speedup, the size of the output and the
+# peak memory traced in this process are printed; with threads, a peak close to the output
+# plus one batch of documents per worker shows that the blocks are not joined by a copy.
+# mongomock runs in this process under the GIL and copies the matching documents on every
+# query, which its peak includes, so it only checks the output; the scaling and the memory
+# need a real mongod. The process executor needs one too, as spawned workers cannot see the
+# in process collection.
+
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sensor import utils
+from data_dump import dump_csv_to_collection
+
+
+DB_NAME = "APS_BENCHMARK"
+COLLECTION_NAME = "SENSOR_DATA"
+
+
+def get_frame_size(df:pd.DataFrame) -> int:
+    return int(sum(df[column].to_numpy().nbytes for column in df.columns))
+
+
+def time_read(n_workers:int, executor:str, batch_size:int) -> tuple:
+    """Returns the frame, the seconds and the peak traced memory of one read."""
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    df = utils.get_dataframe_from_collection(DB_NAME, COLLECTION_NAME, batch_size=batch_size,
+                                             n_workers=n_workers, executor=executor)
+    seconds = time.perf_counter() - start_time
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return df, seconds, peak
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file_path", nargs="?", default=os.path.join(os.getcwd(), "aps_failure_training_set1.csv"))
+    parser.add_argument("--rows", type=int, default=None, help="rows loaded, the file being repeated if needed")
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--executor", default="thread", choices=["thread", "process"])
+    args = parser.parse_args()
+
+    if os.getenv("MONGODB_URL"):
+        client = utils.mongo_client
+        print(f"Using the mongod at MONGODB_URL")
+    else:
+        import mongomock
+        if args.executor == "process":
+            raise Exception("The process executor needs a mongod, set MONGODB_URL.")
+        client = mongomock.MongoClient()
+        utils.mongo_client = client
+        print("MONGODB_URL is not set, using mongomock : the timings do not show the scaling of a mongod")
+
+    table = client[DB_NAME][COLLECTION_NAME]
+    table.drop()
+    file_path = args.file_path
+    if args.rows is not None:
+        df = utils.read_sensor_csv(file_path, feature_dtype=np.float64)
+        df = pd.concat([df] * int(np.ceil(args.rows / df.shape[0])), ignore_index=True).iloc[:args.rows]
+        file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_collection_read.csv")
+        df.to_csv(file_path, index=False)
+        del df
+    # a single insert worker keeps the natural order of the collection in _id order, so that
+    # the partitioned reads, joined in _id order, can be compared with the single cursor read
+    dump_csv_to_collection(file_path, table, n_workers=1)
+    if file_path != args.file_path:
+        os.remove(file_path)
+
+    expected = None
+    base_seconds = None
+    print(f"{'workers':>8} {'seconds':>8} {'rows/s':>10} {'speedup':>8} {'output MiB':>11} {'peak MiB':>9}")
+    for n_workers in [int(n) for n in args.workers.split(",")]:
+        df, seconds, peak = time_read(n_workers, args.executor, args.batch_size)
+        if expected is None:
+            expected, base_seconds = df, seconds
+        else:
+            pd.testing.assert_frame_equal(df, expected)
+        print(f"{n_workers:>8} {seconds:>8.2f} {df.shape[0] / seconds:>10.0f} {base_seconds / seconds:>8.2f} "
+              f"{get_frame_size(df) / 2**20:>11.1f} {peak / 2**20:>9.1f}")
+        del df
+
+    table.drop()
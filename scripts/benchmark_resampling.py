@@ -0,0 +1,78 @@
+# Benchmark of the resampling engines of the data transformation
+#
+# usage : python scripts/benchmark_resampling.py [csv file] [--copies 1,4] [--n-jobs N] [--test-size F]
+#
+# The csv file is split into train and test sets, stratified, and transformed by the pipeline
+# of the data transformation. The training set is repeated 'copies' times, every copy but the
+# first one moved by a little noise, to time larger inputs. Every engine resamples the training
+# set : imblearn's SMOTETomek, as the "imblearn" engine, the "fast" engine (sensor.resampling.
+# Resampler) with an exact and an approximate Tomek link search, and SMOTE alone. For every
+# one the seconds, the rows out, whether the output is the one of SMOTETomek and the test F1
+# of an XGBClassifier trained on it are printed.
+
+import os
+import sys
+import time
+import argparse
+import warnings
+import numpy as np
+from imblearn.combine import SMOTETomek
+from imblearn.over_sampling import SMOTE
+from imblearn.under_sampling import TomekLinks
+from sklearn.metrics import f1_score
+from sklearn.model_selection import train_test_split
+from xgboost import XGBClassifier
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sensor import utils
+from sensor.config import TARGET_COLUMN
+from sensor.resampling import Resampler
+from sensor.components.data_transformation import DataTransformation
+
+
+def get_smote() -> SMOTE:
+    return SMOTE(sampling_strategy="minority", random_state=42)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file_path", nargs="?", default=os.path.join(os.getcwd(), "aps_failure_training_set1.csv"))
+    parser.add_argument("--copies", default="1,4", help="number of copies of the training set of every run")
+    parser.add_argument("--n-jobs", type=int, default=1, help="threads of the nearest neighbour searches")
+    parser.add_argument("--test-size", type=float, default=0.2)
+    args = parser.parse_args()
+
+    # the imputer warns about the columns without any value
+    warnings.simplefilter("ignore", UserWarning)
+    df = utils.read_sensor_csv(args.file_path)
+    y = (df.pop(TARGET_COLUMN) == "pos").to_numpy().astype(np.int64)
+    train_df, test_df, y_train, y_test = train_test_split(df, y, test_size=args.test_size, stratify=y, random_state=42)
+    transformer = DataTransformation.get_data_transformer_object().fit(train_df)
+    x_train = transformer.transform(train_df).astype(np.float32)
+    x_test = transformer.transform(test_df).astype(np.float32)
+
+    engines = [
+        ("imblearn", lambda: SMOTETomek(sampling_strategy="minority", random_state=42, smote=get_smote(),
+                                        tomek=TomekLinks(sampling_strategy="all", n_jobs=args.n_jobs))),
+        ("fast", lambda: Resampler(get_smote(), n_jobs=args.n_jobs)),
+        ("fast approximate", lambda: Resampler(get_smote(), approximate_neighbors=True, n_jobs=args.n_jobs)),
+        ("smote only", get_smote),
+    ]
+    rng = np.random.default_rng(0)
+    print(f"{'rows in':>8} {'engine':>17} {'seconds':>8} {'rows out':>9} {'same':>5} {'test f1':>8}")
+    for n_copies in [int(n) for n in args.copies.split(",")]:
+        x = np.concatenate([x_train] + [x_train + rng.normal(0, 0.01, x_train.shape).astype(np.float32)
+                                        for _ in range(n_copies - 1)])
+        y = np.tile(y_train, n_copies)
+        expected = None
+        for name, get_resampler in engines:
+            start_time = time.perf_counter()
+            x_resampled, y_resampled = get_resampler().fit_resample(x, y)
+            seconds = time.perf_counter() - start_time
+            if expected is None:
+                expected = x_resampled, y_resampled
+            same = (np.array_equal(y_resampled, expected[1]) and np.array_equal(x_resampled, expected[0]))
+            model = XGBClassifier(n_jobs=args.n_jobs).fit(x_resampled, y_resampled)
+            f1 = f1_score(y_test, model.predict(x_test))
+            print(f"{x.shape[0]:>8} {name:>17} {seconds:>8.2f} {x_resampled.shape[0]:>9} {str(same):>5} {f1:>8.4f}")
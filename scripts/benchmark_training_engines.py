@@ -0,0 +1,119 @@
+# Benchmark of the training engines of the model trainer : XGBClassifier.fit ("sklearn") against
+# the QuantileDMatrix built chunk by chunk ("native") and its external memory version
+#
+# usage : python scripts/benchmark_training_engines.py [csv file] [--rows N] [--engines sklearn,native,external_memory]
+#                                                     [--chunk-size N]
+#
+# The csv file is transformed by the pipeline of the data transformation, repeated up to 'rows'
+# rows, every copy but the first one moved by a little noise, and saved as .npy files in a
+# temporary directory, as the data transformation saves the training arrays. Every engine then
+# trains in a process of its own on the memory mapped arrays, with ModelTrainer.train_model as
+# in the pipeline, so its peak memory is measured alone : the growth of the anonymous memory
+# (RssAnon of /proc/self/status, Linux only) is sampled during the fit, the pages of the memory
+# mapped arrays not counting. The seconds of the fit, the peak and the share of the training
+# rows predicted as by the first engine are printed.
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+import warnings
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def get_anonymous_memory() -> int:
+    """Returns the anonymous resident memory of this process in bytes."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("RssAnon"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def train(engine:str, x_path:str, y_path:str, chunk_size:int) -> dict:
+    """Trains with 'engine' on the memory mapped arrays and returns the seconds, peak and predictions."""
+    from sensor.entity.config_entity import ModelTrainingConfig, TrainingPipelineConfig
+    from sensor.components.model_trainer import ModelTrainer
+
+    x, y = np.load(x_path, mmap_mode="r"), np.load(y_path, mmap_mode="r")
+    config = ModelTrainingConfig(TrainingPipelineConfig())
+    config.training_engine = engine
+    config.chunk_size = chunk_size
+    config.external_memory_dir = os.path.join(os.path.dirname(x_path), "external_memory")
+    trainer = ModelTrainer(config, data_transformation_artifact=None)
+
+    base_memory, peak_memory, done = get_anonymous_memory(), [0], threading.Event()
+    def sample() -> None:
+        while not done.wait(0.005):
+            peak_memory[0] = max(peak_memory[0], get_anonymous_memory())
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    start_time = time.perf_counter()
+    model = trainer.train_model(x, y)
+    seconds = time.perf_counter() - start_time
+    done.set()
+    sampler.join()
+
+    predictions_path = os.path.join(os.path.dirname(x_path), f"{engine}_predictions.npy")
+    np.save(predictions_path, trainer.predict(model, x))
+    return {"seconds" : seconds, "peak_bytes" : max(0, peak_memory[0] - base_memory),
+            "predictions_path" : predictions_path}
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file_path", nargs="?", default=os.path.join(os.getcwd(), "aps_failure_training_set1.csv"))
+    parser.add_argument("--rows", type=int, default=None, help="training rows, the file being repeated if needed")
+    parser.add_argument("--engines", default="sklearn,native,external_memory")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--worker", nargs=3, metavar=("ENGINE", "X_PATH", "Y_PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        print(json.dumps(train(*args.worker, chunk_size=args.chunk_size)))
+        sys.exit(0)
+
+    from sensor import utils
+    from sensor.config import TARGET_COLUMN
+    from sensor.components.data_transformation import DataTransformation
+
+    # the imputer warns about the columns without any value
+    warnings.simplefilter("ignore", UserWarning)
+    df = utils.read_sensor_csv(args.file_path)
+    y = (df.pop(TARGET_COLUMN) == "pos").to_numpy().astype(np.int64)
+    x = DataTransformation.get_data_transformer_object().fit_transform(df).astype(np.float32)
+    n_rows = args.rows or x.shape[0]
+    n_copies = int(np.ceil(n_rows / x.shape[0]))
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory(prefix="benchmark_training_engines-") as work_dir:
+        x_path, y_path = os.path.join(work_dir, "train_features.npy"), os.path.join(work_dir, "train_target.npy")
+        x_train = np.lib.format.open_memmap(x_path, mode="w+", dtype=np.float32, shape=(n_rows, x.shape[1]))
+        for copy in range(n_copies):
+            start = copy * x.shape[0]
+            rows = min(x.shape[0], n_rows - start)
+            x_train[start:start + rows] = x[:rows] + (rng.normal(0, 0.01, (rows, x.shape[1])) if copy > 0 else 0)
+        x_train.flush()
+        del x_train
+        np.save(y_path, np.tile(y, n_copies)[:n_rows])
+        print(f"{n_rows} rows of {x.shape[1]} features, {n_rows * x.shape[1] * 4 / 2**20:.0f} MiB of float32")
+
+        expected = None
+        print(f"{'engine':>16} {'fit seconds':>12} {'peak MiB':>9} {'same predictions':>17}")
+        for engine in args.engines.split(","):
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), "--chunk-size", str(args.chunk_size),
+                                     "--worker", engine, x_path, y_path],
+                                    check=True, capture_output=True, text=True, cwd=work_dir).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            predictions = np.load(result["predictions_path"])
+            if expected is None:
+                expected = predictions
+            print(f"{engine:>16} {result['seconds']:>12.2f} {result['peak_bytes'] / 2**20:>9.0f} "
+                  f"{np.mean(predictions == expected):>17.4f}")
@@ -0,0 +1,221 @@
+import os
+import sys
+import hashlib
+import numpy as np
+import pandas as pd
+from sensor.drift import NAN_SORT_KEY, float32_sort_keys, float32_from_sort_keys
+from sensor.feature_store import FeatureStore, MANIFEST_FILE_NAME
+from sensor.logger import logging
+from sensor.exception import SensorException
+
+
+# bump when the content of the profile files changes so that older profiles get rebuilt
+COLUMN_PROFILE_VERSION = 1
+STATISTICS_FILE_NAME = "statistics.npz"
+SORT_KEYS_FILE_NAME = "sort_keys.npy"
+
+
+class ColumnProfile:
+    """Statistics of every column of a split of the feature store, e.g. the train set, computed in
+    a single pass : the columns are loaded a block at a time and every float32 column is sorted
+    once, as keys (see sensor.drift.float32_sort_keys). The null count, min, max and mean come out
+    of that pass, any quantile is read from the sorted keys without sorting again, and the KS test
+    merges the sorted keys directly. The other columns, e.g. the target, only get a null count.
+
+    The profile is saved next to the index file of the split, the sorted keys as a .npy file
+    which is memory mapped when loaded, and it is reused by every stage of the same run as long
+    as the index file and the feature store manifest are unchanged.
+    """
+
+    def __init__(self, feature_store:FeatureStore, index_path:str, profile_dir:str | None = None,
+                 chunk_size:int = 50000):
+        """
+        feature_store : store holding the rows of the split
+        index_path : index file of the split written by the data ingestion
+        profile_dir : directory of the saved profile; by default '<index file name>_profile' next to the index file
+        chunk_size : about 'chunk_size' rows worth of values are loaded at once
+        """
+        self.feature_store = feature_store
+        self.index_path = index_path
+        self.profile_dir = profile_dir if profile_dir is not None else f"{os.path.splitext(index_path)[0]}_profile"
+        self.chunk_size = chunk_size
+        self.columns = None
+        self.key_columns = None
+        self.n_rows = None
+        self.null_counts = None
+        self.min = None
+        self.max = None
+        self.mean = None
+        self.sort_keys = None
+
+
+    def get_source_hash(self) -> str:
+        """Returns the sha256 of the index file and of the feature store manifest."""
+        try:
+            source_hash = hashlib.sha256(f"v{COLUMN_PROFILE_VERSION}".encode())
+            for file_path in [self.index_path, os.path.join(self.feature_store.feature_store_dir, MANIFEST_FILE_NAME)]:
+                with open(file_path, "rb") as f:
+                    for block in iter(lambda: f.read(1 << 20), b""):
+                        source_hash.update(block)
+            return source_hash.hexdigest()
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def load(self) -> "ColumnProfile":
+        """Loads the saved profile of the split, or builds it and saves it."""
+        try:
+            statistics_path = os.path.join(self.profile_dir, STATISTICS_FILE_NAME)
+            source_hash = self.get_source_hash()
+            if os.path.exists(statistics_path):
+                with np.load(statistics_path, allow_pickle=False) as statistics:
+                    if str(statistics["source_hash"]) == source_hash:
+                        logging.info(f"Loading the column profile : {self.profile_dir}")
+                        self.columns = statistics["columns"].tolist()
+                        self.key_columns = statistics["key_columns"].tolist()
+                        self.n_rows = int(statistics["n_rows"])
+                        self.null_counts = statistics["null_counts"]
+                        self.min, self.max, self.mean = statistics["min"], statistics["max"], statistics["mean"]
+                        self.sort_keys = np.load(os.path.join(self.profile_dir, SORT_KEYS_FILE_NAME), mmap_mode="r")
+                        return self
+
+            logging.info(f"No column profile found for {self.index_path}, building it...")
+            self.build(source_hash)
+            return self
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def build(self, source_hash:str) -> None:
+        """Profiles the split in one pass over blocks of columns and saves the profile. The sorted
+        keys are written straight to their memory mapped file."""
+        try:
+            rows = np.load(self.index_path)
+            dtypes = self.feature_store.get_dtypes()
+            self.columns = self.feature_store.get_columns()
+            self.key_columns = [column for column in self.columns if np.dtype(dtypes[column]) == np.float32]
+            other_columns = [column for column in self.columns if column not in self.key_columns]
+            self.n_rows = rows.shape[0]
+
+            os.makedirs(self.profile_dir, exist_ok=True)
+            sort_keys_path = os.path.join(self.profile_dir, SORT_KEYS_FILE_NAME)
+            tmp_sort_keys_path = f"{sort_keys_path}.tmp.npy"
+            sort_keys = np.lib.format.open_memmap(tmp_sort_keys_path, mode="w+", dtype=np.uint32,
+                                                  shape=(len(self.key_columns), self.n_rows))
+
+            self.null_counts = np.zeros(len(self.columns), dtype=np.int64)
+            self.min, self.max, self.mean = (np.full(len(self.columns), np.nan) for _ in range(3))
+            positions = np.array([self.columns.index(column) for column in self.key_columns], dtype=np.int64)
+
+            block_size = max(1, self.chunk_size * len(self.columns) // max(1, self.n_rows))
+            for start in range(0, len(self.key_columns), block_size):
+                block = slice(start, min(start + block_size, len(self.key_columns)))
+                values = self.feature_store.load(columns=self.key_columns[block], rows=rows).to_numpy()
+
+                keys = float32_sort_keys(values)
+                keys.sort(axis=1)
+                sort_keys[block] = keys
+
+                n_values = (keys != NAN_SORT_KEY).sum(axis=1)
+                is_empty = n_values == 0
+                self.null_counts[positions[block]] = self.n_rows - n_values
+                # the smallest and largest values are the first and last non null keys
+                last_keys = np.take_along_axis(keys, np.maximum(n_values - 1, 0)[:, None], axis=1)[:, 0]
+                self.min[positions[block]] = np.where(is_empty, np.nan, float32_from_sort_keys(keys[:, 0]))
+                self.max[positions[block]] = np.where(is_empty, np.nan, float32_from_sort_keys(last_keys))
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    self.mean[positions[block]] = np.nansum(values, axis=0, dtype=np.float64) / n_values
+
+            if len(other_columns) > 0:
+                other_positions = [self.columns.index(column) for column in other_columns]
+                self.null_counts[other_positions] = self.feature_store.load(
+                    columns=other_columns, rows=rows).isnull().sum().to_numpy()
+
+            sort_keys.flush()
+            del sort_keys
+            os.replace(tmp_sort_keys_path, sort_keys_path)
+            self.sort_keys = np.load(sort_keys_path, mmap_mode="r")
+
+            # the statistics file is written last : the profile is only used once it exists
+            statistics_path = os.path.join(self.profile_dir, STATISTICS_FILE_NAME)
+            tmp_statistics_path = f"{statistics_path}.tmp"
+            with open(tmp_statistics_path, "wb") as f:
+                np.savez(f, source_hash=np.array(source_hash), columns=np.array(self.columns, dtype=str),
+                         key_columns=np.array(self.key_columns, dtype=str), n_rows=np.array(self.n_rows),
+                         null_counts=self.null_counts, min=self.min, max=self.max, mean=self.mean)
+            os.replace(tmp_statistics_path, statistics_path)
+            logging.info(f"Column profile of {self.n_rows} rows saved to : {self.profile_dir}")
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get_null_percent(self) -> pd.Series:
+        """Returns the fraction of null values of every column."""
+        try:
+            return pd.Series(self.null_counts / self.n_rows, index=self.columns)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get_statistics(self) -> pd.DataFrame:
+        """Returns the null count, min, max and mean of every column, one row per column."""
+        try:
+            return pd.DataFrame({"null_count" : self.null_counts, "min" : self.min, "max" : self.max,
+                                 "mean" : self.mean}, index=self.columns)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get_sort_keys(self, columns:list) -> np.ndarray:
+        """Returns the sorted keys of the float32 'columns', one row per column, NaN keys last."""
+        try:
+            positions = {column : position for position, column in enumerate(self.key_columns)}
+            return np.asarray(self.sort_keys[[positions[column] for column in columns]])
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get_quantiles(self, columns:list, percentiles:list, fill_value:float | None = None) -> np.ndarray:
+        """Returns the percentiles of the float32 'columns', interpolated as np.percentile does.
+
+        Args:
+            columns (list): float32 columns
+            percentiles (list): percentiles between 0 and 100
+            fill_value (float, optional): the null values count as 'fill_value', as after a
+                SimpleImputer(strategy="constant"); they are left out if None
+
+        Returns:
+            np.ndarray: array of shape (len(percentiles), len(columns))
+        """
+        try:
+            keys = self.get_sort_keys(columns)
+            n_values = (keys != NAN_SORT_KEY).sum(axis=1)
+            if fill_value is None:
+                n_fill, fill_position = np.zeros_like(n_values), n_values
+            else:
+                # the imputed column is the sorted values with the null values inserted at 'fill_position'
+                n_fill = self.n_rows - n_values
+                fill_key = float32_sort_keys(np.array([[fill_value]], dtype=np.float32))[0, 0]
+                fill_position = (keys < fill_key).sum(axis=1)
+
+            n_imputed = n_values + n_fill
+            positions = np.asarray(percentiles, dtype=np.float64)[:, None] / 100 * np.maximum(n_imputed - 1, 0)
+            low, high = np.floor(positions).astype(np.int64), np.ceil(positions).astype(np.int64)
+
+            def get_values(indices:np.ndarray) -> np.ndarray:
+                """Values of the imputed columns at 'indices', one row per percentile."""
+                is_fill = (indices >= fill_position) & (indices < fill_position + n_fill)
+                key_indices = np.where(indices >= fill_position + n_fill, indices - n_fill, indices)
+                key_indices = np.minimum(key_indices, keys.shape[1] - 1)
+                values = float32_from_sort_keys(np.take_along_axis(keys, key_indices.T, axis=1).T).astype(np.float64)
+                return np.where(is_fill, np.float64(np.float32(fill_value if fill_value is not None else 0)), values)
+
+            low_values, high_values = get_values(low), get_values(high)
+            # same linear interpolation as np.percentile
+            weights = positions - low
+            diff = high_values - low_values
+            quantiles = np.where(weights >= 0.5, high_values - diff * (1 - weights), low_values + diff * weights)
+            quantiles[:, n_imputed == 0] = np.nan
+            return quantiles
+        except Exception as e:
+            raise SensorException(e, sys)
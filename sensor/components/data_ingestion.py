@@ -1,8 +1,8 @@
 # data ingestion steps : 
 # collect the data from mongodb database
 # drop the nan values 
-# store the dataframe as csv file 
-# split the data into train and test files 
+# store the dataframe in the columnar format (one .npy file per column)
+# split the data into train and test row positions
 # save the files to relevant locations
 
 import numpy as np
@@ -12,7 +12,12 @@ from sensor.logger import logging
 from sensor.exception import SensorException
 from sensor.entity.artifact_entity import DataIngestionArtifact
 from sensor.entity.config_entity import DataIngestionConfig
-from sensor.utils import get_dataframe_from_collection
+from sensor.config import TARGET_COLUMN, mongo_client
+from sensor import utils
+from sensor.utils import get_dataframe_from_collection, get_latest_key_from_collection, iter_dataframe_from_collection
+from sensor.feature_store import FeatureStore
+from sensor.stage_cache import get_file_fingerprint
+from bson import ObjectId
 from sklearn.model_selection import train_test_split
 
 class DataIngestion() :
@@ -21,44 +26,196 @@ class DataIngestion() :
 
         self.data_ingestion_config = data_ingestion_config
 
+    def get_data(self, watermark=None, chunk_size:int | None = None) -> tuple :
+        """Reads the rows found after 'watermark' in the data source; all the rows if it is None.
+
+        The rows of the collection are the documents whose 'watermark_key' is above the watermark,
+        so the key must grow in the order the documents are committed. The default '_id' is an
+        ObjectId made by the writing client : a document from a concurrent writer, or one which
+        commits after this read, can get an _id below the stored watermark and is then never
+        ingested. With concurrent writers, use a key the server assigns in increasing order.
+
+        Args:
+            watermark : row count of the local file or the largest 'watermark_key' of the
+                        collection seen by the previous run
+            chunk_size (int, optional): if given, the rows are returned as an iterator of
+                        dataframes of at most 'chunk_size' rows
+
+        Returns:
+            tuple: (pd.DataFrame or iterator of pd.DataFrame, new watermark)
+        """
+        try:
+            # get the data as a dataframe
+            if self.data_ingestion_config.local_file_path:
+                print(f"Data Ingestion using local file to save time, please keep in mind.")
+                file_path = self.data_ingestion_config.local_file_path
+                skip_rows = range(1, watermark + 1) if watermark else None
+                if chunk_size is None:
+                    # the "na" values are read as np.nan
+                    df = utils.read_sensor_csv(file_path, skiprows=skip_rows)
+                    return df, (watermark or 0) + df.shape[0]
+
+                # the row count is taken first so that rows appended while reading are left for the next run
+                with open(file_path, "r") as f:
+                    n_rows = sum(1 for _ in f) - 1
+                if n_rows <= (watermark or 0):
+                    return [], watermark
+                chunks = utils.read_sensor_csv(file_path, skiprows=skip_rows, nrows=n_rows - (watermark or 0),
+                                               chunksize=chunk_size)
+                return chunks, n_rows
+
+            key = self.data_ingestion_config.watermark_key
+            latest = get_latest_key_from_collection(
+                self.data_ingestion_config.database_name,
+                self.data_ingestion_config.collection_name,
+                key=key)
+            if key == "_id" and isinstance(watermark, str):
+                watermark = ObjectId(watermark)
+            if latest is None or latest == watermark:
+                return (pd.DataFrame() if chunk_size is None else []), watermark
+
+            # the upper bound keeps documents inserted while reading for the next run
+            key_range = {"$lte" : latest}
+            if watermark is not None:
+                key_range["$gt"] = watermark
+            latest = str(latest) if isinstance(latest, ObjectId) else latest
+
+            if chunk_size is not None:
+                chunks = iter_dataframe_from_collection(
+                    self.data_ingestion_config.database_name,
+                    self.data_ingestion_config.collection_name,
+                    batch_size=chunk_size,
+                    query={key : key_range})
+                return chunks, latest
+
+            df : pd.DataFrame = get_dataframe_from_collection(
+                self.data_ingestion_config.database_name,
+                self.data_ingestion_config.collection_name,
+                batch_size=self.data_ingestion_config.batch_size,
+                query={key : key_range},
+                n_workers=self.data_ingestion_config.read_workers,
+                executor=self.data_ingestion_config.read_executor)
+
+            return df, latest
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get_source_fingerprint(self) -> dict :
+        """Returns what identifies the current content of the data source : the size and
+        modification time of the local file, or the largest 'watermark_key' and the number of
+        documents of the collection."""
+        try:
+            if self.data_ingestion_config.local_file_path:
+                return get_file_fingerprint(self.data_ingestion_config.local_file_path)
+            database_name = self.data_ingestion_config.database_name
+            collection_name = self.data_ingestion_config.collection_name
+            return {"database" : database_name, "collection" : collection_name,
+                    "latest" : str(get_latest_key_from_collection(database_name, collection_name,
+                                                                  key=self.data_ingestion_config.watermark_key)),
+                    "count" : mongo_client[database_name][collection_name].estimated_document_count()}
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get_split_index(self, feature_store:FeatureStore) -> tuple :
+        """Splits the rows of the feature store into train and test row positions.
+
+        A run on its own feature store is split with train_test_split, stratified on the target.
+        In the out of core and incremental modes the split is hashed instead, and stratified
+        partition by partition : every row gets a hash of its values, and in every partition
+        the rows of a class with the lowest hashes go to the test set, as many as needed for the
+        test rows of the class, counted over this partition and the ones before it, to be
+        'test_size' of its rows, rounded. Only the hashes of a partition are held in memory, and
+        as the partitions are never changed once appended, a row keeps its set when new rows
+        are appended to the feature store, which the warm start relies on (see sensor.warm_start).
+
+        Returns:
+            tuple: (sorted train row positions, sorted test row positions)
+        """
+        try:
+            test_size = self.data_ingestion_config.test_size
+
+            if not (self.data_ingestion_config.out_of_core or self.data_ingestion_config.incremental):
+                target = feature_store.load(columns=[TARGET_COLUMN])[TARGET_COLUMN]
+                train_index, test_index = train_test_split(np.arange(target.shape[0]), test_size=test_size,
+                                                           stratify=target, random_state=42)
+                return np.sort(train_index), np.sort(test_index)
+
+            test_index, class_counts, class_test_counts = [], dict(), dict()
+            start = 0
+            for partition_size in feature_store.get_partition_sizes():
+                rows = np.arange(start, start + partition_size)
+                hashes, target = [], []
+                for chunk in feature_store.iter_chunks(self.data_ingestion_config.chunk_size, rows=rows):
+                    hashes.append(pd.util.hash_pandas_object(chunk, index=False).to_numpy())
+                    target.append(chunk[TARGET_COLUMN].to_numpy())
+                hashes, target = np.concatenate(hashes), np.concatenate(target)
+                for label in np.unique(target):
+                    class_rows = rows[target == label]
+                    class_counts[label] = class_counts.get(label, 0) + class_rows.shape[0]
+                    n_test = int(round(test_size * class_counts[label])) - class_test_counts.get(label, 0)
+                    class_test_counts[label] = class_test_counts.get(label, 0) + n_test
+                    order = np.argsort(hashes[target == label], kind="stable")
+                    test_index.append(class_rows[order[:n_test]])
+                start += partition_size
+
+            is_test = np.zeros(start, dtype=bool)
+            if len(test_index) > 0:
+                is_test[np.concatenate(test_index)] = True
+            return np.flatnonzero(~is_test), np.flatnonzero(is_test)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
     def initiate_data_ingestion(self) -> DataIngestionArtifact :
         
         try :
 
             logging.info(f"{'>>'*10}Initiating data ingestion phase...")
 
-            print(f"Data Ingestion using local file to save time, please keep in mind.")
-
-            # get the data as a dataframe
-            """
-            df : pd.DataFrame = get_dataframe_from_collection(
-                self.data_ingestion_config.database_name,
-                self.data_ingestion_config.collection_name)
-            """
-            df = pd.read_csv(os.path.join(os.getcwd(), "aps_failure_training_set1.csv"))
-            
-            # replace the "na" values by np.nan
-            df.replace(to_replace="nan", value=np.nan, inplace=True)
-            
-
-            # store the dataframe to 'feature_store_file_path' folder
-            path = self.data_ingestion_config.feature_store_file_path
-            os.makedirs(path, exist_ok=True)
-            path = os.path.join(path, "sensor.csv")
-            df.to_csv(path_or_buf=path, header=True, index=False)
-
-            # split the data to train and test
-            train_df, test_df = train_test_split(df,test_size=self.data_ingestion_config.test_size, random_state=42)
+            if self.data_ingestion_config.incremental:
+                # fetch the new rows only and append them to the persistent feature store
+                feature_store_path = self.data_ingestion_config.feature_store_dir
+                feature_store = FeatureStore(feature_store_path)
+                watermark = feature_store.get_watermark()
+                logging.info(f"Fetching the rows after watermark : {watermark}")
+            else:
+                # the feature store of this run holds a single partition
+                feature_store_path = self.data_ingestion_config.feature_store_file_path
+                feature_store = FeatureStore(feature_store_path)
+                watermark = None
+
+            # in the out of core mode every chunk of the source becomes a partition
+            chunk_size = self.data_ingestion_config.chunk_size if self.data_ingestion_config.out_of_core else None
+            data, new_watermark = self.get_data(watermark, chunk_size=chunk_size)
+            feature_store.append_chunks(data if chunk_size else [data], new_watermark)
+            del data
+            if sum(feature_store.get_partition_sizes()) == 0:
+                raise Exception(f"No data to train on : the feature store {feature_store_path} is empty and "
+                                f"no rows were found after watermark {watermark}.")
+
+            # split the data to train and test, see get_split_index; only the row
+            # positions are saved, the rows stay in the feature store
+            train_index, test_index = self.get_split_index(feature_store)
 
             # save the files
-            dataset_dir = os.path.dirname(self.data_ingestion_config.train_file_path)
-            os.makedirs(dataset_dir)
-            train_df.to_csv(self.data_ingestion_config.train_file_path)
-            test_df.to_csv(self.data_ingestion_config.test_file_path)
+            utils.save_numpy_array(self.data_ingestion_config.train_file_path, train_index)
+            utils.save_numpy_array(self.data_ingestion_config.test_file_path, test_index)
+
+            if self.data_ingestion_config.export_csv:
+                feature_store.load().to_csv(
+                    os.path.join(feature_store_path, "sensor.csv"), header=True, index=False)
+                feature_store.load_split(self.data_ingestion_config.train_file_path).to_csv(
+                    self.data_ingestion_config.train_csv_file_path, index=False)
+                feature_store.load_split(self.data_ingestion_config.test_file_path).to_csv(
+                    self.data_ingestion_config.test_csv_file_path, index=False)
 
             # prepare the output : dataIngestionArtifact
             data_ingestion_artifact = DataIngestionArtifact(
-                self.data_ingestion_config.feature_store_file_path,
+                feature_store_path,
                 self.data_ingestion_config.train_file_path,
                 self.data_ingestion_config.test_file_path)
             
@@ -2,19 +2,41 @@ import os
 import sys
 import pandas as pd
 import numpy as np
+import sklearn
 from sklearn.preprocessing import RobustScaler
 from sklearn.preprocessing import LabelEncoder
 from sklearn.impute import SimpleImputer
 from sklearn.pipeline import Pipeline
+from sklearn.neighbors import NearestNeighbors
 from imblearn.combine import SMOTETomek
+from imblearn.over_sampling import SMOTE
+from imblearn.under_sampling import TomekLinks
 from sensor.entity.config_entity import DataTransformationConfig
 from sensor.entity.artifact_entity import DataTransformationArtifact, DataIngestionArtifact
 from sensor.logger import logging
 from sensor.config import TARGET_COLUMN
 from sensor import utils
+from sensor.feature_store import FeatureStore
+from sensor.sketch import ColumnSketch
+from sensor.column_profile import ColumnProfile
+from sensor.resampling import Resampler
+from sensor.transformation_cache import TransformationCache
+from sensor.predictor import ModelResolver, TransformerKernel
+from sensor.warm_start import get_rows_digest, plan_warm_start
 from sensor.exception import SensorException
 
 
+# scikit-learn versions, as (major, minor), for which 'DataTransformation.set_fitted_state' sets
+# every attribute the Imputer and RobustScaler transforms read; tests/test_data_transformation.py
+# compares it with Pipeline.fit. With other versions the transformer is fitted by Pipeline.fit.
+SKLEARN_FITTED_STATE_VERSIONS = [(1, 9)]
+
+# neighbours of the SMOTE samples, as SMOTE(k_neighbors=5)
+SMOTE_K_NEIGHBORS = 5
+
+# settings which change the speed or memory use of the transformation but not its outputs
+CACHE_IGNORED_SETTINGS = ["resampling_n_jobs", "chunk_size", "cache_max_entries", "cache_max_bytes"]
+
 
 class DataTransformation():
     def __init__(self, data_transformation_config: DataTransformationConfig,
@@ -50,91 +72,589 @@ class DataTransformation():
             raise SensorException(e, sys)
         
 
-    def initiate_data_transformation(self) -> DataTransformationArtifact:
+    def get_resampler(self):
+        """Returns the resampler selected by 'resampling_method' and 'resampling_engine', None when
+        the data is not resampled. All of them add the same SMOTE samples of the minority class.
+
+        Returns:
+            SMOTETomek, SMOTE, Resampler or None: object with a fit_resample(X, y) method
+        """
         try:
+            config = self.data_transformation_config
+            if config.resampling_method in ["none", "class_weight"]:
+                return None
+            if config.resampling_method not in ["smote_tomek", "smote"]:
+                raise Exception(f"Unknown resampling method : {config.resampling_method}")
 
-            logging.info(f"{'>>'*10}Initiating data transformation phase...")
+            # same neighbours as SMOTE(k_neighbors=SMOTE_K_NEIGHBORS), searched with 'resampling_n_jobs' jobs
+            smote = SMOTE(sampling_strategy="minority", random_state=42,
+                          k_neighbors=NearestNeighbors(n_neighbors=SMOTE_K_NEIGHBORS + 1, n_jobs=config.resampling_n_jobs))
+            if config.resampling_method == "smote":
+                return smote
+            if config.resampling_engine == "fast":
+                return Resampler(smote, approximate_neighbors=config.approximate_neighbors,
+                                 n_jobs=config.resampling_n_jobs)
+            return SMOTETomek(sampling_strategy="minority", random_state=42, smote=smote,
+                              tomek=TomekLinks(sampling_strategy="all", n_jobs=config.resampling_n_jobs))
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get_class_weights(self, target_feature_arr:np.ndarray, label_encoder:LabelEncoder) -> dict:
+        """Weights of the classes of the encoded target, inversely proportional to their frequency
+        as in class_weight="balanced", and the XGBoost 'scale_pos_weight' of a binary target.
+
+        Returns:
+            dict: {"class_counts", "class_weights", "labels", "scale_pos_weight"}, the classes
+                  given by their encoded value
+        """
+        try:
+            classes, counts = np.unique(target_feature_arr, return_counts=True)
+            class_weights = counts.sum() / (classes.shape[0] * counts)
+            return {
+                "class_counts" : {int(c) : int(count) for c, count in zip(classes, counts)},
+                "class_weights" : {int(c) : float(weight) for c, weight in zip(classes, class_weights)},
+                "labels" : {str(label) : int(c) for c, label in enumerate(label_encoder.classes_)},
+                # number of negative samples per positive sample
+                "scale_pos_weight" : float(counts[0] / counts[1]) if classes.shape[0] == 2 else None,
+            }
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    @staticmethod
+    def is_fitted_state_supported() -> bool:
+        """Returns whether the installed scikit-learn is one of SKLEARN_FITTED_STATE_VERSIONS."""
+        try:
+            version = tuple(int(part) for part in sklearn.__version__.split(".")[:2])
+            return version in SKLEARN_FITTED_STATE_VERSIONS
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    @staticmethod
+    def set_fitted_state(transformation_pipeline:Pipeline, feature_columns:list, kept_columns:list,
+                         center:np.ndarray, scale:np.ndarray) -> Pipeline:
+        """Sets on the Imputer and RobustScaler steps of an unfitted 'transformation_pipeline'
+        the attributes Pipeline.fit would set, for the training data given by its statistics :
+        the imputer keeps 'kept_columns', the columns with at least one value, and the scaler
+        subtracts 'center' and divides by 'scale'. Some of these attributes are private to
+        scikit-learn, so only the versions of SKLEARN_FITTED_STATE_VERSIONS, whose transforms
+        read no others, are supported.
+
+        Returns:
+            Pipeline: fitted sklearn.pipeline.Pipeline object.
+        """
+        try:
+            if not DataTransformation.is_fitted_state_supported():
+                raise Exception(f"The transformer cannot be fitted from the column profile with scikit-learn "
+                                f"{sklearn.__version__}, supported : {SKLEARN_FITTED_STATE_VERSIONS}. Check that "
+                                f"the attributes of 'set_fitted_state' are the ones Pipeline.fit sets.")
+            simple_imputer = transformation_pipeline.named_steps["Imputer"]
+            robust_scaler = transformation_pipeline.named_steps["RobustScaler"]
+
+            simple_imputer.feature_names_in_ = np.asarray(feature_columns, dtype=object)
+            simple_imputer.n_features_in_ = len(feature_columns)
+            # the columns without any value have a null statistic, the imputer drops them
+            simple_imputer.statistics_ = np.array([simple_imputer.fill_value if column in kept_columns else np.nan
+                                                   for column in feature_columns], dtype=np.float64)
+            simple_imputer.indicator_ = None
+            # dtype of the training data, as saved by the feature store
+            simple_imputer._fit_dtype = np.dtype(np.float32)
+            simple_imputer._fill_dtype = np.dtype(np.float32)
+
+            robust_scaler.n_features_in_ = len(kept_columns)
+            robust_scaler.center_ = np.asarray(center, dtype=np.float64) if robust_scaler.with_centering else None
+            robust_scaler.scale_ = np.asarray(scale, dtype=np.float64) if robust_scaler.with_scaling else None
+            return transformation_pipeline
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def fit_transformer_from_profile(self, transformation_pipeline:Pipeline, feature_store:FeatureStore,
+                                     rows:np.ndarray, feature_columns:list) -> Pipeline:
+        """Fits the transformer from the column profile of the training set, saved by the data
+        validation or built here in a single pass, so the training data is not scanned again :
+        the RobustScaler median and interquartile range are the exact values of the imputed
+        training set, read from the sorted values of the profile, and are set on the pipeline
+        by 'set_fitted_state'. With a scikit-learn version 'set_fitted_state' does not support,
+        the training rows are loaded from the feature store and fitted by Pipeline.fit instead.
+
+        Returns:
+            Pipeline: fitted sklearn.pipeline.Pipeline object.
+        """
+        try:
+            if not self.is_fitted_state_supported():
+                logging.info(f"The fitted state of scikit-learn {sklearn.__version__} cannot be set from the "
+                                f"column profile, fitting the transformer on the {rows.shape[0]} training rows.")
+                return transformation_pipeline.fit(feature_store.load(columns=feature_columns, rows=rows))
+
+            column_profile = ColumnProfile(feature_store, self.data_ingestion_artifact.train_file_path,
+                                           chunk_size=self.data_transformation_config.chunk_size).load()
+            null_percent = column_profile.get_null_percent()[feature_columns]
+            kept_columns = list(null_percent.index[null_percent < 1])
+
+            fill_value = transformation_pipeline.named_steps["Imputer"].fill_value
+            q_min, q_max = transformation_pipeline.named_steps["RobustScaler"].quantile_range
 
-            # read the train and test file
-            train_df = pd.read_csv(self.data_ingestion_artifact.train_file_path)
-            test_df = pd.read_csv(self.data_ingestion_artifact.test_file_path)
+            # the null values are counted as the constant of the imputer
+            profile_columns = [column for column in kept_columns if column in column_profile.key_columns]
+            quantiles = column_profile.get_quantiles(profile_columns, [q_min, 50, q_max], fill_value=fill_value)
+            quantiles = dict(zip(profile_columns, quantiles.T))
 
-            train_df.replace({"na":np.nan}, inplace=True)
-            test_df.replace({"na":np.nan}, inplace=True)
+            center, scale = np.empty(len(kept_columns)), np.empty(len(kept_columns))
+            for i, column in enumerate(kept_columns):
+                if column in quantiles:
+                    q_low, median, q_high = quantiles[column]
+                else:
+                    # columns which are not float32 are not in the sorted values of the profile
+                    values = feature_store.load(columns=[column], rows=rows)[column].to_numpy()
+                    values = np.where(pd.isnull(values), fill_value, values).astype(np.float64)
+                    q_low, median, q_high = np.percentile(values, [q_min, 50, q_max])
+                center[i] = median
+                # constant columns are not scaled, as in RobustScaler
+                scale[i] = (q_high - q_low) if q_high > q_low else 1.0
+
+            return self.set_fitted_state(transformation_pipeline, feature_columns, kept_columns, center, scale)
+        except Exception as e:
+            raise SensorException(e, sys)
 
-            # now separate the data into input features and target features
-            input_feature_train_df = train_df.drop(TARGET_COLUMN, axis=1)
-            input_feature_test_df = test_df.drop(TARGET_COLUMN, axis=1)
 
-            target_feature_train_df = train_df[TARGET_COLUMN]
-            target_feature_test_df = test_df[TARGET_COLUMN]
+    def get_imputed_columns(self, transformation_pipeline:Pipeline, feature_columns:list) -> list:
+        """Returns the columns kept by the fitted imputer, which skips the columns without any value."""
+        try:
+            statistics = transformation_pipeline.named_steps["Imputer"].statistics_
+            return [column for column, statistic in zip(feature_columns, statistics) if not pd.isnull(statistic)]
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def transform_in_place(self, transformation_pipeline:Pipeline, feature_store:FeatureStore, rows:np.ndarray,
+                           reference_sketch:ColumnSketch | None = None) -> np.ndarray:
+        """Transforms 'rows' without any intermediate copy : the columns kept by the imputer are
+        copied from the feature store into a preallocated float32 array, which is then imputed
+        and scaled in place 'chunk_size' rows at a time by the TransformerKernel exported from
+        the pipeline. These are the operations the fitted SimpleImputer and RobustScaler run on
+        float32 data, so the result is identical to the pipeline output.
+
+        Args:
+            transformation_pipeline (Pipeline): fitted pipeline of 'get_data_transformer_object'
+            feature_store (FeatureStore): store holding the rows
+            rows (np.ndarray): sorted positions of the rows to transform
+            reference_sketch (ColumnSketch, optional): sketch of the imputed columns updated with the raw values
+
+        Returns:
+            np.ndarray: float32 array of shape (len(rows), number of imputed columns)
+        """
+        try:
+            kernel = TransformerKernel.from_pipeline(transformation_pipeline)
+            input_arr = feature_store.load_array(kernel.columns, rows, dtype=np.float32)
+            chunk_size = self.data_transformation_config.chunk_size
+            for start in range(0, input_arr.shape[0], chunk_size):
+                chunk = input_arr[start:start + chunk_size]
+                if reference_sketch is not None:
+                    reference_sketch.update(pd.DataFrame(chunk, columns=kernel.columns, copy=False))
+                kernel.transform_in_place(chunk)
+            return input_arr
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def transform_float32(self) -> tuple:
+        """float32 transformation : the train and test features are transformed in place by
+        'transform_in_place' and the labels are kept apart, so the features are never copied
+        as a float64 matrix or joined with the labels. Both are saved as they are; resampling
+        adds the new rows to new arrays.
+
+        Returns:
+            tuple: (fitted transformation pipeline, fitted label encoder, reference sketch)
+        """
+        try:
+            config = self.data_transformation_config
+            feature_store = FeatureStore(self.data_ingestion_artifact.feature_store_file_path)
+            train_rows = np.load(self.data_ingestion_artifact.train_file_path)
+            test_rows = np.load(self.data_ingestion_artifact.test_file_path)
+            feature_columns = [column for column in feature_store.get_columns() if column != TARGET_COLUMN]
 
             # create a label encoder to encode the target feature
+            target_feature_train_df = feature_store.load(columns=[TARGET_COLUMN], rows=train_rows)[TARGET_COLUMN]
             label_encoder = LabelEncoder()
             label_encoder.fit(target_feature_train_df)
 
-            # transform the target features
-            target_feature_train_arr = label_encoder.transform(target_feature_train_df)
-            target_feature_test_arr = label_encoder.transform(target_feature_test_df)
+            logging.info(f"Fitting the transformer from the column profile...")
+            transformation_pipeline = self.fit_transformer_from_profile(
+                DataTransformation.get_data_transformer_object(), feature_store, train_rows, feature_columns)
 
+            reference_sketch = ColumnSketch(self.get_imputed_columns(transformation_pipeline, feature_columns),
+                                            relative_accuracy=config.sketch_relative_accuracy)
+            self.save_splits(transformation_pipeline, label_encoder, feature_store, train_rows, test_rows,
+                             reference_sketch=reference_sketch)
+            return transformation_pipeline, label_encoder, reference_sketch
+        except Exception as e:
+            raise SensorException(e, sys)
 
-            logging.info(f"Imputing missing data and removing outliers...")
 
-            transformation_pipeline = DataTransformation.get_data_transformer_object()
-            transformation_pipeline.fit(input_feature_train_df)
+    def save_splits(self, transformation_pipeline:Pipeline, label_encoder:LabelEncoder, feature_store:FeatureStore,
+                    train_rows:np.ndarray, test_rows:np.ndarray, reference_sketch:ColumnSketch | None = None) -> None:
+        """Transforms the train and test rows in place with the fitted objects, resamples them as
+        configured and saves the features and the labels.
 
-            # transform the input features
-            input_feature_train_arr = transformation_pipeline.transform(input_feature_train_df)
-            input_feature_test_arr = transformation_pipeline.transform(input_feature_test_df)
+        Args:
+            reference_sketch (ColumnSketch, optional): sketch of the imputed columns updated with the raw training values
+        """
+        try:
+            config = self.data_transformation_config
+            resampler = self.get_resampler()
+            for rows, reference, resample, file_path, target_file_path in [
+                    (train_rows, reference_sketch, True, config.transformed_train_path, config.transformed_train_target_path),
+                    (test_rows, None, config.resample_test, config.transformed_test_path, config.transformed_test_target_path)]:
+                logging.info(f"Transforming {rows.shape[0]} rows in place...")
+                input_feature_arr = self.transform_in_place(transformation_pipeline, feature_store, rows,
+                                                            reference_sketch=reference)
+                target_feature_arr = label_encoder.transform(feature_store.load(columns=[TARGET_COLUMN], rows=rows)[TARGET_COLUMN])
 
-            # the target column is highly imbalanced; hence we will populate it with minority value
-            
-            logging.info(f"Performing resampling...")
-            
-            smt = SMOTETomek(sampling_strategy="minority", random_state=42)
+                if resampler is not None and resample:
+                    logging.info(f"Before resampling : Input features:{input_feature_arr.shape},Target feature:{target_feature_arr.shape}")
+                    input_feature_arr, target_feature_arr = resampler.fit_resample(input_feature_arr, target_feature_arr)
+                    logging.info(f"After resampling : Input features:{input_feature_arr.shape},Target feature:{target_feature_arr.shape}")
 
-            logging.info(f"Before resampling in training data:\
-                         Input features:{input_feature_train_arr.shape},Target feature:{target_feature_train_arr.shape}")
-            
-            input_feature_train_arr, target_feature_train_arr = smt.fit_resample(input_feature_train_arr, target_feature_train_arr)
-            
-            logging.info(f"After resampling in training data:\
-                         Input features:{input_feature_train_arr.shape},Target feature:{target_feature_train_arr.shape}")
-            
-            logging.info(f"Before resampling in test data:\
-                         Input features:{input_feature_test_arr.shape},Target feature:{target_feature_test_arr.shape}")
-            
-            input_feature_test_arr, target_feature_test_arr = smt.fit_resample(input_feature_test_arr, target_feature_test_arr)
-            
-            logging.info(f"Before resampling in test data:\
-                         Input features:{input_feature_test_arr.shape},Target feature:{target_feature_test_arr.shape}")
-            
+                utils.save_numpy_array(file_path=file_path, array=input_feature_arr)
+                utils.save_numpy_array(file_path=target_file_path, array=target_feature_arr)
+                del input_feature_arr, target_feature_arr
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def transform_warm_start(self, warm_start_plan:dict) -> tuple:
+        """Warm start transformation, see sensor.warm_start.plan_warm_start : the new training rows
+        and all the test rows are transformed with the champion's transformer and label encoder,
+        so that the champion's trees apply to them, and only the new training rows are saved.
+
+        Returns:
+            tuple: (champion's transformation pipeline, champion's label encoder, champion's reference
+                sketch merged with the sketch of the new rows)
+        """
+        try:
+            model_resolver = ModelResolver()
+            transformation_pipeline = utils.load_object(file_path=model_resolver.get_latest_transformer_path())
+            label_encoder = utils.load_object(file_path=model_resolver.get_latest_target_encoder_path())
+            feature_store = FeatureStore(self.data_ingestion_artifact.feature_store_file_path)
+            test_rows = np.load(self.data_ingestion_artifact.test_file_path)
 
-            logging.info(f"Data transformation complete. Saving necessary files...")
+            logging.info(f"Transforming the new training rows with the champion's transformer : {warm_start_plan['reason']}")
+            self.save_splits(transformation_pipeline, label_encoder, feature_store, warm_start_plan["new_train_rows"],
+                             test_rows)
+            return transformation_pipeline, label_encoder, warm_start_plan["reference_sketch"]
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def transform_out_of_core(self) -> tuple:
+        """Out of core transformation : the transformer is fitted from the column profile and the
+        transformed train and test arrays are written chunk by chunk to memory mapped .npy files.
+        Resampling is skipped as it needs the whole training set in memory. The reference sketch
+        of the training input features is updated with the same chunks.
+
+        Returns:
+            tuple: (fitted transformation pipeline, fitted label encoder, reference sketch)
+        """
+        try:
+            chunk_size = self.data_transformation_config.chunk_size
+            feature_store = FeatureStore(self.data_ingestion_artifact.feature_store_file_path)
+            train_rows = np.load(self.data_ingestion_artifact.train_file_path)
+            test_rows = np.load(self.data_ingestion_artifact.test_file_path)
+            feature_columns = [column for column in feature_store.get_columns() if column != TARGET_COLUMN]
+
+            # create a label encoder to encode the target feature
+            target_feature_train_df = feature_store.load(columns=[TARGET_COLUMN], rows=train_rows)[TARGET_COLUMN]
+            label_encoder = LabelEncoder()
+            label_encoder.fit(target_feature_train_df)
+
+            logging.info(f"Fitting the transformer from the column profile...")
+            transformation_pipeline = self.fit_transformer_from_profile(
+                DataTransformation.get_data_transformer_object(), feature_store, train_rows, feature_columns)
+
+            logging.info(f"Resampling is skipped in the out of core mode.")
+
+            reference_sketch = ColumnSketch(feature_columns,
+                                            relative_accuracy=self.data_transformation_config.sketch_relative_accuracy)
+            n_features = len(self.get_imputed_columns(transformation_pipeline, feature_columns))
+            config = self.data_transformation_config
+            for rows, file_path, target_file_path in [
+                    (train_rows, config.transformed_train_path, config.transformed_train_target_path),
+                    (test_rows, config.transformed_test_path, config.transformed_test_target_path)]:
+                logging.info(f"Writing transformed array of {rows.shape[0]} rows to {file_path}...")
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                input_feature_arr = np.lib.format.open_memmap(file_path, mode="w+", dtype=np.float32,
+                                                              shape=(rows.shape[0], n_features))
+                target_feature_arr = np.lib.format.open_memmap(target_file_path, mode="w+", dtype=np.int64,
+                                                               shape=(rows.shape[0],))
+
+                start = 0
+                for chunk in feature_store.iter_chunks(chunk_size, columns=feature_columns + [TARGET_COLUMN], rows=rows):
+                    end = start + chunk.shape[0]
+                    if rows is train_rows:
+                        reference_sketch.update(chunk[feature_columns])
+                    input_feature_arr[start:end] = transformation_pipeline.transform(chunk[feature_columns])
+                    target_feature_arr[start:end] = label_encoder.transform(chunk[TARGET_COLUMN])
+                    start = end
+
+                input_feature_arr.flush()
+                target_feature_arr.flush()
+                del input_feature_arr, target_feature_arr
+
+            return transformation_pipeline, label_encoder, reference_sketch
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def save_transformed_metadata(self, transformation_pipeline:Pipeline, label_encoder:LabelEncoder,
+                                  warm_start_plan:dict | None = None) -> dict:
+        """Writes the sidecar of the saved train and test arrays : the names of the transformed
+        features, the dtypes and row counts of the arrays, read from the .npy headers, the
+        classes of the target, whether the train and test rows are still the original ones,
+        i.e. were not resampled, the feature store and its number of rows, and the warm start decision.
+
+        Returns:
+            dict: metadata written to 'transformed_metadata_path'
+        """
+        try:
+            config = self.data_transformation_config
+            arrays = {name : utils.load_numpy_array(file_path=file_path, mmap_mode="r") for name, file_path in [
+                ("train_features", config.transformed_train_path), ("train_target", config.transformed_train_target_path),
+                ("test_features", config.transformed_test_path), ("test_target", config.transformed_test_target_path)]}
+
+            # the out of core mode never resamples
+            resampled = self.get_resampler() is not None and not config.out_of_core
+            n_feature_store_rows = int(sum(FeatureStore(self.data_ingestion_artifact.feature_store_file_path)
+                                           .get_partition_sizes()))
+            metadata = {
+                "feature_names" : self.get_imputed_columns(transformation_pipeline,
+                                                           list(transformation_pipeline.feature_names_in_)),
+                "dtypes" : {name : arr.dtype.str for name, arr in arrays.items()},
+                "n_train_rows" : int(arrays["train_features"].shape[0]),
+                "n_test_rows" : int(arrays["test_features"].shape[0]),
+                "classes" : [str(c) for c in label_encoder.classes_],
+                "train_resampled" : bool(resampled),
+                "test_resampled" : bool(resampled and config.resample_test),
+                "feature_store_dir" : self.data_ingestion_artifact.feature_store_file_path,
+                "n_feature_store_rows" : n_feature_store_rows,
+                # the test rows of the feature store, see sensor.warm_start.set_lineage
+                "test_rows_digest" : get_rows_digest(np.load(self.data_ingestion_artifact.test_file_path),
+                                                     n_feature_store_rows),
+                "warm_start" : None if warm_start_plan is None else {
+                    name : warm_start_plan[name] for name in ["warm_start", "reason", "champion_dir", "n_seen_rows",
+                                                              "n_warm_starts"]},
+            }
+            utils.write_yaml_file(file_path=config.transformed_metadata_path, data=metadata)
+            return metadata
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def update_restored_metadata(self) -> dict:
+        """Rewrites the paths of the run which stored the cache entry in the restored metadata
+        with the ones of this run, as the model lineage is read from it, see sensor.warm_start.
+
+        Returns:
+            dict: metadata written to 'transformed_metadata_path'
+        """
+        try:
+            metadata_path = self.data_transformation_config.transformed_metadata_path
+            metadata = utils.read_yaml_file(file_path=metadata_path)
+            metadata["feature_store_dir"] = self.data_ingestion_artifact.feature_store_file_path
+            utils.write_yaml_file(file_path=metadata_path, data=metadata)
+            return metadata
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get_output_paths(self) -> list:
+        """Returns the files written by the transformation, the ones cached by 'TransformationCache'."""
+        try:
+            config = self.data_transformation_config
+            output_paths = [config.transformer_object_path, config.target_encoder_path, config.reference_sketch_path,
+                            config.transformed_train_path, config.transformed_train_target_path,
+                            config.transformed_test_path, config.transformed_test_target_path,
+                            config.transformed_metadata_path]
+            if config.resampling_method == "class_weight":
+                output_paths.append(config.class_weights_path)
+            return output_paths
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get_cache_settings(self) -> dict:
+        """Returns the settings the transformation outputs depend on : every setting of the config
+        but the paths, the cache settings and the ones changing only the speed or memory use."""
+        try:
+            return {name : value for name, value in vars(self.data_transformation_config).items()
+                    if not name.endswith(("_path", "_dir")) and name not in CACHE_IGNORED_SETTINGS}
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def transform_and_save(self, warm_start_plan:dict | None = None) -> None:
+        """Fits the transformer and transforms the train and test data with the selected mode,
+        then saves the outputs listed by 'get_output_paths'. With a warm start plan the
+        champion's transformer is used instead, see 'transform_warm_start'."""
+        try:
+            if warm_start_plan is not None and warm_start_plan["warm_start"]:
+                transformation_pipeline, label_encoder, reference_sketch = self.transform_warm_start(warm_start_plan)
+            elif self.data_transformation_config.out_of_core:
+                transformation_pipeline, label_encoder, reference_sketch = self.transform_out_of_core()
+            elif self.data_transformation_config.float32:
+                transformation_pipeline, label_encoder, reference_sketch = self.transform_float32()
+            else:
+                # read the train and test file
+                feature_store = FeatureStore(self.data_ingestion_artifact.feature_store_file_path)
+                train_df = feature_store.load_split(self.data_ingestion_artifact.train_file_path)
+                test_df = feature_store.load_split(self.data_ingestion_artifact.test_file_path)
+
+                # now separate the data into input features and target features
+                input_feature_train_df = train_df.drop(TARGET_COLUMN, axis=1)
+                input_feature_test_df = test_df.drop(TARGET_COLUMN, axis=1)
+
+                target_feature_train_df = train_df[TARGET_COLUMN]
+                target_feature_test_df = test_df[TARGET_COLUMN]
+
+                # create a label encoder to encode the target feature
+                label_encoder = LabelEncoder()
+                label_encoder.fit(target_feature_train_df)
+
+                # transform the target features
+                target_feature_train_arr = label_encoder.transform(target_feature_train_df)
+                target_feature_test_arr = label_encoder.transform(target_feature_test_df)
+
+
+                logging.info(f"Imputing missing data and removing outliers...")
+
+                # the training set is in memory, so the pipeline is fitted as is
+                transformation_pipeline = DataTransformation.get_data_transformer_object()
+                transformation_pipeline.fit(input_feature_train_df)
+
+                # sketch of the training input features, before resampling
+                reference_sketch = ColumnSketch(list(input_feature_train_df.columns),
+                                                relative_accuracy=self.data_transformation_config.sketch_relative_accuracy)
+                reference_sketch.update(input_feature_train_df)
+
+                # transform the input features, row major as the arrays are memory mapped and read by rows
+                input_feature_train_arr = np.ascontiguousarray(transformation_pipeline.transform(input_feature_train_df))
+                input_feature_test_arr = np.ascontiguousarray(transformation_pipeline.transform(input_feature_test_df))
+
+                # the target column is highly imbalanced; hence we will populate it with minority value
+                resampler = self.get_resampler()
+                if resampler is None:
+                    logging.info(f"Resampling is disabled, resampling method : {self.data_transformation_config.resampling_method}")
+                else:
+                    logging.info(f"Performing resampling...")
+
+                    logging.info(f"Before resampling in training data:\
+                                 Input features:{input_feature_train_arr.shape},Target feature:{target_feature_train_arr.shape}")
+
+                    input_feature_train_arr, target_feature_train_arr = resampler.fit_resample(input_feature_train_arr, target_feature_train_arr)
 
-            # prepare the train and test array 
-            train_arr = np.c_[input_feature_train_arr, target_feature_train_arr]
-            test_arr = np.c_[input_feature_test_arr, target_feature_test_arr]
+                    logging.info(f"After resampling in training data:\
+                                 Input features:{input_feature_train_arr.shape},Target feature:{target_feature_train_arr.shape}")
 
-            # save the arrays
-            utils.save_numpy_array(file_path=self.data_transformation_config.transformed_train_path,
-                                   array=train_arr)
-            utils.save_numpy_array(file_path=self.data_transformation_config.transformed_test_path,
-                                   array=test_arr)
+                    if self.data_transformation_config.resample_test:
+                        logging.info(f"Before resampling in test data:\
+                                     Input features:{input_feature_test_arr.shape},Target feature:{target_feature_test_arr.shape}")
+
+                        input_feature_test_arr, target_feature_test_arr = resampler.fit_resample(input_feature_test_arr, target_feature_test_arr)
+
+                        logging.info(f"After resampling in test data:\
+                                     Input features:{input_feature_test_arr.shape},Target feature:{target_feature_test_arr.shape}")
+                    else:
+                        logging.info(f"The test data is not resampled.")
+
+
+                logging.info(f"Data transformation complete. Saving necessary files...")
+
+                # save the input features and the target as separate arrays
+                utils.save_numpy_array(file_path=self.data_transformation_config.transformed_train_path,
+                                       array=input_feature_train_arr)
+                utils.save_numpy_array(file_path=self.data_transformation_config.transformed_train_target_path,
+                                       array=target_feature_train_arr)
+                utils.save_numpy_array(file_path=self.data_transformation_config.transformed_test_path,
+                                       array=input_feature_test_arr)
+                utils.save_numpy_array(file_path=self.data_transformation_config.transformed_test_target_path,
+                                       array=target_feature_test_arr)
             
             # save the transformation objects
             utils.save_object(file_path=self.data_transformation_config.transformer_object_path,
                               obj=transformation_pipeline)
             utils.save_object(file_path=self.data_transformation_config.target_encoder_path,
                               obj=label_encoder)
-            
+            utils.save_object(file_path=self.data_transformation_config.reference_sketch_path,
+                              obj=reference_sketch)
+
+            # the model is trained on the original rows with the classes weighted by their frequency
+            if self.data_transformation_config.resampling_method == "class_weight":
+                feature_store = FeatureStore(self.data_ingestion_artifact.feature_store_file_path)
+                target_feature_train_df = feature_store.load_split(self.data_ingestion_artifact.train_file_path,
+                                                                   columns=[TARGET_COLUMN])[TARGET_COLUMN]
+                class_weights = self.get_class_weights(label_encoder.transform(target_feature_train_df), label_encoder)
+                logging.info(f"Class weights : {class_weights}")
+                utils.write_yaml_file(file_path=self.data_transformation_config.class_weights_path, data=class_weights)
+
+            self.save_transformed_metadata(transformation_pipeline, label_encoder, warm_start_plan)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def initiate_data_transformation(self) -> DataTransformationArtifact:
+        try:
+
+            logging.info(f"{'>>'*10}Initiating data transformation phase...")
+
+            config = self.data_transformation_config
+            output_paths = self.get_output_paths()
+            settings = self.get_cache_settings()
+
+            # incremental training : warm start the champion on the new rows, or train on all the rows
+            warm_start_plan = None
+            if config.warm_start:
+                warm_start_plan = plan_warm_start(ModelResolver(), FeatureStore(self.data_ingestion_artifact.feature_store_file_path),
+                                                  np.load(self.data_ingestion_artifact.train_file_path),
+                                                  np.load(self.data_ingestion_artifact.test_file_path),
+                                                  full_retrain_every=config.full_retrain_every,
+                                                  full_retrain_drift_share=config.full_retrain_drift_share,
+                                                  drift_pvalue_threshold=config.drift_pvalue_threshold,
+                                                  # SMOTE needs the sample and its neighbours in the minority class
+                                                  min_class_rows=SMOTE_K_NEIGHBORS + 1 if self.get_resampler() is not None else 0,
+                                                  chunk_size=config.chunk_size)
+                settings.update(champion_dir=warm_start_plan["champion_dir"], warm_start_reason=warm_start_plan["reason"])
+
+            cache = None
+            if config.cache_dir is not None:
+                cache = TransformationCache(config.cache_dir, max_entries=config.cache_max_entries,
+                                            max_bytes=config.cache_max_bytes)
+                cache_key = cache.get_key(FeatureStore(self.data_ingestion_artifact.feature_store_file_path),
+                                          [self.data_ingestion_artifact.train_file_path,
+                                           self.data_ingestion_artifact.test_file_path],
+                                          settings)
+
+            if cache is not None and cache.restore(cache_key, output_paths):
+                logging.info(f"Same input data and settings as a cached run, the transformation is skipped.")
+                self.update_restored_metadata()
+            else:
+                self.transform_and_save(warm_start_plan)
+                if cache is not None:
+                    cache.store(cache_key, output_paths)
 
             # now prepare the data transformation artifact
             data_transformation_artifact = DataTransformationArtifact(
                 transformer_object_path=self.data_transformation_config.transformer_object_path,
                 transformed_train_path=self.data_transformation_config.transformed_train_path,
                 transformed_test_path=self.data_transformation_config.transformed_test_path,
-                target_encoder_path=self.data_transformation_config.target_encoder_path
+                target_encoder_path=self.data_transformation_config.target_encoder_path,
+                reference_sketch_path=self.data_transformation_config.reference_sketch_path,
+                transformed_train_target_path=self.data_transformation_config.transformed_train_target_path,
+                transformed_test_target_path=self.data_transformation_config.transformed_test_target_path,
+                transformed_metadata_path=self.data_transformation_config.transformed_metadata_path,
+                class_weights_path=self.data_transformation_config.class_weights_path
+                    if self.data_transformation_config.resampling_method == "class_weight" else None
             )
 
             logging.info(f"{'>>'*10}Data Transformation complete.")
@@ -2,11 +2,15 @@ import os
 import sys
 import pandas as pd
 import numpy as np
-from scipy.stats import ks_2samp
+from sensor.drift import ks_2samp_sort_keys
 from sensor.entity.config_entity import DataValidationConfig
 from sensor.entity.artifact_entity import DataValidationArtifact, DataIngestionArtifact
 from sensor.logger import logging
 from sensor import utils
+from sensor.feature_store import FeatureStore
+from sensor.validation_executor import ValidationExecutor
+from sensor.reference_profile import ReferenceProfile
+from sensor.column_profile import ColumnProfile
 from sensor.exception import SensorException
 
 
@@ -23,32 +27,61 @@ class DataValidation :
             raise SensorException(e, sys)
 
 
-    def drop_missing_values_columns(self, df:pd.DataFrame, report_key_name) -> pd.DataFrame | None:
-        """
-        Drops the columns with the null values greater than the threshold. Returns a pandas.DataFrame object or None if
-        all the columns are dropped.
+    def get_missing_values_columns(self, null_percent:pd.Series, report_key_name) -> list:
+        """Returns the names of the columns with the null values greater than the threshold and adds them to the report.
 
-        df : input dataframe
+        null_percent : fraction of null values of every column
         report_key_name : key for the dict report to be formed; e.g. missing_values_in_test_data
-        returns : pd.DataFrame or None
+        returns : list of column names
         """
         try:
-            threshold = self.data_validation_config.missing_threshold
-
-            logging.info(f"Checking {report_key_name} greater than {threshold}...")
-
-            
-            null_percent = df.isnull().sum() / df.shape[0]
-            drop_columns = null_percent[null_percent>threshold]
+            drop_columns = null_percent[null_percent>self.data_validation_config.missing_threshold]
             drop_column_names = list(drop_columns.index)
             self.validation_error[report_key_name] = drop_column_names
-            df.drop(drop_column_names, axis=1, inplace=True)
+            return drop_column_names
+        except Exception as e:
+            raise SensorException(e, sys)
 
-            logging.info(f"Following columns dropped : {drop_column_names}")
 
-            
-            return df
+    def data_drift_from_column_profile(self, profile:ReferenceProfile, base_columns:list, column_profile:ColumnProfile,
+                                       report_key_name) -> dict:
+        """Checks the data drift of every column with the two-sample KS test, see
+        sensor.drift.ks_2samp_columns, the base data given by its reference profile and the
+        current data by its column profile : the sorted keys of both are merged a block of
+        columns at a time, so no column is sorted again and about 'chunk_size' rows worth of
+        values are in memory at once.
+
+        Args:
+            profile (ReferenceProfile): profile of the base data
+            base_columns (list): columns of the base data kept after dropping the missing values columns
+            column_profile (ColumnProfile): profile of the current data
+            report_key_name : key for the dict report to be formed; e.g. data_drift_in_test_data
 
+        Returns:
+            dict: Returns a dict containing reports for each column
+        """
+        try:
+            logging.info(f"Checking data drift for : {report_key_name}...")
+            key_columns = [column for column in base_columns
+                           if column in profile.key_columns and column in column_profile.key_columns]
+            block_size = max(1, self.data_validation_config.chunk_size * len(base_columns) // max(1, column_profile.n_rows))
+
+            pvalues = dict()
+            for start in range(0, len(key_columns), block_size):
+                block_columns = key_columns[start:start + block_size]
+                _, block_pvalues = ks_2samp_sort_keys(profile.get_sort_keys(block_columns),
+                                                      column_profile.get_sort_keys(block_columns), presorted=True)
+                pvalues.update(zip(block_columns, block_pvalues))
+
+            # the few other columns, e.g. the target, are read from the feature store
+            other_columns = [column for column in base_columns if column not in pvalues]
+            if len(other_columns) > 0:
+                current_df = column_profile.feature_store.load_split(column_profile.index_path, columns=other_columns)
+                pvalues.update(profile.drift_pvalues(current_df, other_columns))
+
+            drift_report = self.get_drift_report(pvalues, base_columns)
+            self.validation_error[report_key_name] = drift_report
+            return drift_report
         except Exception as e:
             raise SensorException(e, sys)
 
@@ -89,54 +122,102 @@ class DataValidation :
             raise SensorException(e, sys)
 
 
-    def data_drift(self, base_df:pd.DataFrame, current_df:pd.DataFrame,report_key_name) -> dict :
-        """Checks the data drift for each column data.
-
-        Args:
-            base_df (pd.DataFrame): Original Dataframe
-            current_df (pd.DataFrame): Current dataframe
-            report_key_name : key for the dict report to be formed; e.g. missing_values_in_test_data
-        
-
-        Returns:
-            dict: Returns a dict containing reports for each column
-        """
-
+    def get_drift_report(self, pvalues:dict, columns) -> dict:
+        """Builds the drift report of 'columns' from the ks_2samp p-value of every column."""
         try:
-
-            logging.info(f"Checking data drift for : {report_key_name}...")
-
-            # np.Nan values are causing some unexpected behavior in ks2_samp
-            # hence change the np.Nan to "na"
-            base_df.replace({np.nan: "na"}, inplace=True)
-            current_df.replace({np.nan: "na"}, inplace=True)
-
-
             drift_report = dict()
-            base_columns = base_df.columns
-
-            for base_col in base_columns:
-                base_data , current_data = base_df[base_col], current_df[base_col]
+            for column in columns:
+                # if the pvalue is > 0.05, --> accept the null hypothesis
+                drift_report[column] = {
+                    "pvalues" : float(pvalues[column]),
+                    "same_distribution" : bool(pvalues[column] > 0.05)
+                }
+            return drift_report
+        except Exception as e:
+            raise SensorException(e, sys)
 
-                # null hypothesis : both data samples are having the same distribution
-                
-                same_distribution = ks_2samp(base_data, current_data)
 
+    def validate_in_parallel(self, profile:ReferenceProfile, base_columns:list, feature_store:FeatureStore) -> None:
+        """Runs the same checks as the serial validation, with the same report, on a pool of
+        'n_jobs' processes : the missing values of the train and test data are counted at the
+        same time, then the train and test drift tests run together, each split in blocks of
+        columns. In the out of core mode the workers read the train and test rows from the
+        feature store themselves instead of getting them through shared memory."""
+        try:
+            config = self.data_validation_config
+            logging.info(f"Running the validation checks on {config.n_jobs} processes...")
+            index_paths = {"train" : self.data_ingestion_artifact.train_file_path,
+                           "test" : self.data_ingestion_artifact.test_file_path}
+
+            with ValidationExecutor(n_jobs=config.n_jobs, chunk_size=config.chunk_size) as executor:
+                executor.add_reference_profile("base", profile)
+                for key, index_path in index_paths.items():
+                    if config.out_of_core:
+                        executor.add_feature_store_split(key, feature_store, index_path)
+                    else:
+                        executor.add_dataframe(key, feature_store.load_split(index_path))
+
+                null_percent = executor.null_percent(["train", "test"])
+                kept_columns = dict()
+                for key in ["train", "test"]:
+                    drop_column_names = self.get_missing_values_columns(null_percent[key],
+                                                                        f"missing_values_in_{key}_data")
+                    logging.info(f"Following columns dropped from the {key} data : {drop_column_names}")
+                    kept_columns[key] = [column for column in null_percent[key].index
+                                         if column not in drop_column_names]
+
+                drift_keys = [key for key in ["train", "test"]
+                              if self.is_required_columns_exist(pd.DataFrame(columns=base_columns),
+                                                                pd.DataFrame(columns=kept_columns[key]),
+                                                                report_key_name=f"missing_columns_in_{key}_data")]
+
+                logging.info(f"Checking data drift for : {drift_keys}...")
+                pvalues = executor.drift_pvalues("base", drift_keys, base_columns)
+                for key in drift_keys:
+                    # the few columns which are not float32, e.g. the target, are tested here
+                    other_columns = [column for column in base_columns if column not in pvalues[key]]
+                    if len(other_columns) > 0:
+                        pvalues[key].update(profile.drift_pvalues(executor.load(key, other_columns), other_columns))
+                    self.validation_error[f"data_drift_in_{key}_data"] = self.get_drift_report(pvalues[key], base_columns)
+        except Exception as e:
+            raise SensorException(e, sys)
 
-                # if the pvalue is > 0.05, --> accept the null hypothesis
-                if same_distribution.pvalue > 0.05:
-                    drift_report[base_col] = {
-                        "pvalues" : float(same_distribution.pvalue),
-                        "same_distribution" : True
-                    }
-                else:
-                    drift_report[base_col] = {
-                        "pvalues" : float(same_distribution.pvalue),
-                        "same_distribution" : False
-                    }
-            
-            self.validation_error[report_key_name] = drift_report
 
+    def validate_with_sketches(self, profile:ReferenceProfile, base_columns:list, feature_store:FeatureStore) -> None:
+        """Checks the missing values and the data drift of the train and test data from sketches
+        built in a single pass over chunks of 'chunk_size' rows, so memory does not depend on the
+        number of rows. With 'n_jobs' > 1 every worker sketches a range of rows and the sketches
+        are merged. The drift report of a column also holds the approximate KS statistic, its
+        error bound and the PSI, see sensor.sketch.ColumnSketch."""
+        try:
+            config = self.data_validation_config
+            index_paths = {"train" : self.data_ingestion_artifact.train_file_path,
+                           "test" : self.data_ingestion_artifact.test_file_path}
+
+            with ValidationExecutor(n_jobs=config.n_jobs, chunk_size=config.chunk_size) as executor:
+                for key, index_path in index_paths.items():
+                    executor.add_feature_store_split(key, feature_store, index_path)
+                sketches = executor.sketch(list(index_paths), relative_accuracy=config.sketch_relative_accuracy)
+            base_sketch = profile.get_sketch(relative_accuracy=config.sketch_relative_accuracy)
+
+            for key in index_paths:
+                null_percent = sketches[key].get_null_percent()
+                drop_column_names = self.get_missing_values_columns(null_percent, f"missing_values_in_{key}_data")
+                kept_columns = [column for column in null_percent.index if column not in drop_column_names]
+
+                if self.is_required_columns_exist(pd.DataFrame(columns=base_columns), pd.DataFrame(columns=kept_columns),
+                                                  report_key_name=f"missing_columns_in_{key}_data"):
+                    logging.info(f"Checking data drift for : data_drift_in_{key}_data...")
+                    comparison = base_sketch.compare(sketches[key], base_columns)
+                    drift_report = self.get_drift_report({column : comparison[column]["pvalue"]
+                                                          for column in base_columns}, base_columns)
+                    for column in base_columns:
+                        drift_report[column].update({
+                            "ks_statistic" : comparison[column]["ks_statistic"],
+                            "ks_statistic_error" : comparison[column]["ks_statistic_error"],
+                            "psi" : comparison[column]["psi"],
+                        })
+                    self.validation_error[f"data_drift_in_{key}_data"] = drift_report
         except Exception as e:
             raise SensorException(e, sys)
 
@@ -146,26 +227,42 @@ class DataValidation :
 
             logging.info(f"{'>>'*10}Initiating data validation phase...")
 
-            # get the required dataframes
-            base_df = pd.read_csv(self.data_validation_config.base_file_path)
-            train_df = pd.read_csv(self.data_ingestion_artifact.train_file_path, low_memory=False)
-            test_df = pd.read_csv(self.data_ingestion_artifact.test_file_path)
-
-            # dataframes contain null values as "na", --> convert them to np.nan
-            base_df.replace("na", np.nan, inplace=True)
-            train_df.replace("na", np.nan, inplace=True)
-            test_df.replace("na", np.nan, inplace=True)
-
-            # drop the missing values columns 
-            base_df = self.drop_missing_values_columns(base_df, report_key_name="missing_values_in_base_data")
-            train_df = self.drop_missing_values_columns(train_df, report_key_name="missing_values_in_train_data")
-            test_df = self.drop_missing_values_columns(test_df, report_key_name="missing_values_in_test_data")
-
-            # check if the required columns are there; if yes, proceed to check data drift
-            if self.is_required_columns_exist(base_df, train_df, report_key_name="missing_columns_in_train_data"):
-                self.data_drift(base_df=base_df, current_df=train_df, report_key_name="data_drift_in_train_data")
-            if self.is_required_columns_exist(base_df, test_df, report_key_name="missing_columns_in_test_data"):
-                self.data_drift(base_df=base_df, current_df=test_df, report_key_name="data_drift_in_test_data")
+            # the base file is only read again when its content changes
+            profile = ReferenceProfile(self.data_validation_config.base_file_path,
+                                       self.data_validation_config.reference_profile_dir)
+            profile.load()
+            feature_store = FeatureStore(self.data_ingestion_artifact.feature_store_file_path)
+
+            # drop the missing values columns of the base data
+            logging.info(f"Checking missing_values_in_base_data greater than {self.data_validation_config.missing_threshold}...")
+            drop_column_names = self.get_missing_values_columns(profile.null_percent, "missing_values_in_base_data")
+            base_columns = [column for column in profile.columns if column not in drop_column_names]
+            logging.info(f"Following columns dropped : {drop_column_names}")
+            base_df = pd.DataFrame(columns=base_columns)
+
+            if self.data_validation_config.drift_method == "sketch":
+                self.validate_with_sketches(profile, base_columns, feature_store)
+            elif self.data_validation_config.n_jobs > 1:
+                self.validate_in_parallel(profile, base_columns, feature_store)
+            else:
+                # every split is profiled in a single pass over its columns; the data transformation
+                # reuses the saved profile of the train set
+                index_paths = {"train" : self.data_ingestion_artifact.train_file_path,
+                               "test" : self.data_ingestion_artifact.test_file_path}
+                for key, index_path in index_paths.items():
+                    column_profile = ColumnProfile(feature_store, index_path,
+                                                   chunk_size=self.data_validation_config.chunk_size).load()
+                    logging.info(f"Checking missing_values_in_{key}_data greater than {self.data_validation_config.missing_threshold}...")
+                    drop_column_names = self.get_missing_values_columns(column_profile.get_null_percent(),
+                                                                        f"missing_values_in_{key}_data")
+                    logging.info(f"Following columns dropped : {drop_column_names}")
+                    kept_columns = [column for column in column_profile.columns if column not in drop_column_names]
+
+                    # check if the required columns are there; if yes, proceed to check data drift
+                    if self.is_required_columns_exist(base_df, pd.DataFrame(columns=kept_columns),
+                                                      report_key_name=f"missing_columns_in_{key}_data"):
+                        self.data_drift_from_column_profile(profile, base_columns, column_profile,
+                                                            report_key_name=f"data_drift_in_{key}_data")
 
             # write the report to a yaml file
             utils.write_yaml_file(file_path=self.data_validation_config.report_file_path,
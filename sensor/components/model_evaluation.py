@@ -7,8 +7,9 @@ from sensor.entity import config_entity
 from sensor.entity import artifact_entity
 from sensor.logger import logging
 from sensor import utils
+from sensor.feature_store import FeatureStore
 from sensor.config import TARGET_COLUMN
-from sensor.predictor import ModelResolver
+from sensor.predictor import ModelResolver, get_transform_function
 from sensor.exception import SensorException
 
 
@@ -63,24 +64,7 @@ class ModelEvaluation:
             prev_model = utils.load_object(file_path=prev_model_path)
             prev_target_encoder = utils.load_object(file_path=prev_target_encoder_path)
 
-            # load the test file
-            logging.info(f"Loading the test file details...")
-            test_df = pd.read_csv(self.data_ingestion_artifact.test_file_path)
-            test_df.replace({"na":np.nan}, inplace=True)
-            
-            target_column = test_df[TARGET_COLUMN]
-            input_features = test_df.drop(TARGET_COLUMN, axis=1)
-
-            logging.info(f"Calculating previous model's accuracy...")
-            input_arr = prev_transformer.transform(input_features)
-            y_pred = prev_model.predict(input_arr)
-            y_true = prev_target_encoder.transform(target_column)
-
-            # calculate the accuracy of the prev model
-            prev_accuracy = f1_score(y_true=y_true, y_pred=y_pred)
-
-
-            logging.info(f"Loading the current models details and calculating its accuracy...")
+            logging.info(f"Loading the current models details...")
             # now load the current model details
             current_transformer_path = self.data_transformation_artifact.transformer_object_path
             current_model_path = self.model_training_artifact.model_path
@@ -90,18 +74,67 @@ class ModelEvaluation:
             current_model = utils.load_object(file_path=current_model_path)
             current_target_encoder = utils.load_object(file_path=current_target_encoder_path)
 
-            input_arr = current_transformer.transform(input_features)
-            y_pred = current_model.predict(input_arr)
-            y_true = current_target_encoder.transform(target_column)
+            # the current model is scored on the saved transformed test arrays, memory mapped, when
+            # they hold the original test rows; the raw test rows are transformed otherwise
+            metadata = utils.read_yaml_file(self.data_transformation_artifact.transformed_metadata_path)
+            use_transformed_test = not metadata["test_resampled"]
 
-            # calculate the accuracy of the current model
-            current_accuracy = f1_score(y_true=y_true, y_pred=y_pred)
+            # load the test file; only the columns used by the models are read
+            logging.info(f"Loading the test file details...")
+            prev_columns = list(prev_transformer.feature_names_in_)
+            current_columns = list(current_transformer.feature_names_in_)
+            columns = list(dict.fromkeys(prev_columns + ([] if use_transformed_test else current_columns) + [TARGET_COLUMN]))
+            feature_store = FeatureStore(self.data_ingestion_artifact.feature_store_file_path)
+            test_rows = np.load(self.data_ingestion_artifact.test_file_path)
+
+            # in the out of core mode the test set is scored chunk by chunk
+            chunk_size = self.model_eval_config.chunk_size if self.model_eval_config.out_of_core \
+                         else max(1, test_rows.shape[0])
+
+            logging.info(f"Calculating previous and current model's accuracy...")
+            prev_y_true, prev_y_pred, current_y_true, current_y_pred = [], [], [], []
+            prev_transform, current_transform = None, None
+            for test_df in feature_store.iter_chunks(chunk_size, columns=columns, rows=test_rows):
+                target_column = test_df[TARGET_COLUMN]
+
+                # the pipelines run as fused kernels, checked once per evaluation on the first chunk
+                if prev_transform is None:
+                    prev_transform = get_transform_function(prev_transformer, check_df=test_df)
+                    if not use_transformed_test:
+                        current_transform = get_transform_function(current_transformer, check_df=test_df)
+
+                input_arr = prev_transform(test_df[prev_columns])
+                prev_y_pred.append(prev_model.predict(input_arr))
+                prev_y_true.append(prev_target_encoder.transform(target_column))
+
+                if not use_transformed_test:
+                    input_arr = current_transform(test_df[current_columns])
+                    current_y_pred.append(current_model.predict(input_arr))
+                    current_y_true.append(current_target_encoder.transform(target_column))
+
+            if use_transformed_test:
+                mmap_mode = self.model_eval_config.mmap_mode
+                x_test = utils.load_numpy_array(file_path=self.data_transformation_artifact.transformed_test_path,
+                                                mmap_mode=mmap_mode)
+                current_y_true.append(utils.load_numpy_array(
+                    file_path=self.data_transformation_artifact.transformed_test_target_path, mmap_mode=mmap_mode))
+                for start in range(0, x_test.shape[0], chunk_size):
+                    current_y_pred.append(current_model.predict(x_test[start:start + chunk_size]))
+
+            # calculate the accuracy of the prev and current model
+            prev_accuracy = f1_score(y_true=np.concatenate(prev_y_true), y_pred=np.concatenate(prev_y_pred))
+            current_accuracy = f1_score(y_true=np.concatenate(current_y_true), y_pred=np.concatenate(current_y_pred))
 
             logging.info(f"Previous model accuracy:{prev_accuracy} | \
                          Current model accuracy : {current_accuracy}")
 
-            # if the current model has lower accuracy, stop the pipeline
-            if current_accuracy < prev_accuracy:
+            # if the current model has lower accuracy, stop the pipeline; with cross-validation a
+            # drop within the spread of the fold scores is taken as noise
+            tolerance = 0
+            if self.model_training_artifact.cv_f1_variance is not None:
+                tolerance = self.model_eval_config.cv_std_tolerance * np.sqrt(self.model_training_artifact.cv_f1_variance)
+                logging.info(f"Cross-validated model : accepted down to {prev_accuracy - tolerance}")
+            if current_accuracy < prev_accuracy - tolerance:
                 logging.info(f"Current model accuracy lower than the previous.Raising the exception...")
                 raise Exception(f"Current model accuracy lower than the previous.")
             
@@ -39,11 +39,13 @@ class ModelPusher:
             model_transformer_path = self.data_transformation_artifact.transformer_object_path
             model_path = self.model_trainer_artifact.model_path
             target_encoder_path = self.data_transformation_artifact.target_encoder_path
+            reference_sketch_path = self.data_transformation_artifact.reference_sketch_path
 
             # load the objects
             model_transformer = utils.load_object(file_path=model_transformer_path)
             model = utils.load_object(file_path=model_path)
             target_encoder = utils.load_object(file_path=target_encoder_path)
+            reference_sketch = utils.load_object(file_path=reference_sketch_path)
 
             
             # save the model details to the model pusher artifacts dir
@@ -55,6 +57,8 @@ class ModelPusher:
                               obj=model)
             utils.save_object(file_path=self.model_pusher_config.pusher_target_encoder_path,
                               obj=target_encoder)
+            utils.save_object(file_path=self.model_pusher_config.pusher_reference_sketch_path,
+                              obj=reference_sketch)
             
             # save the details to models to be synced dir
             logging.info(f"Saving the model details to dir to be synced outside...")
@@ -62,6 +66,7 @@ class ModelPusher:
             trans_path_sync = self.model_resolver.get_latest_save_transformer_path()
             model_path_sync = self.model_resolver.get_latest_save_model_path()
             target_encoder_path_sync = self.model_resolver.get_latest_save_target_encoder_path()
+            reference_sketch_path_sync = self.model_resolver.get_latest_save_reference_sketch_path()
 
 
             utils.save_object(file_path=trans_path_sync,
@@ -70,6 +75,8 @@ class ModelPusher:
                               obj=model)
             utils.save_object(file_path=target_encoder_path_sync,
                               obj=target_encoder)
+            utils.save_object(file_path=reference_sketch_path_sync,
+                              obj=reference_sketch)
             
 
             model_pusher_artifact = artifact_entity.ModelPusherArtifact(
@@ -1,5 +1,6 @@
 import os
 import sys
+import time
 import pandas as pd
 import numpy as np
 from xgboost import XGBClassifier
@@ -8,6 +9,11 @@ from sensor.entity.config_entity import ModelTrainingConfig
 from sensor.entity.artifact_entity import DataTransformationArtifact, ModelTrainingArtifact
 from sensor.logger import logging
 from sensor import utils
+from sensor.predictor import ModelResolver
+from sensor.cross_validation import CrossValidation
+from sensor.tuning import DEFAULT_PARAMS, HyperparameterSearch, get_fit_params
+from sensor.xgboost_engine import train_classifier
+from sensor.warm_start import set_lineage
 from sensor.exception import SensorException
 
 
@@ -24,12 +30,109 @@ class ModelTrainer :
             raise SensorException(e, sys)
     
 
-    def train_model(self, x,y):
-        xgb = XGBClassifier()
-        xgb.fit(x,y)
+    def train_model(self, x,y, class_weights:dict | None = None, params:dict | None = None, xgb_model=None):
+        """Fits an XGBClassifier with 'params', its defaults if None. With 'class_weights', see
+        DataTransformation.get_class_weights, a binary target is weighted by 'scale_pos_weight'
+        and any other by per sample weights. With 'xgb_model', a fitted booster, the new trees
+        are added to its own."""
+        config = self.model_training_config
+        weight_params, sample_weight = get_fit_params(y, class_weights)
+        params = {"tree_method" : config.tree_method, "n_jobs" : config.n_threads, **weight_params, **(params or dict())}
+        if config.training_engine in ["native", "external_memory"]:
+            return train_classifier(x, y, params, sample_weight=sample_weight,
+                                    external_memory=config.training_engine == "external_memory",
+                                    chunk_size=config.chunk_size, cache_dir=config.external_memory_dir,
+                                    xgb_model=xgb_model)
+        if config.training_engine != "sklearn":
+            raise Exception(f"Unknown training engine : {config.training_engine}")
+        xgb = XGBClassifier(**params)
+        xgb.fit(x,y, sample_weight=sample_weight, xgb_model=xgb_model)
         return xgb
 
 
+    def warm_start_model(self, x:np.ndarray, y:np.ndarray, class_weights:dict | None = None) -> XGBClassifier:
+        """Continues the boosting of the registry champion on the new training rows, see
+        sensor.warm_start.plan_warm_start : at most 'warm_start_max_trees' trees are added, with
+        the champion's parameters."""
+        try:
+            champion = utils.load_object(file_path=ModelResolver().get_latest_model_path())
+            champion_params = champion.get_params()
+            params = {name : champion_params[name] for name in DEFAULT_PARAMS if champion_params.get(name) is not None}
+            params["n_estimators"] = self.model_training_config.warm_start_max_trees
+            logging.info(f"Adding {params['n_estimators']} trees to the champion's "
+                         f"{champion.get_booster().num_boosted_rounds()} on {x.shape[0]} new rows : {params}")
+            return self.train_model(x, y, class_weights=class_weights, params=params, xgb_model=champion.get_booster())
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def predict(self, model:XGBClassifier, x:np.ndarray) -> np.ndarray:
+        """Predicts 'chunk_size' rows at a time, so memory mapped arrays are never read whole."""
+        chunk_size = self.model_training_config.chunk_size
+        return np.concatenate([model.predict(x[start:start + chunk_size])
+                               for start in range(0, x.shape[0], chunk_size)] or [np.empty(0, dtype=np.int64)])
+
+
+    @staticmethod
+    def check_original_rows(metadata:dict, mode:str) -> None:
+        """Raises when 'mode' would score models on rows of the training arrays and these were
+        resampled : SMOTE adds synthetic rows near the real ones of the minority class, so
+        scores on them are optimistic."""
+        if metadata.get("train_resampled", True):
+            raise Exception(f"The {mode} mode scores models on training rows, which SMOTE resampling "
+                            f"fills with synthetic ones : set resampling_method to \"class_weight\" or \"none\".")
+
+
+    def tune_model(self, class_weights:dict | None = None) -> tuple:
+        """Searches the XGBClassifier parameters on the memory mapped training arrays, see
+        sensor.tuning.HyperparameterSearch, saves the trial log and refits the best candidate on
+        all the training rows with as many boosting rounds as it had at its best validation loss.
+
+        Returns:
+            tuple: (fitted model, best trial, trial log)
+        """
+        try:
+            config = self.model_training_config
+            search = HyperparameterSearch(n_trials=config.tuning_n_trials, n_jobs=config.tuning_n_jobs,
+                                          time_budget=config.tuning_time_budget,
+                                          validation_size=config.tuning_validation_size,
+                                          max_estimators=config.tuning_max_estimators,
+                                          early_stopping_rounds=config.tuning_early_stopping_rounds,
+                                          chunk_size=config.chunk_size)
+            best_result, results = search.search(self.data_transformation_artifact.transformed_train_path,
+                                                 self.data_transformation_artifact.transformed_train_target_path,
+                                                 work_dir=os.path.dirname(config.tuning_log_path),
+                                                 class_weights=class_weights)
+            utils.write_yaml_file(file_path=config.tuning_log_path,
+                                  data={"best_trial" : best_result["number"], "trials" : results})
+
+            x_train = utils.load_numpy_array(file_path=self.data_transformation_artifact.transformed_train_path,
+                                             mmap_mode=config.mmap_mode)
+            y_train = utils.load_numpy_array(file_path=self.data_transformation_artifact.transformed_train_target_path,
+                                             mmap_mode=config.mmap_mode)
+            params = dict(best_result["params"], n_estimators=best_result["best_iteration"] + 1)
+            logging.info(f"Refitting the best candidate on all the training rows : {params}")
+            return self.train_model(x_train, y_train, class_weights=class_weights, params=params), best_result, results
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def cross_validate(self, model:XGBClassifier, class_weights:dict | None = None) -> dict:
+        """Cross-validates the parameters of the fitted 'model' on the memory mapped training
+        arrays, see sensor.cross_validation.CrossValidation."""
+        try:
+            config = self.model_training_config
+            params = {name : value for name, value in model.get_params().items()
+                      if value is not None and name not in ["callbacks", "early_stopping_rounds", "eval_metric"]}
+            cross_validation = CrossValidation(n_folds=config.cv_n_folds, n_jobs=config.cv_n_jobs,
+                                               chunk_size=config.chunk_size)
+            return cross_validation.evaluate(self.data_transformation_artifact.transformed_train_path,
+                                             self.data_transformation_artifact.transformed_train_target_path,
+                                             params=params, work_dir=config.cv_dir, class_weights=class_weights)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
     def initiate_model_training(self) -> ModelTrainingArtifact:
         try:
             
@@ -37,23 +140,58 @@ class ModelTrainer :
 
             logging.info(f"Loading and preparing the data...")
 
-            # load the data
-            train_arr = utils.load_numpy_array(file_path=self.data_transformation_artifact.transformed_train_path)
-            test_arr = utils.load_numpy_array(file_path=self.data_transformation_artifact.transformed_test_path)
-
-            # split the data to input features and target
-            x_train, y_train = train_arr[:,:-1], train_arr[:, -1]
-            x_test, y_test = test_arr[:,:-1], test_arr[:, -1]
+            # load the input features and the target, memory mapped by default
+            mmap_mode = self.model_training_config.mmap_mode
+            x_train = utils.load_numpy_array(file_path=self.data_transformation_artifact.transformed_train_path,
+                                             mmap_mode=mmap_mode)
+            y_train = utils.load_numpy_array(file_path=self.data_transformation_artifact.transformed_train_target_path,
+                                             mmap_mode=mmap_mode)
+            x_test = utils.load_numpy_array(file_path=self.data_transformation_artifact.transformed_test_path,
+                                            mmap_mode=mmap_mode)
+            y_test = utils.load_numpy_array(file_path=self.data_transformation_artifact.transformed_test_target_path,
+                                            mmap_mode=mmap_mode)
 
             # train the model
 
             logging.info("Training the model...")
 
-            model = self.train_model(x_train, y_train)
+            class_weights = None
+            if self.data_transformation_artifact.class_weights_path is not None:
+                class_weights = utils.read_yaml_file(self.data_transformation_artifact.class_weights_path)
+                logging.info(f"Weighting the classes : {class_weights}")
+
+            metadata = utils.read_yaml_file(self.data_transformation_artifact.transformed_metadata_path)
+            warm_start = metadata["warm_start"]
+            if self.model_training_config.cross_validation and not (warm_start is not None and warm_start["warm_start"]):
+                self.check_original_rows(metadata, mode="cross-validation")
+
+            start_time = time.perf_counter()
+            tuning = None
+            if warm_start is not None and warm_start["warm_start"]:
+                model = self.warm_start_model(x_train, y_train, class_weights=class_weights)
+            elif self.model_training_config.tuning:
+                self.check_original_rows(metadata, mode="tuning")
+                logging.info("Tuning the model parameters...")
+                model, best_result, results = self.tune_model(class_weights=class_weights)
+                tuning = {"n_trials" : len(results),
+                          "statuses" : {status : sum(result["status"] == status for result in results)
+                                        for status in sorted(set(result["status"] for result in results))},
+                          "best_trial" : best_result["number"], "best_params" : best_result["params"],
+                          "best_validation_f1" : best_result["validation_f1"],
+                          "trial_log_path" : self.model_training_config.tuning_log_path}
+            else:
+                model = self.train_model(x_train, y_train, class_weights=class_weights)
+            fit_seconds = time.perf_counter() - start_time
+
+            # the rows of the feature store the model has seen, for the next warm start
+            set_lineage(model, feature_store_dir=metadata["feature_store_dir"],
+                        n_feature_store_rows=metadata["n_feature_store_rows"],
+                        test_rows_digest=metadata["test_rows_digest"],
+                        n_warm_starts=warm_start["n_warm_starts"] + 1 if warm_start is not None and warm_start["warm_start"] else 0)
 
             # get the model predictions
-            yhat_train = model.predict(x_train)
-            yhat_test = model.predict(x_test)
+            yhat_train = self.predict(model, x_train)
+            yhat_test = self.predict(model, x_test)
 
             # calculate the losses
             f1_score_train = f1_score(y_true=y_train, y_pred=yhat_train)
@@ -62,13 +200,39 @@ class ModelTrainer :
             logging.info(f"Model scores : f1_score for training:{f1_score_train} \
                          | f1_score_test : {f1_score_test}")
 
+            # the folds would hold the champion's rows too, so a warm start is not cross-validated
+            cross_validation = None
+            if self.model_training_config.cross_validation:
+                if warm_start is not None and warm_start["warm_start"]:
+                    logging.info("Warm start : the model is not cross-validated.")
+                else:
+                    cross_validation = self.cross_validate(model, class_weights=class_weights)
+
+            # written before the checks, so that rejected models are reported too
+            utils.write_yaml_file(file_path=self.model_training_config.report_file_path, data={
+                "n_train_rows" : int(x_train.shape[0]),
+                "n_test_rows" : int(x_test.shape[0]),
+                "train_class_counts" : {int(c) : int(n) for c, n in zip(*np.unique(y_train, return_counts=True))},
+                "class_weights" : class_weights,
+                "fit_seconds" : float(fit_seconds),
+                "tuning" : tuning,
+                "warm_start" : warm_start,
+                "f1_train_score" : float(f1_score_train),
+                "f1_test_score" : float(f1_score_test),
+                "cross_validation" : cross_validation,
+            })
+
+            # with cross-validation the checks use the mean scores of the folds
+            accuracy, diff = f1_score_test, abs(f1_score_test-f1_score_train)
+            if cross_validation is not None:
+                accuracy, diff = cross_validation["f1_mean"], cross_validation["overfitting_mean"]
+
             # check for underfitting 
-            if f1_score_test < self.model_training_config.expected_accuracy:
+            if accuracy < self.model_training_config.expected_accuracy:
                 raise Exception(f"Low model accuracy. Expected accuracy:{self.model_training_config.expected_accuracy} \
-                                Current accuracy: {f1_score_test}")
+                                Current accuracy: {accuracy}")
             
             # check for overfitting
-            diff = abs(f1_score_test-f1_score_train)
             if diff>self.model_training_config.overfitting_threshold:
                 raise Exception(f"Train and test accuracies found greater than the expected threshold. |\
                                 Expected overfitting threshold : {self.model_training_config.overfitting_threshold} | \
@@ -85,7 +249,9 @@ class ModelTrainer :
             model_training_artifact = ModelTrainingArtifact(
                 model_path=self.model_training_config.model_path,
                 f1_train_score=f1_score_train,
-                f1_test_score=f1_score_test
+                f1_test_score=f1_score_test,
+                cv_f1_mean=None if cross_validation is None else cross_validation["f1_mean"],
+                cv_f1_variance=None if cross_validation is None else cross_validation["f1_variance"]
             )
 
             logging.info(f"{'>>'*10}Model training complete.")
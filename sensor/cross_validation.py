@@ -0,0 +1,136 @@
+import os
+import sys
+import time
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.metrics import f1_score
+from sensor.logger import logging
+from sensor.tuning import get_fit_params
+from sensor.xgboost_engine import predict_labels, train_classifier
+from sensor.exception import SensorException
+
+
+def _run_fold(fold:dict) -> dict:
+    """Fits the model on the rows of the other folds and scores it on the rows of this one. The
+    arrays are memory mapped, so every worker reads the same pages of the page cache, and the
+    rows of the folds are read 'chunk_size' at a time, so no worker holds a float copy of them."""
+    try:
+        start_time = time.perf_counter()
+        x = np.load(fold["x_path"], mmap_mode="r")
+        y = np.load(fold["y_path"], mmap_mode="r")
+        chunk_size = fold["chunk_size"]
+        validation_rows = np.load(fold["validation_index_path"])
+        fit_rows = np.setdiff1d(np.arange(y.shape[0]), validation_rows)
+
+        weight_params, sample_weight = get_fit_params(y, fold["class_weights"])
+        model = train_classifier(x, y, dict(fold["params"], **weight_params, n_jobs=fold["n_threads"]),
+                                 sample_weight=sample_weight, chunk_size=chunk_size, rows=fit_rows)
+
+        booster = model.get_booster()
+        f1_fit = f1_score(y_true=y[fit_rows], y_pred=predict_labels(booster, x, rows=fit_rows, chunk_size=chunk_size))
+        f1_validation = f1_score(y_true=y[validation_rows],
+                                 y_pred=predict_labels(booster, x, rows=validation_rows, chunk_size=chunk_size))
+        return {"fold" : fold["fold"], "n_fit_rows" : int(fit_rows.shape[0]),
+                "n_validation_rows" : int(validation_rows.shape[0]),
+                "f1_train_score" : float(f1_fit), "f1_validation_score" : float(f1_validation),
+                "seconds" : time.perf_counter() - start_time}
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+class CrossValidation:
+    """Stratified k-fold cross-validation of an XGBClassifier on the memory mapped training arrays.
+
+    The folds run on a pool of 'n_jobs' processes, with the cores split evenly between them, so
+    with as many free cores as folds the whole cross-validation takes about the time of one fit.
+    As in sensor.tuning.HyperparameterSearch, the workers are forked from a forkserver, open
+    the .npy files memory mapped and train with the native API from chunks of the fold rows;
+    only the fold index files and the scores go through the pool. With 1 job the folds run in
+    this process.
+
+    The folds are cut from the training arrays as saved, so they must be real rows : after
+    SMOTE resampling they would hold synthetic ones, which makes the fold scores optimistic,
+    and ModelTrainer only cross-validates with the "class_weight" and "none" resampling methods.
+    """
+
+    def __init__(self, n_folds:int = 5, n_jobs:int = 5, chunk_size:int = 50000, random_state:int = 42):
+        """
+        n_folds : number of folds, at least 2
+        n_jobs : number of worker processes
+        chunk_size : rows read at a time from the memory mapped arrays
+        random_state : seed of the folds
+        """
+        self.n_folds = n_folds
+        self.n_jobs = n_jobs
+        self.chunk_size = chunk_size
+        self.random_state = random_state
+
+
+    def split(self, y:np.ndarray) -> list:
+        """Returns the sorted validation rows of every fold, every class spread evenly over the folds."""
+        try:
+            if self.n_folds < 2:
+                raise Exception(f"Cross-validation needs at least 2 folds, got {self.n_folds}.")
+            rng = np.random.default_rng(self.random_state)
+            folds = [[] for _ in range(self.n_folds)]
+            for label in np.unique(y):
+                rows = rng.permutation(np.flatnonzero(y == label))
+                for number, fold_rows in enumerate(np.array_split(rows, self.n_folds)):
+                    folds[number].append(fold_rows)
+            return [np.sort(np.concatenate(fold_rows)) for fold_rows in folds]
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def evaluate(self, x_path:str, y_path:str, params:dict, work_dir:str, class_weights:dict | None = None) -> dict:
+        """Cross-validates XGBClassifier(**params) on the arrays saved at 'x_path' and 'y_path'.
+
+        Args:
+            x_path (str): .npy file of the training features
+            y_path (str): .npy file of the encoded training target
+            params (dict): XGBClassifier parameters; 'n_jobs' is set per worker
+            work_dir (str): directory of the fold index files
+            class_weights (dict, optional): class weights, see DataTransformation.get_class_weights
+
+        Returns:
+            dict: "n_folds", "folds" (scores of every fold), "f1_mean" and "f1_variance" of the
+                validation F1, "f1_train_mean" and "overfitting_mean" (mean gap between the train
+                and validation F1 of the folds), "seconds"
+        """
+        try:
+            start_time = time.perf_counter()
+            os.makedirs(work_dir, exist_ok=True)
+            n_jobs = max(1, min(self.n_jobs, self.n_folds))
+            n_threads = max(1, (os.cpu_count() or 1) // n_jobs)
+
+            folds = []
+            for number, validation_rows in enumerate(self.split(np.load(y_path, mmap_mode="r"))):
+                validation_index_path = os.path.join(work_dir, f"fold_{number}.npy")
+                np.save(validation_index_path, validation_rows)
+                folds.append({"fold" : number, "x_path" : x_path, "y_path" : y_path,
+                              "validation_index_path" : validation_index_path, "params" : params,
+                              "class_weights" : class_weights, "n_threads" : n_threads,
+                              "chunk_size" : self.chunk_size})
+            logging.info(f"Cross-validating {self.n_folds} folds on {n_jobs} jobs of {n_threads} threads")
+
+            if n_jobs == 1:
+                results = [_run_fold(fold) for fold in folds]
+            else:
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload(["sensor.cross_validation"])
+                with ProcessPoolExecutor(max_workers=n_jobs, mp_context=context) as pool:
+                    results = list(pool.map(_run_fold, folds))
+
+            f1_scores = np.array([result["f1_validation_score"] for result in results])
+            f1_train_scores = np.array([result["f1_train_score"] for result in results])
+            summary = {"n_folds" : self.n_folds, "folds" : results,
+                       "f1_mean" : float(f1_scores.mean()), "f1_variance" : float(f1_scores.var(ddof=1)),
+                       "f1_train_mean" : float(f1_train_scores.mean()),
+                       "overfitting_mean" : float(np.abs(f1_train_scores - f1_scores).mean()),
+                       "seconds" : time.perf_counter() - start_time}
+            logging.info(f"Cross-validation f1 : mean {summary['f1_mean']:.5f}, variance {summary['f1_variance']:.3g}, "
+                         f"{summary['seconds']:.1f} s")
+            return summary
+        except Exception as e:
+            raise SensorException(e, sys)
@@ -0,0 +1,191 @@
+import sys
+import numpy as np
+from scipy.special import kolmogorov
+from sensor.exception import SensorException
+
+
+# sort key of the NaN values, larger than the key of any other float32 value
+NAN_SORT_KEY = np.uint32(0xFFFFFFFF)
+
+
+def float32_sort_keys(values:np.ndarray) -> np.ndarray:
+    """Turns a (n_rows, n_columns) float32 array into a (n_columns, n_rows) array of uint32 keys
+    which sort like the float values, NaN values last. Equal floats get equal keys.
+
+    Args:
+        values (np.ndarray): 2D float32 array
+
+    Returns:
+        np.ndarray: unsorted keys, one row per column
+    """
+    # always a copy, the keys are computed in place
+    values = np.array(np.asarray(values).T, dtype=np.float32, order="C")
+    values += np.float32(0.0)   # -0.0 becomes 0.0 and gets the same key
+    is_nan = np.isnan(values)
+
+    # flip all the bits of the negative values and the sign bit of the positive ones
+    keys = values.view(np.uint32)
+    keys ^= (keys.view(np.int32) >> 31).view(np.uint32) | np.uint32(0x80000000)
+    keys[is_nan] = NAN_SORT_KEY
+    return keys
+
+
+def float32_from_sort_keys(keys:np.ndarray) -> np.ndarray:
+    """Reverse of 'float32_sort_keys' : returns the float32 values of uint32 keys, same shape."""
+    keys = np.asarray(keys, dtype=np.uint32)
+    # the keys of the positive values have the sign bit set
+    bits = np.where(keys >> 31, keys ^ np.uint32(0x80000000), ~keys).astype(np.uint32)
+    return bits.view(np.float32)
+
+
+def _merge_sort_keys(base_keys:np.ndarray, current_keys:np.ndarray, presorted:bool = False) -> tuple:
+    """Sorts the keys of both samples together, one row per column.
+
+    Every key is shifted left by one bit with the sample in the lowest bit, so a single plain
+    sort is the merge of the two samples, equal values of the base sample coming before those
+    of the current one. When both samples are already sorted, the stable sort (timsort) only
+    merges the two runs.
+
+    Returns:
+        tuple: (sorted keys identifying the values, is_current mask, n1, n2)
+    """
+    n1 = (base_keys != NAN_SORT_KEY).sum(axis=1)
+    n2 = (current_keys != NAN_SORT_KEY).sum(axis=1)
+
+    keys = np.empty((base_keys.shape[0], base_keys.shape[1] + current_keys.shape[1]), dtype=np.uint64)
+    keys[:, :base_keys.shape[1]] = base_keys
+    keys[:, base_keys.shape[1]:] = current_keys
+    keys <<= np.uint64(1)
+    keys[:, base_keys.shape[1]:] |= np.uint64(1)
+    keys.sort(axis=1, kind="stable" if presorted else "quicksort")
+
+    is_current = (keys & np.uint64(1)).astype(bool)
+    keys >>= np.uint64(1)
+    return keys, is_current, n1, n2
+
+
+def _merge(base:np.ndarray, current:np.ndarray) -> tuple:
+    """Same as '_merge_sort_keys' for the values of any float dtype : both samples are sorted
+    and the sorted runs are merged with a stable sort."""
+    base = np.sort(base.T, axis=1)
+    current = np.sort(current.T, axis=1)
+    n1, n2 = (~np.isnan(base)).sum(axis=1), (~np.isnan(current)).sum(axis=1)
+
+    values = np.concatenate([base, current], axis=1)
+    order = np.argsort(values, axis=1, kind="stable")
+    values = np.take_along_axis(values, order, axis=1)
+    return values, order >= base.shape[1], n1, n2
+
+
+def ks_2samp_columns(base:np.ndarray, current:np.ndarray, exact_pvalues:bool = True) -> tuple:
+    """Two-sided two-sample Kolmogorov-Smirnov test of every column of 'base' against the same
+    column of 'current', computed for all the columns at once. NaN values are left out of each
+    column separately, so every column is compared on its own non null values.
+
+    The two samples of a column are merged in sorted order and the running counts of base and
+    current values give the two empirical CDFs; the statistic is the largest absolute difference
+    of the CDFs at the end of a run of equal values.
+
+    The statistics are identical to scipy.stats.ks_2samp. By default the p-values use the same
+    distribution as ks_2samp(method="asymp"), the method ks_2samp uses for samples of more than
+    10000 values. Without 'exact_pvalues' they use Stephens' approximation,
+    kolmogorov((sqrt(en) + 0.12 + 0.11 / sqrt(en)) * D) with en = n1 * n2 / (n1 + n2), cheaper to
+    evaluate but up to about 5e-3 away, which can move a p-value across the 0.05 drift threshold.
+    Columns without any non null value in one of the samples get a NaN statistic and p-value.
+
+    Args:
+        base (np.ndarray): 2D numeric array of shape (n1, n_columns)
+        current (np.ndarray): 2D numeric array of shape (n2, n_columns)
+        exact_pvalues (bool): compute the p-values as ks_2samp(method="asymp"), else with Stephens' approximation
+
+    Returns:
+        tuple: (statistics, pvalues), 1D arrays of length n_columns
+    """
+    try:
+        # float32 data, as read with the sensor schema, is kept as it is
+        dtype = np.result_type(np.asarray(base).dtype, np.asarray(current).dtype, np.float32)
+        base, current = np.asarray(base, dtype=dtype), np.asarray(current, dtype=dtype)
+        if dtype == np.float32:
+            return ks_2samp_sort_keys(float32_sort_keys(base), float32_sort_keys(current), exact_pvalues)
+        return _ks_2samp_merged(*_merge(base, current), exact_pvalues)
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def ks_2samp_sort_keys(base_keys:np.ndarray, current_keys:np.ndarray, exact_pvalues:bool = True,
+                       presorted:bool = False) -> tuple:
+    """Same as 'ks_2samp_columns' for float32 samples already turned into keys by
+    'float32_sort_keys', e.g. base keys computed once and kept in a reference profile.
+
+    Args:
+        base_keys (np.ndarray): uint32 keys of shape (n_columns, n1)
+        current_keys (np.ndarray): uint32 keys of shape (n_columns, n2)
+        exact_pvalues (bool): compute the p-values as ks_2samp(method="asymp"), else with Stephens' approximation
+        presorted (bool): the keys of every row of both samples are sorted
+
+    Returns:
+        tuple: (statistics, pvalues), 1D arrays of length n_columns
+    """
+    try:
+        return _ks_2samp_merged(*_merge_sort_keys(base_keys, current_keys, presorted), exact_pvalues)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def _ks_2samp_merged(values:np.ndarray, is_current:np.ndarray, n1:np.ndarray, n2:np.ndarray,
+                     exact_pvalues:bool) -> tuple:
+    """Computes the statistics and p-values from both samples merged in sorted order."""
+    try:
+        # n1 * n2 * (F1 - F2) in integers : every base value adds n2, every current value removes n1
+        cdf_diff = np.where(is_current, -n1[:, None], n2[:, None])
+        del is_current
+        np.cumsum(cdf_diff, axis=1, out=cdf_diff)
+        np.abs(cdf_diff, out=cdf_diff)
+
+        # evaluate only at the last element of every run of equal, non null values
+        is_last = np.ones(values.shape, dtype=bool)
+        np.not_equal(values[:, :-1], values[:, 1:], out=is_last[:, :-1])
+        is_last &= np.arange(values.shape[1]) < (n1 + n2)[:, None]
+        del values
+
+        cdf_diff[~is_last] = 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            statistics = np.clip(cdf_diff.max(axis=1, initial=0) / (n1 * n2), 0.0, 1.0)
+        return ks_pvalues(statistics, n1, n2, exact_pvalues)
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def ks_pvalues(statistics:np.ndarray, n1:np.ndarray, n2:np.ndarray, exact_pvalues:bool = True) -> tuple:
+    """Returns the two-sided p-values of KS statistics computed from samples of n1 and n2 non
+    null values, see 'ks_2samp_columns'. Columns with an empty sample get NaN.
+
+    Returns:
+        tuple: (statistics, pvalues), 1D float arrays
+    """
+    try:
+        statistics = np.array(statistics, dtype=np.float64)
+        n1, n2 = np.asarray(n1), np.asarray(n2)
+        is_empty = (n1 == 0) | (n2 == 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            en = np.round(n1 * n2 / (n1 + n2))
+        en = np.where(is_empty, 1, en)
+
+        if exact_pvalues:
+            # imported here : scipy.stats is slow to import in the validation worker processes
+            from scipy.stats import kstwo
+            pvalues = kstwo.sf(statistics, en)
+        else:
+            # Stephens' approximation of the distribution for finite samples
+            sqrt_en = np.sqrt(en)
+            pvalues = kolmogorov((sqrt_en + 0.12 + 0.11 / sqrt_en) * statistics)
+        pvalues = np.clip(pvalues, 0.0, 1.0)
+
+        statistics[is_empty] = np.nan
+        pvalues[is_empty] = np.nan
+        return statistics, pvalues
+
+    except Exception as e:
+        raise SensorException(e, sys)
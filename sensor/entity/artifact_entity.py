@@ -17,18 +17,31 @@ class DataValidationArtifact :
 
 class DataTransformationArtifact :
     def __init__(self,transformer_object_path, transformed_train_path, 
-                 transformed_test_path, target_encoder_path) :
+                 transformed_test_path, target_encoder_path, reference_sketch_path,
+                 transformed_train_target_path, transformed_test_target_path,
+                 transformed_metadata_path, class_weights_path=None) :
         self.transformer_object_path = transformer_object_path
         self.transformed_train_path = transformed_train_path
         self.transformed_test_path = transformed_test_path
         self.target_encoder_path = target_encoder_path
+        self.reference_sketch_path = reference_sketch_path
+        # None when the training data was resampled instead
+        self.class_weights_path = class_weights_path
+        # labels saved apart from the features
+        self.transformed_train_target_path = transformed_train_target_path
+        self.transformed_test_target_path = transformed_test_target_path
+        # feature names, dtypes and row counts of the transformed arrays
+        self.transformed_metadata_path = transformed_metadata_path
 
 
 class ModelTrainingArtifact :
-    def __init__(self, model_path, f1_train_score, f1_test_score):
+    def __init__(self, model_path, f1_train_score, f1_test_score, cv_f1_mean=None, cv_f1_variance=None):
         self.model_path = model_path
         self.f1_train_score = f1_train_score
         self.f1_test_score = f1_test_score
+        # mean and variance of the F1 of the cross-validation folds, None without cross-validation
+        self.cv_f1_mean = cv_f1_mean
+        self.cv_f1_variance = cv_f1_variance
 
 
 
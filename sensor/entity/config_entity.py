@@ -5,16 +5,40 @@ from sensor.exception import SensorException
 
 TRAIN_FILE_NAME = "train.csv"
 TEST_FILE_NAME = "test.csv"
+TRAIN_INDEX_FILE_NAME = "train_index.npy"
+TEST_INDEX_FILE_NAME = "test_index.npy"
+TRAIN_FEATURES_FILE_NAME = "train_features.npy"
+TEST_FEATURES_FILE_NAME = "test_features.npy"
+TRAIN_TARGET_FILE_NAME = "train_target.npy"
+TEST_TARGET_FILE_NAME = "test_target.npy"
+TRANSFORMED_METADATA_FILE_NAME = "metadata.yaml"
 TRANSFORMER_OBJECT_FILE_NAME = "transformer.pkl"
 TARGET_ENCODER_FILE_NAME = "target_encoder.pkl"
 MODEL_FILE_NAME = "model.pkl"
+REFERENCE_SKETCH_FILE_NAME = "reference_sketch.pkl"
+CLASS_WEIGHTS_FILE_NAME = "class_weights.yaml"
 
 
 class TrainingPipelineConfig():
 
-    def __init__(self) :
+    def __init__(self, run_id:str | None = None) :
         try :
-            self.artifact_dir = os.path.join(os.getcwd(), "artifacts", f"{datetime.now().strftime('%d%m%Y_%H%M%S')}")
+            # id of the run, the name of its artifact directory; a new one by default
+            self.run_id = run_id or datetime.now().strftime('%d%m%Y_%H%M%S')
+            self.artifact_dir = os.path.join(os.getcwd(), "artifacts", self.run_id)
+            # stages completed by any run with the same inputs and config are reused from here,
+            # see sensor.stage_cache.PipelineRun; None reruns them
+            self.stage_cache_dir = os.path.join(os.getcwd(), "stage_cache")
+            # out of core mode : the stages work on chunks of 'chunk_size' rows or on one column
+            # at a time, so the peak memory does not grow with the number of rows
+            self.out_of_core = False
+            self.chunk_size = 50000
+            # float32 mode : the features are loaded into a preallocated float32 array and
+            # transformed in place
+            self.float32 = False
+            # incremental training : the latest model keeps boosting on the rows added to the
+            # feature store since it was trained, see sensor.warm_start; needs incremental ingestion
+            self.warm_start = False
 
         except Exception as e:
             raise SensorException(e, sys)
@@ -26,10 +50,31 @@ class DataIngestionConfig :
         self.database_name = "APS"
         self.collection_name = "SENSOR_DATA"
         self.data_ingestion_dir = os.path.join(training_pipeline_config.artifact_dir, "data_ingestion")
+        self.out_of_core = training_pipeline_config.out_of_core
+        self.chunk_size = training_pipeline_config.chunk_size
         self.feature_store_file_path = os.path.join(self.data_ingestion_dir, "feature_store")
-        self.train_file_path = os.path.join(self.data_ingestion_dir, "dataset", TRAIN_FILE_NAME)
-        self.test_file_path = os.path.join(self.data_ingestion_dir, "dataset", TEST_FILE_NAME)
+        # train and test sets are saved as the positions of their rows in the feature store
+        self.train_file_path = os.path.join(self.data_ingestion_dir, "dataset", TRAIN_INDEX_FILE_NAME)
+        self.test_file_path = os.path.join(self.data_ingestion_dir, "dataset", TEST_INDEX_FILE_NAME)
+        # also export the feature store, train and test sets as csv files
+        self.export_csv = False
+        self.train_csv_file_path = os.path.join(self.data_ingestion_dir, "dataset", TRAIN_FILE_NAME)
+        self.test_csv_file_path = os.path.join(self.data_ingestion_dir, "dataset", TEST_FILE_NAME)
         self.test_size = 0.2
+        # number of documents fetched from mongodb per round trip
+        self.batch_size = 10000
+        # number of _id ranges of the collection read in parallel and the pool used for them
+        self.read_workers = 1
+        self.read_executor = "thread"
+        # local copy of the data; set to None to read the data from mongodb
+        self.local_file_path = os.path.join(os.getcwd(), "aps_failure_training_set1.csv")
+        # incremental mode : only the rows after the stored watermark are fetched and appended
+        # to a persistent feature store, the train/test split is rebuilt from that store
+        self.incremental = False
+        self.feature_store_dir = os.path.join(os.getcwd(), "feature_store")
+        # must grow in commit order, see DataIngestion.get_data : '_id' misses documents inserted
+        # with a lower ObjectId by concurrent writers
+        self.watermark_key = "_id"
 
     def to_dict(self) -> dict :
         try :
@@ -43,30 +88,119 @@ class DataValidationConfig :
     def __init__(self, training_pipeline_config: TrainingPipelineConfig):
         self.data_validation_dir = os.path.join(training_pipeline_config.artifact_dir,"data_validation")
         self.report_file_path = os.path.join(self.data_validation_dir, "report.yaml")
+        self.out_of_core = training_pipeline_config.out_of_core
+        self.chunk_size = training_pipeline_config.chunk_size
         self.missing_threshold = 0.7
+        # processes running the per-column checks of the base, train and test data at the same time;
+        # 1 runs the checks in this process, one dataset after the other
+        self.n_jobs = 1
+        # "ks" : exact ks_2samp on all the values; "sketch" : one streaming pass building mergeable
+        # per-column sketches, compared with an approximate KS statistic and the PSI
+        self.drift_method = "ks"
+        self.sketch_relative_accuracy = 0.01
         self.base_file_path = os.path.join(os.getcwd(), "aps_failure_training_set1.csv")
+        # profiles of the base file, named after its content hash; None profiles the base file on every run
+        self.reference_profile_dir = os.path.join(os.getcwd(), "reference_profile")
 
 
 class DataTransformationConfig :
     def __init__(self, training_pipeline_config: TrainingPipelineConfig) :
         self.data_transformation_dir = os.path.join(training_pipeline_config.artifact_dir, "data_transformation")
         self.transformer_object_path = os.path.join(self.data_transformation_dir, "transformer", TRANSFORMER_OBJECT_FILE_NAME)
-        self.transformed_train_path = os.path.join(self.data_transformation_dir, "transformed", TRAIN_FILE_NAME)
-        self.transformed_test_path = os.path.join(self.data_transformation_dir, "transformed", TEST_FILE_NAME)
+        # the transformed features and labels are saved as separate contiguous .npy files, which
+        # are memory mapped when loaded, with the feature names and dtypes in the metadata file
+        self.transformed_train_path = os.path.join(self.data_transformation_dir, "transformed", TRAIN_FEATURES_FILE_NAME)
+        self.transformed_test_path = os.path.join(self.data_transformation_dir, "transformed", TEST_FEATURES_FILE_NAME)
+        self.transformed_train_target_path = os.path.join(self.data_transformation_dir, "transformed", TRAIN_TARGET_FILE_NAME)
+        self.transformed_test_target_path = os.path.join(self.data_transformation_dir, "transformed", TEST_TARGET_FILE_NAME)
+        self.transformed_metadata_path = os.path.join(self.data_transformation_dir, "transformed", TRANSFORMED_METADATA_FILE_NAME)
         self.target_encoder_path = os.path.join(self.data_transformation_dir, "target_encoder", TARGET_ENCODER_FILE_NAME)
+        # sketch of the training input features, shipped with the model to monitor drift at prediction time
+        self.reference_sketch_path = os.path.join(self.data_transformation_dir, "reference_sketch", REFERENCE_SKETCH_FILE_NAME)
+        self.sketch_relative_accuracy = 0.01
+        # resampling of the imbalanced target : "smote_tomek", "smote" (no Tomek links cleaning), "none"
+        # or "class_weight" : no resampling, the model weighs the classes by their frequency instead
+        self.resampling_method = "smote_tomek"
+        self.class_weights_path = os.path.join(self.data_transformation_dir, "class_weights", CLASS_WEIGHTS_FILE_NAME)
+        # "imblearn" : SMOTETomek as is; "fast" : chunked float32 nearest neighbour search of the
+        # Tomek links from the smaller class, about half the samples once SMOTE has balanced them
+        self.resampling_engine = "imblearn"
+        # fast engine only : approximate nearest neighbours (KD-tree on the principal components)
+        self.approximate_neighbors = False
+        # threads of the nearest neighbour searches
+        self.resampling_n_jobs = 1
+        # False keeps the test set as it is, with its real class balance
+        self.resample_test = True
+        self.float32 = training_pipeline_config.float32
+        self.out_of_core = training_pipeline_config.out_of_core
+        self.chunk_size = training_pipeline_config.chunk_size
+        self.warm_start = training_pipeline_config.warm_start
+        # full training after this number of warm starts in a row
+        self.full_retrain_every = 4
+        # full training when more than this fraction of the columns of the new rows drifted from
+        # the champion's reference sketch, a column drifting when its KS p-value is at most the threshold
+        self.full_retrain_drift_share = 0.2
+        self.drift_pvalue_threshold = 0.05
+        # outputs of earlier runs, reused when the input data and the settings are the same; None disables the cache
+        self.cache_dir = os.path.join(os.getcwd(), "transformation_cache")
+        self.cache_max_entries = 5
+        self.cache_max_bytes = 2 << 30
 
 
 class ModelTrainingConfig :
     def __init__(self, training_pipeline_config: TrainingPipelineConfig) :
         self.model_trainer_dir = os.path.join(training_pipeline_config.artifact_dir, "model_trainer")
         self.model_path = os.path.join(self.model_trainer_dir, "model", MODEL_FILE_NAME)
+        # row counts, fit time, class weights and scores of the training
+        self.report_file_path = os.path.join(self.model_trainer_dir, "report.yaml")
         self.expected_accuracy = 0.7
         self.overfitting_threshold = 0.1
+        # the transformed arrays are memory mapped ("r"), so they are read from the page cache
+        # as the model needs them; None reads them into memory first
+        self.mmap_mode = "r"
+        # "sklearn" : XGBClassifier.fit on the arrays; "native" : QuantileDMatrix built chunk by chunk
+        # from the memory mapped arrays and xgboost.train; "external_memory" : same with the
+        # quantized data paged to disk, for training data larger than memory
+        self.training_engine = "sklearn"
+        self.tree_method = "hist"
+        # threads of XGBoost; None uses all the cores
+        self.n_threads = None
+        self.chunk_size = training_pipeline_config.chunk_size
+        self.external_memory_dir = os.path.join(self.model_trainer_dir, "external_memory")
+        # tuning mode : random search of the model parameters, see sensor.tuning.HyperparameterSearch
+        self.tuning = False
+        self.tuning_n_trials = 20
+        # worker processes, the cores being split between them
+        self.tuning_n_jobs = 1
+        # seconds after which no candidate starts and the running ones stop
+        self.tuning_time_budget = 600
+        # fraction of the training rows used for early stopping and to rank the candidates
+        self.tuning_validation_size = 0.2
+        self.tuning_max_estimators = 500
+        self.tuning_early_stopping_rounds = 20
+        self.tuning_log_path = os.path.join(self.model_trainer_dir, "tuning", "trials.yaml")
+        # trees added to the champion by a warm start
+        self.warm_start_max_trees = 50
+        # cross-validation mode : the acceptance checks use the mean F1 of stratified folds run in
+        # parallel, see sensor.cross_validation.CrossValidation, instead of the single test split
+        self.cross_validation = False
+        self.cv_n_folds = 5
+        # worker processes, the cores being split between them
+        self.cv_n_jobs = 5
+        self.cv_dir = os.path.join(self.model_trainer_dir, "cross_validation")
 
 
 class ModelEvaluationConfig :
     def __init__(self, training_pipeline_config: TrainingPipelineConfig) :
         self.change_threshold = 0.01
+        # with cross-validation, the current model is accepted unless its score is below the
+        # previous model's by more than this many standard deviations of the fold scores; every
+        # accepted drop lowers the bar of the next run, so above 0 the registry can drift down
+        self.cv_std_tolerance = 0
+        # memory map mode of the transformed test arrays, see ModelTrainingConfig
+        self.mmap_mode = "r"
+        self.out_of_core = training_pipeline_config.out_of_core
+        self.chunk_size = training_pipeline_config.chunk_size
 
         
 
@@ -81,4 +215,6 @@ class ModelPusherConfig :
                                               MODEL_FILE_NAME)
         self.pusher_target_encoder_path = os.path.join(self.model_pusher_saved_models_dir,
                                                        TARGET_ENCODER_FILE_NAME)
+        self.pusher_reference_sketch_path = os.path.join(self.model_pusher_saved_models_dir,
+                                                         REFERENCE_SKETCH_FILE_NAME)
 
@@ -0,0 +1,283 @@
+import os
+import sys
+import copy
+import yaml
+import numpy as np
+import pandas as pd
+from sensor import utils
+from sensor.logger import logging
+from sensor.exception import SensorException
+
+
+MANIFEST_FILE_NAME = "manifest.yaml"
+
+
+class FeatureStore:
+    """Persistent, append-only store of the ingested data. Every ingestion run adds one
+    partition holding the documents found after the stored watermark. The manifest lists
+    the committed partitions and the watermark; it is replaced atomically, so a partition
+    written by a failed run is never read and its documents are fetched again."""
+
+    def __init__(self, feature_store_dir:str = "feature_store") -> None:
+        self.feature_store_dir = feature_store_dir
+        os.makedirs(self.feature_store_dir, exist_ok=True)
+        self.manifest_path = os.path.join(self.feature_store_dir, MANIFEST_FILE_NAME)
+        self.manifest = None
+        self.columns = None
+
+
+    def read_manifest(self) -> dict:
+        """Returns the committed partitions, their row counts and the watermark. The manifest is
+        read once per instance and kept up to date by 'append_chunks'; a manifest written by an
+        older version is migrated first, see 'migrate_manifest'."""
+        try:
+            if self.manifest is None:
+                if not os.path.exists(self.manifest_path):
+                    return {"partitions" : [], "partition_sizes" : [], "watermark" : None}
+                with open(self.manifest_path, "r") as f:
+                    manifest = yaml.safe_load(f)
+                if "partition_sizes" not in manifest:
+                    manifest = self.migrate_manifest(manifest)
+                self.manifest = manifest
+            return self.manifest
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def migrate_manifest(self, manifest:dict) -> dict:
+        """Adds the row counts of the partitions to a manifest written before they were kept, and
+        converts the csv partitions of the first stores to the columnar format. The migrated
+        manifest is committed as 'append_chunks' does, so the old partitions are left untouched
+        until it replaces the old one."""
+        try:
+            logging.info(f"Migrating the manifest of the feature store : {self.manifest_path}")
+            manifest = dict(manifest, partitions=list(manifest["partitions"]), partition_sizes=[])
+            for i, partition in enumerate(manifest["partitions"]):
+                partition_path = os.path.join(self.feature_store_dir, partition)
+                if partition.endswith(".csv"):
+                    df = utils.read_sensor_csv(partition_path)
+                    partition = partition[:-len(".csv")]
+                    utils.save_columnar(os.path.join(self.feature_store_dir, partition), df)
+                    manifest["partitions"][i] = partition
+                    manifest["partition_sizes"].append(df.shape[0])
+                    del df
+                else:
+                    manifest["partition_sizes"].append(int(utils.read_columnar_meta(partition_path)["n_rows"]))
+            self.write_manifest(manifest)
+            return manifest
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def write_manifest(self, manifest:dict) -> None:
+        """Replaces the manifest atomically."""
+        try:
+            tmp_manifest_path = f"{self.manifest_path}.tmp"
+            with open(tmp_manifest_path, "w") as f:
+                yaml.safe_dump(manifest, f)
+            os.replace(tmp_manifest_path, self.manifest_path)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get_watermark(self):
+        try:
+            return self.read_manifest()["watermark"]
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get_partition_paths(self) -> list:
+        try:
+            partitions = self.read_manifest()["partitions"]
+            return [os.path.join(self.feature_store_dir, partition) for partition in partitions]
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def append(self, df:pd.DataFrame, watermark) -> str:
+        """Writes 'df' as a new partition and moves the watermark forward.
+
+        Args:
+            df (pd.DataFrame): newly ingested rows
+            watermark : position of the last ingested row in the source
+
+        Returns:
+            str: path of the new partition
+        """
+        try:
+            return self.append_chunks([df], watermark)[0]
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def append_chunks(self, chunks, watermark) -> list:
+        """Writes every dataframe of 'chunks' as a new partition and commits them together with
+        the new watermark once all of them are written.
+
+        Args:
+            chunks : iterable of pd.DataFrame holding the newly ingested rows
+            watermark : position of the last ingested row in the source
+
+        Returns:
+            list: paths of the new partitions
+        """
+        try:
+            manifest = copy.deepcopy(self.read_manifest())
+            partition_paths = []
+            for df in chunks:
+                if df.shape[0] == 0:
+                    continue
+                partition = f"part-{len(manifest['partitions']):05d}"
+                partition_path = os.path.join(self.feature_store_dir, partition)
+
+                logging.info(f"Appending {df.shape[0]} rows to the feature store : {partition_path}")
+                utils.save_columnar(partition_path, df)
+
+                manifest["partitions"].append(partition)
+                manifest["partition_sizes"].append(df.shape[0])
+                partition_paths.append(partition_path)
+
+            if len(partition_paths) == 0:
+                logging.info(f"No new rows found.")
+                return partition_paths
+
+            manifest["watermark"] = watermark
+            self.write_manifest(manifest)
+            self.manifest = manifest
+
+            return partition_paths
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get_columns(self) -> list:
+        try:
+            partition_paths = self.get_partition_paths()
+            if len(partition_paths) == 0:
+                return []
+            if self.columns is None:
+                self.columns = utils.get_columnar_columns(partition_paths[0])
+            return self.columns
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get_dtypes(self) -> dict:
+        """Returns the numpy dtype string of every column, e.g. {"aa_000" : "<f4", "class" : "<U3"}."""
+        try:
+            partition_paths = self.get_partition_paths()
+            if len(partition_paths) == 0:
+                return dict()
+            return utils.read_columnar_meta(partition_paths[0])["dtypes"]
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get_partition_sizes(self) -> list:
+        try:
+            return list(self.read_manifest()["partition_sizes"])
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get_selections(self, rows:np.ndarray | None = None) -> list:
+        """Returns the positions of the sorted 'rows' inside every partition; all the rows if None."""
+        try:
+            partition_paths = self.get_partition_paths()
+            if rows is None:
+                return [slice(None)] * len(partition_paths)
+            offsets = np.cumsum([0] + self.get_partition_sizes())
+            bounds = np.searchsorted(rows, offsets)
+            return [rows[bounds[i]:bounds[i + 1]] - offsets[i] for i in range(len(partition_paths))]
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def load(self, columns:list | None = None, rows:np.ndarray | None = None) -> pd.DataFrame:
+        """Loads the requested columns of all the partitions, in the order they were appended.
+
+        Args:
+            columns (list, optional): columns to load; all the columns if None
+            rows (np.ndarray, optional): sorted positions of the rows to load; all the rows if None.
+                The partitions are memory mapped, so only the pages holding these rows are read.
+
+        Returns:
+            pd.DataFrame: loaded data
+        """
+        try:
+            partition_paths = self.get_partition_paths()
+            if len(partition_paths) == 0:
+                return pd.DataFrame()
+
+            if columns is None:
+                columns = self.get_columns()
+
+            selections = self.get_selections(rows)
+            data = dict()
+            for column in columns:
+                arrays = [np.asarray(utils.load_columnar_array(path, column, mmap_mode="r")[selection])
+                          for path, selection in zip(partition_paths, selections)]
+                data[column] = np.concatenate(arrays) if len(arrays) > 1 else arrays[0]
+            return pd.DataFrame(data, copy=False)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def load_array(self, columns:list, rows:np.ndarray | None = None, out:np.ndarray | None = None,
+                   dtype=np.float32) -> np.ndarray:
+        """Same as 'load' for numeric columns, returned as a 2D array : the values are copied
+        from the memory mapped partitions straight into 'out', one column at a time, so no
+        dataframe or intermediate copy of the whole data is made.
+
+        Args:
+            columns (list): numeric columns to load
+            rows (np.ndarray, optional): sorted positions of the rows to load; all the rows if None
+            out (np.ndarray, optional): preallocated array of shape (n_rows, len(columns))
+            dtype : dtype of the array allocated when 'out' is None
+
+        Returns:
+            np.ndarray: 'out', or a new array
+        """
+        try:
+            selections = self.get_selections(rows)
+            if out is None:
+                n_rows = sum(self.get_partition_sizes()) if rows is None else rows.shape[0]
+                out = np.empty((n_rows, len(columns)), dtype=dtype)
+
+            for j, column in enumerate(columns):
+                start = 0
+                for path, selection in zip(self.get_partition_paths(), selections):
+                    values = utils.load_columnar_array(path, column, mmap_mode="r")[selection]
+                    out[start:start + values.shape[0], j] = values
+                    start += values.shape[0]
+            return out
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def load_split(self, index_path:str, columns:list | None = None) -> pd.DataFrame:
+        """Loads the rows listed in an index file written by the data ingestion, e.g. the train set."""
+        try:
+            rows = np.load(index_path)
+            logging.info(f"Loading {rows.shape[0]} rows of {index_path} from the feature store...")
+            return self.load(columns=columns, rows=rows)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def iter_chunks(self, chunk_size:int, columns:list | None = None, rows:np.ndarray | None = None):
+        """Yields the requested rows as dataframes of at most 'chunk_size' rows.
+
+        Args:
+            chunk_size (int): rows per chunk
+            columns (list, optional): columns to load; all the columns if None
+            rows (np.ndarray, optional): sorted positions of the rows to load; all the rows if None
+        """
+        try:
+            if rows is None:
+                rows = np.arange(sum(self.get_partition_sizes()))
+            for start in range(0, rows.shape[0], chunk_size):
+                yield self.load(columns=columns, rows=rows[start:start + chunk_size])
+        except Exception as e:
+            raise SensorException(e, sys)
@@ -7,11 +7,52 @@ from sensor.entity import config_entity
 from sensor.entity import artifact_entity
 from sensor.logger import logging
 from sensor import utils
-from sensor.predictor import ModelResolver
+from sensor.predictor import ModelResolver, get_transform_function
+from sensor.sketch import ColumnSketch
 from sensor.exception import SensorException
 
 
 PREDICTION_FILE_DIR = os.path.join(os.getcwd(), "prediction")
+# a column has drifted when the KS p-value against the training data is at most this value
+DRIFT_PVALUE_THRESHOLD = 0.05
+
+
+def get_drift_summary(reference_sketch:ColumnSketch, input_df:pd.DataFrame) -> dict:
+    """Compares the columns of 'input_df' with the sketch of the training input features saved
+    with the model, see sensor.sketch.ColumnSketch. The input is sketched with the same bins in
+    one vectorized pass, so the cost is small next to the transformation.
+
+    Returns:
+        dict: number of rows, drifted columns and, for every column, the approximate KS statistic,
+              its error bound, the p-value, the PSI and the null fraction
+    """
+    try:
+        input_sketch = ColumnSketch(reference_sketch.numeric_columns, reference_sketch.other_columns,
+                                    relative_accuracy=reference_sketch.relative_accuracy,
+                                    min_value=reference_sketch.min_value, max_value=reference_sketch.max_value)
+        input_sketch.update(input_df)
+
+        columns = reference_sketch.numeric_columns + reference_sketch.other_columns
+        comparison = reference_sketch.compare(input_sketch, columns)
+        null_percent = input_sketch.get_null_percent()
+
+        drift_report = dict()
+        for column in columns:
+            drift_report[column] = comparison[column]
+            drift_report[column]["null_percent"] = float(null_percent[column])
+            # if the pvalue is > threshold, --> accept the null hypothesis
+            drift_report[column]["same_distribution"] = bool(comparison[column]["pvalue"] > DRIFT_PVALUE_THRESHOLD)
+
+        drifted_columns = [column for column in columns if not drift_report[column]["same_distribution"]]
+        return {
+            "n_rows" : int(input_sketch.n_rows),
+            "n_reference_rows" : int(reference_sketch.n_rows),
+            "n_drifted_columns" : len(drifted_columns),
+            "drifted_columns" : drifted_columns,
+            "columns" : drift_report,
+        }
+    except Exception as e:
+        raise SensorException(e, sys)
 
 
 def start_batch_prediction(input_file_path:str):
@@ -26,13 +67,13 @@ def start_batch_prediction(input_file_path:str):
         logging.info(f"Loading the model details...")
 
         # load the input file
-        df = pd.read_csv(input_file_path)
-        df.replace({"na":np.NAN}, inplace=True)
+        df = utils.read_sensor_csv(input_file_path)
 
         # load the model details
         model_transformer_path = model_resolver.get_latest_transformer_path()
         model_path = model_resolver.get_latest_model_path()
         target_encoder_path = model_resolver.get_latest_target_encoder_path()
+        reference_sketch_path = model_resolver.get_latest_reference_sketch_path()
 
         transformer = utils.load_object(file_path=model_transformer_path)
         model = utils.load_object(file_path=model_path)
@@ -44,7 +85,19 @@ def start_batch_prediction(input_file_path:str):
         column_names = list(transformer.feature_names_in_)
 
         input_arr = df[column_names]
-        input_arr = transformer.transform(input_arr)
+
+        # drift of the input against the training data, computed on the same input features
+        drift_summary = None
+        if reference_sketch_path is not None:
+            logging.info(f"Checking data drift against the training data...")
+            drift_summary = get_drift_summary(utils.load_object(file_path=reference_sketch_path), input_arr)
+            logging.info(f"{drift_summary['n_drifted_columns']} of {len(drift_summary['columns'])} columns drifted.")
+        else:
+            logging.info(f"The latest model has no reference sketch, skipping the drift check.")
+
+        # the fitted pipeline runs as a fused in place kernel with the same operations
+        transform = get_transform_function(transformer)
+        input_arr = transform(input_arr)
 
         logging.info(f"Making predictions and getting their corresponding labels...")
 
@@ -72,6 +125,12 @@ def start_batch_prediction(input_file_path:str):
         
         logging.info(f"Predictions file saved successfully at:{prediction_file_path}")
 
+        # the drift summary is saved next to the predictions like: <input_file_name>_<timestamp>_drift.yaml
+        if drift_summary is not None:
+            drift_file_path = f"{os.path.splitext(prediction_file_path)[0]}_drift.yaml"
+            utils.write_yaml_file(file_path=drift_file_path, data=drift_summary)
+            logging.info(f"Drift summary saved at:{drift_file_path}")
+
         logging.info(f"Batch prediction complete.")
 
         return prediction_file_path
@@ -5,26 +5,47 @@ from sensor.entity import config_entity, artifact_entity
 from sensor.components import data_ingestion, data_validation, data_transformation, model_trainer, model_evaluation, model_pusher
 from sensor import utils
 from sensor.logger import logging
+from sensor.predictor import ModelResolver
+from sensor.stage_cache import PipelineRun, RUN_MANIFEST_FILE_NAME, get_fingerprint, get_file_fingerprint
+import os
 
 
 db_name = "APS"
 collection_name = "SENSOR_DATA"
 
 
-def start_training_pipeline():
+def start_training_pipeline(run_id:str | None = None):
+    """Runs the training pipeline. The stages up to the model training are skipped when a run
+    completed them with the same inputs and config, see sensor.stage_cache.PipelineRun; the
+    evaluation and the pusher read and write the model registry, so they always run.
+
+    Args:
+        run_id (str, optional): id of the run; the id of an earlier run resumes it from the first
+            stage it did not complete, a new run is started if None
+    """
     
     try :
 
         logging.info(f"{'>>'*10}Starting the training pipeline...\n")
         
-        training_pipeline_config = config_entity.TrainingPipelineConfig()
+        training_pipeline_config = config_entity.TrainingPipelineConfig(run_id=run_id)
+        artifact_dir = training_pipeline_config.artifact_dir
+        pipeline_run = PipelineRun(training_pipeline_config.run_id, artifact_dir,
+                                   stage_cache_dir=training_pipeline_config.stage_cache_dir,
+                                   resume=os.path.exists(os.path.join(artifact_dir, RUN_MANIFEST_FILE_NAME)))
+
+        # the stages which load the latest model depend on the registry too
+        registry_state = ModelResolver().get_latest_dir() if training_pipeline_config.warm_start else None
 
 
         # data ingestion
 
         data_ingestion_config = config_entity.DataIngestionConfig(training_pipeline_config)
         data_ingestion_phase = data_ingestion.DataIngestion(data_ingestion_config)
-        data_ingestion_artifact = data_ingestion_phase.initiate_data_ingestion()
+        data_ingestion_fingerprint = get_fingerprint("data_ingestion", data_ingestion_config, artifact_dir,
+                                                     inputs=[data_ingestion_phase.get_source_fingerprint()])
+        data_ingestion_artifact = pipeline_run.run_stage("data_ingestion", data_ingestion_phase.initiate_data_ingestion,
+                                                         fingerprint=data_ingestion_fingerprint)
 
 
         # data validation
@@ -32,7 +53,11 @@ def start_training_pipeline():
         data_validation_config = config_entity.DataValidationConfig(training_pipeline_config)
         data_validation_phase = data_validation.DataValidation(data_validation_config=data_validation_config,
                                                                 data_ingestion_artifact=data_ingestion_artifact)
-        data_validation_artifact = data_validation_phase.initiate_data_validation()
+        data_validation_fingerprint = get_fingerprint("data_validation", data_validation_config, artifact_dir,
+                                                      inputs=[data_ingestion_fingerprint,
+                                                              get_file_fingerprint(data_validation_config.base_file_path)])
+        data_validation_artifact = pipeline_run.run_stage("data_validation", data_validation_phase.initiate_data_validation,
+                                                          fingerprint=data_validation_fingerprint)
 
 
         # data transformation
@@ -44,7 +69,12 @@ def start_training_pipeline():
             data_transformation_config=data_transformation_config,
             data_ingestion_artifact=data_ingestion_artifact
         )
-        data_transformation_artifact = data_transformation_phase.initiate_data_transformation()
+        data_transformation_fingerprint = get_fingerprint("data_transformation", data_transformation_config, artifact_dir,
+                                                          inputs=[data_ingestion_fingerprint, data_validation_fingerprint,
+                                                                  registry_state])
+        data_transformation_artifact = pipeline_run.run_stage("data_transformation",
+                                                              data_transformation_phase.initiate_data_transformation,
+                                                              fingerprint=data_transformation_fingerprint)
 
 
         # model training 
@@ -54,7 +84,10 @@ def start_training_pipeline():
             model_training_config=model_training_config,
             data_transformation_artifact=data_transformation_artifact
         )
-        model_training_artifact = model_training_phase.initiate_model_training()
+        model_training_fingerprint = get_fingerprint("model_training", model_training_config, artifact_dir,
+                                                     inputs=[data_transformation_fingerprint, registry_state])
+        model_training_artifact = pipeline_run.run_stage("model_training", model_training_phase.initiate_model_training,
+                                                         fingerprint=model_training_fingerprint)
 
 
         # model evaluation
@@ -66,7 +99,7 @@ def start_training_pipeline():
             data_transformation_artifact=data_transformation_artifact,
             model_training_artifact=model_training_artifact
         )
-        model_eva_artifact = model_eva_phase.initiate_model_evaluation()
+        model_eva_artifact = pipeline_run.run_stage("model_evaluation", model_eva_phase.initiate_model_evaluation)
 
 
         # model pusher
@@ -78,7 +111,7 @@ def start_training_pipeline():
             model_trainer_artifact=model_training_artifact,
             model_eva_artifact=model_eva_artifact
         )
-        model_pusher_artifact = model_pusher_phase.initiate_model_pusher()
+        model_pusher_artifact = pipeline_run.run_stage("model_pusher", model_pusher_phase.initiate_model_pusher)
 
 
         logging.info(f"{'>>'*10}Training pipeline complete.")
@@ -86,4 +119,5 @@ def start_training_pipeline():
         
 
     except Exception as e:
-        print(SensorException(e, sys))
+        # raised, so that a scheduler retrying the run, e.g. Airflow, sees it fail
+        raise SensorException(e, sys)
@@ -1,6 +1,10 @@
 import os
 import sys
-from sensor.entity.config_entity import MODEL_FILE_NAME, TARGET_ENCODER_FILE_NAME, TRANSFORMER_OBJECT_FILE_NAME
+import numpy as np
+import pandas as pd
+from sensor.entity.config_entity import MODEL_FILE_NAME, TARGET_ENCODER_FILE_NAME, TRANSFORMER_OBJECT_FILE_NAME, \
+    REFERENCE_SKETCH_FILE_NAME
+from sensor.logger import logging
 from sensor.exception import SensorException
 
 
@@ -10,12 +14,14 @@ class ModelResolver:
     def __init__(self, model_registry:str = "saved_models",
                  model_dir= "model",
                  transformer_dir = "transformer",
-                 target_endoder_dir = "target_encoder") -> None:
+                 target_endoder_dir = "target_encoder",
+                 reference_sketch_dir = "reference_sketch") -> None:
         self.model_registry = model_registry
         os.makedirs(self.model_registry, exist_ok=True)
         self.model_dir = model_dir
         self.transformer_dir = transformer_dir
         self.target_endoder_dir = target_endoder_dir
+        self.reference_sketch_dir = reference_sketch_dir
 
 
     def get_latest_dir(self):
@@ -60,6 +66,21 @@ class ModelResolver:
             raise SensorException(e, sys)
 
 
+    def get_latest_reference_sketch_path(self):
+        """Returns the path of the reference sketch of the latest model, None when the latest
+        model was saved without one."""
+        try:
+            latest_dir = self.get_latest_dir()
+            if not latest_dir:
+                raise Exception(f"No reference sketch available.")
+            reference_sketch_path = os.path.join(latest_dir, self.reference_sketch_dir, REFERENCE_SKETCH_FILE_NAME)
+            if not os.path.exists(reference_sketch_path):
+                return None
+            return reference_sketch_path
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
     def get_latest_save_dir(self):
         try:
             latest_dir = self.get_latest_dir()
@@ -93,6 +114,14 @@ class ModelResolver:
             return os.path.join(save_model_dir, self.target_endoder_dir, TARGET_ENCODER_FILE_NAME)
         except Exception as e:
             raise SensorException(e, sys)
+
+
+    def get_latest_save_reference_sketch_path(self):
+        try:
+            save_model_dir = self.get_latest_save_dir()
+            return os.path.join(save_model_dir, self.reference_sketch_dir, REFERENCE_SKETCH_FILE_NAME)
+        except Exception as e:
+            raise SensorException(e, sys)
         
 
 
@@ -100,3 +129,102 @@ class Predictor:
     pass
 
 
+class TransformerKernel:
+    """The fitted SimpleImputer + RobustScaler pipeline of the data transformation exported as
+    plain arrays : the fill value, center and scale of every column kept by the imputer. The
+    transformation is a single in place pass over a float32 block,
+        x = (fill value if x is null else x - center) / scale
+    without the per step input validation, dataframe conversion and copies of
+    Pipeline.transform. The operations are the ones the fitted steps run, so the output matches
+    the pipeline up to the float32 rounding; 'check' compares the two on a sample of the input.
+    """
+
+    def __init__(self, feature_names_in:list, columns:list, fill_values:np.ndarray,
+                 center:np.ndarray | None, scale:np.ndarray | None):
+        """
+        feature_names_in : input columns of the pipeline
+        columns : columns kept by the imputer, the columns of the output
+        fill_values : fill value of every kept column
+        center, scale : RobustScaler center_ and scale_ of the kept columns; None when not used
+        """
+        self.feature_names_in = list(feature_names_in)
+        self.columns = list(columns)
+        self.fill_values = np.asarray(fill_values, dtype=np.float32)
+        self.center = center
+        self.scale = scale
+
+
+    @classmethod
+    def from_pipeline(cls, pipeline) -> "TransformerKernel":
+        """Exports a fitted Pipeline of a SimpleImputer step 'Imputer' and a RobustScaler step 'RobustScaler'."""
+        try:
+            if list(pipeline.named_steps) != ["Imputer", "RobustScaler"]:
+                raise Exception(f"Only an Imputer and RobustScaler pipeline can be exported, found : {list(pipeline.named_steps)}")
+            simple_imputer = pipeline.named_steps["Imputer"]
+            robust_scaler = pipeline.named_steps["RobustScaler"]
+
+            # the imputer drops the columns without any value in the training data
+            is_kept = ~pd.isnull(simple_imputer.statistics_)
+            feature_names_in = list(pipeline.feature_names_in_)
+            return cls(feature_names_in=feature_names_in,
+                       columns=[column for column, kept in zip(feature_names_in, is_kept) if kept],
+                       fill_values=simple_imputer.statistics_[is_kept].astype(np.float32),
+                       center=robust_scaler.center_ if robust_scaler.with_centering else None,
+                       scale=robust_scaler.scale_ if robust_scaler.with_scaling else None)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def transform_in_place(self, block:np.ndarray) -> np.ndarray:
+        """Transforms 'block', a float32 array of shape (n_rows, len(columns)), in place."""
+        try:
+            np.copyto(block, self.fill_values, where=np.isnan(block))
+            if self.center is not None:
+                block -= self.center
+            if self.scale is not None:
+                block /= self.scale
+            return block
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def transform(self, df:pd.DataFrame) -> np.ndarray:
+        """Same as Pipeline.transform of a dataframe holding at least the 'columns', as float32.
+        Only the kept columns are read, with one copy into a new float32 block : a frame of a
+        single float32 block would otherwise give a view of its own data."""
+        try:
+            return self.transform_in_place(df[self.columns].to_numpy(dtype=np.float32, copy=True))
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def check(self, pipeline, df:pd.DataFrame, n_rows:int = 1000, rtol:float = 1e-5, atol:float = 1e-6) -> bool:
+        """Returns whether the output on the first 'n_rows' rows of 'df' matches the output of
+        'pipeline', the pipeline the kernel was exported from, within float tolerance; False
+        when either of them fails on the sample."""
+        try:
+            sample_df = df[self.feature_names_in].iloc[:n_rows]
+            kernel_output, pipeline_output = self.transform(sample_df), pipeline.transform(sample_df)
+        except Exception as e:
+            logging.info(f"The transformer kernel is not checked : {e}")
+            return False
+        return bool(kernel_output.shape == pipeline_output.shape and
+                    np.allclose(kernel_output, pipeline_output, rtol=rtol, atol=atol, equal_nan=True))
+
+
+def get_transform_function(pipeline, check_df:pd.DataFrame | None = None):
+    """Returns the 'transform' of the TransformerKernel exported from 'pipeline', or
+    'pipeline.transform' when the pipeline cannot be exported. With 'check_df', the kernel is
+    first checked on its first rows, and the pipeline is used when the outputs differ."""
+    try:
+        try:
+            kernel = TransformerKernel.from_pipeline(pipeline)
+        except SensorException as e:
+            logging.info(f"The transformer is not exported as a kernel : {e}")
+            return pipeline.transform
+        if check_df is not None and not kernel.check(pipeline, check_df):
+            logging.info(f"The transformer kernel output does not match the pipeline, using the pipeline.")
+            return pipeline.transform
+        return kernel.transform
+    except Exception as e:
+        raise SensorException(e, sys)
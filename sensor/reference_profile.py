@@ -0,0 +1,192 @@
+import os
+import sys
+import hashlib
+import numpy as np
+import pandas as pd
+from scipy.stats import ks_2samp
+from sensor.drift import NAN_SORT_KEY, float32_sort_keys, float32_from_sort_keys, ks_2samp_sort_keys
+from sensor.sketch import ColumnSketch
+from sensor.logger import logging
+from sensor import utils
+from sensor.exception import SensorException
+
+
+# bump when the content of the profile file changes so that older profiles get rebuilt
+PROFILE_VERSION = 1
+
+
+class ReferenceProfile:
+    """Statistics of the validation base file which the train and test data are compared with.
+
+    The profile holds the fraction of null values of every column, the sorted keys of every
+    float32 column (see sensor.drift.float32_sort_keys), which is all the KS test needs from the
+    base data, and the raw values of the few other columns, e.g. the target. It is saved in a
+    single .npz file named after the sha256 of the base file, so it is built again only when the
+    content of the base file changes.
+    """
+
+    def __init__(self, base_file_path:str, profile_dir:str | None = None):
+        """
+        base_file_path : csv file the profile is built from
+        profile_dir : directory of the saved profiles; None builds the profile on every run
+        """
+        self.base_file_path = base_file_path
+        self.profile_dir = profile_dir
+        self.columns = None
+        self.null_percent = None
+        self.key_columns = None
+        self.sort_keys = None
+        self.other_df = None
+
+
+    def get_file_hash(self) -> str:
+        """Returns the sha256 of the content of the base file, read in blocks of 1 MB."""
+        try:
+            file_hash = hashlib.sha256()
+            with open(self.base_file_path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    file_hash.update(block)
+            return file_hash.hexdigest()
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get_profile_path(self, file_hash:str) -> str:
+        return os.path.join(self.profile_dir, f"{file_hash}-v{PROFILE_VERSION}.npz")
+
+
+    def load(self) -> None:
+        """Loads the saved profile of the base file, or builds it from the base file and saves it."""
+        try:
+            if self.profile_dir is None:
+                self.build(utils.read_sensor_csv(self.base_file_path))
+                return
+
+            profile_path = self.get_profile_path(self.get_file_hash())
+            if os.path.exists(profile_path):
+                logging.info(f"Loading the reference profile : {profile_path}")
+                with np.load(profile_path, allow_pickle=False) as profile:
+                    self.columns = profile["columns"].tolist()
+                    self.null_percent = pd.Series(profile["null_percent"], index=self.columns)
+                    self.key_columns = profile["key_columns"].tolist()
+                    self.sort_keys = profile["sort_keys"]
+                    other_columns = profile["other_columns"].tolist()
+                    other_values = profile["other_values"].astype(object)
+                    other_values[profile["other_nulls"]] = np.nan
+                    self.other_df = pd.DataFrame(dict(zip(other_columns, other_values)), columns=other_columns)
+                return
+
+            logging.info(f"No reference profile found for {self.base_file_path}, building it...")
+            self.build(utils.read_sensor_csv(self.base_file_path))
+            self.save(profile_path)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def build(self, base_df:pd.DataFrame) -> None:
+        """Computes the profile of 'base_df'."""
+        try:
+            self.columns = list(base_df.columns)
+            self.null_percent = base_df.isnull().sum() / base_df.shape[0]
+            self.key_columns = [column for column in self.columns if base_df[column].dtype == np.float32]
+            self.sort_keys = np.sort(float32_sort_keys(base_df[self.key_columns].to_numpy()), axis=1)
+            self.other_df = base_df[[column for column in self.columns if column not in self.key_columns]].copy()
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def save(self, profile_path:str) -> None:
+        """Writes the profile to 'profile_path'; the file is replaced atomically."""
+        try:
+            os.makedirs(os.path.dirname(profile_path), exist_ok=True)
+            other_nulls = self.other_df.isnull().to_numpy().T
+            other_values = self.other_df.astype(str).to_numpy(dtype=str).T
+
+            tmp_profile_path = f"{profile_path}.tmp"
+            with open(tmp_profile_path, "wb") as f:
+                np.savez(f, columns=np.array(self.columns, dtype=str),
+                         null_percent=self.null_percent.to_numpy(),
+                         key_columns=np.array(self.key_columns, dtype=str),
+                         sort_keys=self.sort_keys,
+                         other_columns=np.array(self.other_df.columns, dtype=str),
+                         other_values=other_values, other_nulls=other_nulls)
+            os.replace(tmp_profile_path, profile_path)
+            logging.info(f"Reference profile saved to : {profile_path}")
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get_sort_keys(self, columns:list) -> np.ndarray:
+        """Returns the sorted keys of the float32 'columns', one row per column."""
+        try:
+            positions = {column : position for position, column in enumerate(self.key_columns)}
+            return self.sort_keys[[positions[column] for column in columns]]
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def drift_pvalues(self, current_df:pd.DataFrame, columns:list) -> dict:
+        """Returns the ks_2samp p-value of every column of 'columns' in 'current_df' against the
+        same column of the base data, NaN values left out.
+
+        Args:
+            current_df (pd.DataFrame): data compared with the base data
+            columns (list): columns of the base data to test; all of them must be in 'current_df'
+
+        Returns:
+            dict: p-value of every column
+        """
+        try:
+            # the keys are only comparable with float32 values, other columns are tested by ks_2samp
+            key_columns = [column for column in columns
+                           if column in self.key_columns and current_df[column].dtype == np.float32]
+            pvalues = dict()
+            if len(key_columns) > 0:
+                _, key_pvalues = ks_2samp_sort_keys(self.get_sort_keys(key_columns),
+                                                    float32_sort_keys(current_df[key_columns].to_numpy()))
+                pvalues = dict(zip(key_columns, key_pvalues))
+
+            for column in columns:
+                if column not in pvalues:
+                    # null hypothesis : both data samples are having the same distribution
+                    base_data = self.other_df[column] if column in self.other_df.columns \
+                        else self.get_values(column)
+                    pvalues[column] = ks_2samp(base_data.dropna(), current_df[column].dropna()).pvalue
+            return pvalues
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get_values(self, column:str) -> pd.Series:
+        """Returns the sorted non null values of a float32 column, decoded from its keys."""
+        try:
+            keys = self.get_sort_keys([column])[0]
+            return pd.Series(float32_from_sort_keys(keys[keys != NAN_SORT_KEY]))
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get_sketch(self, relative_accuracy:float = 0.01, n_columns_per_block:int = 16) -> ColumnSketch:
+        """Returns a ColumnSketch of the base data. The float32 values are decoded from the sort
+        keys a block of columns at a time."""
+        try:
+            other_columns = list(self.other_df.columns)
+            sketch = ColumnSketch(self.key_columns, other_columns, relative_accuracy=relative_accuracy)
+            for start in range(0, len(self.key_columns), n_columns_per_block):
+                block = slice(start, min(start + n_columns_per_block, len(self.key_columns)))
+                block_sketch = ColumnSketch(self.key_columns[block], relative_accuracy=relative_accuracy)
+                block_sketch.update(pd.DataFrame(float32_from_sort_keys(self.sort_keys[block]).T,
+                                                 columns=block_sketch.numeric_columns))
+                sketch.counts[block] = block_sketch.counts
+                sketch.bin_min[block] = block_sketch.bin_min
+                sketch.bin_max[block] = block_sketch.bin_max
+                sketch.null_counts[block] = block_sketch.null_counts
+
+            other_sketch = ColumnSketch([], other_columns, relative_accuracy=relative_accuracy)
+            other_sketch.update(self.other_df)
+            sketch.null_counts[len(self.key_columns):] = other_sketch.null_counts
+            sketch.value_counts = other_sketch.value_counts
+            sketch.n_rows = self.sort_keys.shape[1]
+            return sketch
+        except Exception as e:
+            raise SensorException(e, sys)
@@ -0,0 +1,180 @@
+import sys
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from scipy.spatial import cKDTree
+from sensor.exception import SensorException
+
+
+# bytes of the float32 distance matrices computed at the same time by all the threads of
+# 'nearest_neighbors', which sizes the chunks of query samples
+DISTANCE_MEMORY_BUDGET = 256 * 2**20
+
+
+def get_query_chunk_size(n_samples:int, n_jobs:int = 1, memory_budget:int = DISTANCE_MEMORY_BUDGET) -> int:
+    """Returns the query samples per chunk of 'nearest_neighbors' so that the float32 distance
+    matrices of 'n_jobs' chunks to 'n_samples' samples fit in 'memory_budget' bytes."""
+    try:
+        return max(1, memory_budget // (4 * n_samples * max(1, n_jobs)))
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def nearest_neighbors(X:np.ndarray, query:np.ndarray, chunk_size:int | None = None, n_jobs:int = 1,
+                      memory_budget:int = DISTANCE_MEMORY_BUDGET) -> np.ndarray:
+    """Exact nearest neighbour, other than itself, of every sample of 'query' among all the
+    samples of 'X'. The squared distances |a|^2 + |b|^2 - 2 a.b of a chunk of 'chunk_size'
+    query samples to all the samples are one float32 matrix product, and 'n_jobs' chunks are
+    computed at the same time by threads, as numpy releases the GIL in the product. By default
+    the chunks are sized so that the 'n_jobs' distance matrices fit in 'memory_budget' bytes.
+
+    Args:
+        X (np.ndarray): 2D array of shape (n_samples, n_features)
+        query (np.ndarray): positions in 'X' of the samples to search for
+        chunk_size (int, optional): query samples per matrix product, from 'memory_budget' if None
+        n_jobs (int): number of threads
+        memory_budget (int): bytes of the distance matrices of all the threads
+
+    Returns:
+        np.ndarray: position in 'X' of the nearest neighbour of every query sample
+    """
+    try:
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        squared_norms = np.einsum("ij,ij->i", X, X)
+        neighbors = np.empty(query.shape[0], dtype=np.int64)
+        if chunk_size is None:
+            chunk_size = get_query_chunk_size(X.shape[0], n_jobs, memory_budget)
+
+        def search(start:int) -> None:
+            rows = query[start:start + chunk_size]
+            distances = X[rows] @ X.T
+            distances *= -2
+            distances += squared_norms
+            distances += squared_norms[rows, None]
+            distances[np.arange(rows.shape[0]), rows] = np.inf
+            neighbors[start:start + chunk_size] = distances.argmin(axis=1)
+
+        starts = range(0, query.shape[0], chunk_size)
+        if n_jobs > 1:
+            with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                list(executor.map(search, starts))
+        else:
+            for start in starts:
+                search(start)
+        return neighbors
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def approximate_nearest_neighbors(X:np.ndarray, query:np.ndarray, n_candidates:int = 10, n_components:int = 16,
+                                  n_jobs:int = 1, random_state:int = 42) -> np.ndarray:
+    """Approximate version of 'nearest_neighbors' : the 'n_candidates' nearest samples are found
+    with a KD-tree on the 'n_components' first principal components, then ranked by their exact
+    distance. The cost grows about as n log n instead of n^2, but the true nearest neighbour is
+    missed when it is not among the candidates.
+
+    Returns:
+        np.ndarray: position in 'X' of the nearest neighbour found for every query sample
+    """
+    try:
+        X = np.asarray(X, dtype=np.float32)
+        n_components = min(n_components, X.shape[1])
+        mean = X.mean(axis=0)
+        # principal components of a sample of the data
+        sample = np.random.default_rng(random_state).choice(X.shape[0], min(X.shape[0], 20000), replace=False)
+        _, _, components = np.linalg.svd(X[sample] - mean, full_matrices=False)
+        projected = (X - mean) @ components[:n_components].T
+
+        n_candidates = min(n_candidates + 1, X.shape[0])
+        _, candidates = cKDTree(projected).query(projected[query], k=n_candidates, workers=n_jobs)
+        candidates = candidates.reshape(query.shape[0], n_candidates)
+
+        differences = X[candidates] - X[query][:, None, :]
+        distances = np.einsum("ijk,ijk->ij", differences, differences)
+        distances[candidates == query[:, None]] = np.inf
+        return candidates[np.arange(query.shape[0]), distances.argmin(axis=1)]
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def tomek_links(X:np.ndarray, y:np.ndarray, approximate:bool = False, chunk_size:int | None = None,
+                n_jobs:int = 1) -> np.ndarray:
+    """Finds the samples in a Tomek link, i.e. a pair of samples of different classes which are
+    each other's nearest neighbour, as TomekLinks(sampling_strategy="all").
+
+    With two classes, every link holds a sample of the smallest class, so only the samples of
+    that class and the few samples of the other class they point to are searched for, instead of
+    all of them. After SMOTE has filled the minority class the two classes are about the same
+    size, so this saves about half of the search. Ties between equally distant neighbours may
+    be broken differently than by scikit-learn.
+
+    Args:
+        X (np.ndarray): 2D array of shape (n_samples, n_features)
+        y (np.ndarray): class of every sample
+        approximate (bool): use 'approximate_nearest_neighbors'
+        chunk_size (int, optional): query samples per matrix product of the exact search, see 'nearest_neighbors'
+        n_jobs (int): number of threads
+
+    Returns:
+        np.ndarray: boolean mask of the samples to remove
+    """
+    try:
+        def search(query:np.ndarray) -> np.ndarray:
+            if approximate:
+                return approximate_nearest_neighbors(X, query, n_jobs=n_jobs)
+            return nearest_neighbors(X, query, chunk_size=chunk_size, n_jobs=n_jobs)
+
+        classes, counts = np.unique(y, return_counts=True)
+        if classes.shape[0] == 2:
+            query = np.flatnonzero(y == classes[counts.argmin()])
+        else:
+            query = np.arange(y.shape[0])
+
+        neighbors = np.full(y.shape[0], -1, dtype=np.int64)
+        neighbors[query] = search(query)
+        # the other samples which may be in a link : the neighbours of another class
+        candidates = np.unique(neighbors[query][y[neighbors[query]] != y[query]])
+        candidates = candidates[neighbors[candidates] < 0]
+        if candidates.shape[0] > 0:
+            neighbors[candidates] = search(candidates)
+
+        is_link = np.zeros(y.shape[0], dtype=bool)
+        is_link[query] = (y[neighbors[query]] != y[query]) & (neighbors[neighbors[query]] == query)
+        is_link[neighbors[is_link]] = True
+        return is_link
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+class Resampler:
+    """Same resampling as imblearn's SMOTETomek : the samples of 'smote' are added, then the
+    samples in a Tomek link are removed, found by 'tomek_links' instead of a nearest neighbour
+    search over all the samples."""
+
+    def __init__(self, smote, remove_tomek_links:bool = True, approximate_neighbors:bool = False,
+                 chunk_size:int | None = None, n_jobs:int = 1):
+        """
+        smote : imblearn over-sampler, e.g. SMOTE; None adds no sample
+        remove_tomek_links : remove the samples in a Tomek link after the over-sampling
+        approximate_neighbors : approximate nearest neighbour search for the Tomek links
+        chunk_size : query samples per matrix product of the exact search, None to size them
+                     from DISTANCE_MEMORY_BUDGET
+        n_jobs : number of threads of the nearest neighbour search
+        """
+        self.smote = smote
+        self.remove_tomek_links = remove_tomek_links
+        self.approximate_neighbors = approximate_neighbors
+        self.chunk_size = chunk_size
+        self.n_jobs = n_jobs
+
+
+    def fit_resample(self, X:np.ndarray, y:np.ndarray) -> tuple:
+        try:
+            if self.smote is not None:
+                X, y = self.smote.fit_resample(X, y)
+            if self.remove_tomek_links:
+                is_link = tomek_links(X, y, approximate=self.approximate_neighbors,
+                                      chunk_size=self.chunk_size, n_jobs=self.n_jobs)
+                X, y = X[~is_link], y[~is_link]
+            return X, y
+        except Exception as e:
+            raise SensorException(e, sys)
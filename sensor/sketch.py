@@ -0,0 +1,243 @@
+import sys
+import numpy as np
+import pandas as pd
+from sensor.drift import ks_pvalues
+from sensor.exception import SensorException
+
+
+# number of values counted at once by 'ColumnSketch.update'
+BLOCK_VALUES = 1 << 20
+
+
+class ColumnSketch:
+    """Mergeable, fixed size summary of every column of a dataset, built in one pass over chunks.
+
+    Numeric columns are counted in log spaced bins, as in DDSketch : a positive value x falls
+    in bin i when min_value * gamma ** (i - 1) < x <= min_value * gamma ** i, with
+    gamma = (1 + relative_accuracy) / (1 - relative_accuracy), negative values in the mirrored
+    bins and zero in a bin of its own. Any quantile read from the bins is within
+    'relative_accuracy' of a value of the data, values beyond 'min_value' and 'max_value' being
+    counted in the first and last bins. The bins are the same for every sketch with the same
+    settings, so sketches are merged by adding their counts, in any order, and memory does not
+    depend on the number of rows. The smallest and largest value of every bin are kept as well.
+    The other columns, e.g. the target, keep the count of every distinct value. Null values are
+    counted apart.
+
+    KS statistics computed from two sketches are evaluated at the bin edges only, so with p1
+    and p2 the fractions of the two samples in a bin :
+        D(sketch) <= D(exact) <= D(sketch) + max over the bins of max(p1, p2)
+    where the bins holding a single value in both samples, e.g. zero or a small integer, are
+    left out since the CDFs do not change inside them. The bound is returned with every
+    statistic; it is 0 for the columns counted by value.
+    """
+
+    def __init__(self, numeric_columns:list, other_columns:list | None = None, relative_accuracy:float = 0.01,
+                 min_value:float = 1e-6, max_value:float = 1e12):
+        """
+        numeric_columns : columns counted in log spaced bins
+        other_columns : columns counted by distinct value
+        relative_accuracy : relative width of the bins
+        min_value, max_value : smallest and largest absolute values with bins of their own
+        """
+        try:
+            self.numeric_columns = list(numeric_columns)
+            self.other_columns = list(other_columns or [])
+            self.relative_accuracy = relative_accuracy
+            self.min_value = min_value
+            self.max_value = max_value
+
+            self.log_gamma = np.log((1 + relative_accuracy) / (1 - relative_accuracy))
+            self.n_magnitudes = int(np.ceil(np.log(max_value / min_value) / self.log_gamma)) + 1
+            self.zero_bin = self.n_magnitudes
+            self.n_bins = 2 * self.n_magnitudes + 1
+
+            self.n_rows = 0
+            self.counts = np.zeros((len(self.numeric_columns), self.n_bins), dtype=np.int64)
+            self.bin_min = np.full(self.counts.shape, np.inf)
+            self.bin_max = np.full(self.counts.shape, -np.inf)
+            self.null_counts = np.zeros(len(self.numeric_columns) + len(self.other_columns), dtype=np.int64)
+            self.value_counts = {column : dict() for column in self.other_columns}
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def __getstate__(self) -> dict:
+        """Pickles only the bins holding values : most of the bins of a column are empty, so the
+        saved sketch is a small fraction of the size of the dense arrays."""
+        state = self.__dict__.copy()
+        positions = np.flatnonzero(self.counts)
+        state["bin_positions"] = positions
+        for name in ["counts", "bin_min", "bin_max"]:
+            state[name] = getattr(self, name).reshape(-1)[positions]
+        return state
+
+
+    def __setstate__(self, state:dict) -> None:
+        if "bin_positions" in state:
+            positions = state.pop("bin_positions")
+            shape = (len(state["numeric_columns"]), state["n_bins"])
+            for name, fill_value, dtype in [("counts", 0, np.int64), ("bin_min", np.inf, np.float64),
+                                            ("bin_max", -np.inf, np.float64)]:
+                values = np.full(shape, fill_value, dtype=dtype)
+                values.reshape(-1)[positions] = state[name]
+                state[name] = values
+        self.__dict__.update(state)
+
+
+    def get_bins(self, values:np.ndarray) -> np.ndarray:
+        """Returns the bin of every non null value; null values get -1."""
+        try:
+            values = np.asarray(values, dtype=np.float64)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                magnitudes = np.ceil(np.log(np.abs(values) / self.min_value) / self.log_gamma)
+            magnitudes = np.clip(np.nan_to_num(magnitudes, nan=0.0, posinf=self.n_magnitudes, neginf=0.0),
+                                 0, self.n_magnitudes - 1).astype(np.int64)
+
+            bins = np.where(values > 0, self.zero_bin + 1 + magnitudes, self.zero_bin - 1 - magnitudes)
+            bins[values == 0] = self.zero_bin
+            bins[np.isnan(values)] = -1
+            return bins
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def update(self, df:pd.DataFrame) -> None:
+        """Adds the rows of 'df', which holds at least the columns of the sketch."""
+        try:
+            if len(self.numeric_columns) > 0:
+                # the rows are counted a block at a time, so the float64 copies made while counting
+                # stay small whatever the size of 'df'
+                numeric_df = df[self.numeric_columns]
+                block_size = max(1, BLOCK_VALUES // len(self.numeric_columns))
+                for start in range(0, df.shape[0], block_size):
+                    values = numeric_df.iloc[start:start + block_size].to_numpy(dtype=np.float64).T
+                    bins = self.get_bins(values)
+                    is_null = bins < 0
+                    # one bincount for all the columns : the bins of column j start at j * n_bins
+                    bins = (bins + (np.arange(bins.shape[0]) * self.n_bins)[:, None])[~is_null]
+                    values = values[~is_null]
+                    self.counts += np.bincount(bins, minlength=self.counts.size).reshape(self.counts.shape)
+                    np.minimum.at(self.bin_min.reshape(-1), bins, values)
+                    np.maximum.at(self.bin_max.reshape(-1), bins, values)
+                    self.null_counts[:len(self.numeric_columns)] += is_null.sum(axis=1)
+
+            for position, column in enumerate(self.other_columns, start=len(self.numeric_columns)):
+                values = df[column]
+                self.null_counts[position] += values.isnull().sum()
+                for value, count in values.dropna().astype(str).value_counts().items():
+                    self.value_counts[column][value] = self.value_counts[column].get(value, 0) + int(count)
+
+            self.n_rows += df.shape[0]
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def merge(self, other:"ColumnSketch") -> None:
+        """Adds the counts of 'other', a sketch of other rows with the same columns and settings."""
+        try:
+            if (other.numeric_columns != self.numeric_columns or other.other_columns != self.other_columns
+                    or other.n_bins != self.n_bins or other.log_gamma != self.log_gamma):
+                raise Exception("Only sketches with the same columns and settings can be merged.")
+
+            self.counts += other.counts
+            np.minimum(self.bin_min, other.bin_min, out=self.bin_min)
+            np.maximum(self.bin_max, other.bin_max, out=self.bin_max)
+            self.null_counts += other.null_counts
+            for column, value_counts in other.value_counts.items():
+                for value, count in value_counts.items():
+                    self.value_counts[column][value] = self.value_counts[column].get(value, 0) + count
+            self.n_rows += other.n_rows
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get_null_percent(self) -> pd.Series:
+        """Returns the fraction of null values of every column."""
+        try:
+            return pd.Series(self.null_counts / self.n_rows, index=self.numeric_columns + self.other_columns)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def compare(self, current:"ColumnSketch", columns:list, n_psi_buckets:int = 10) -> dict:
+        """Compares every column of 'columns' of this sketch, the base data, with the same column
+        of 'current'. A column counted in bins in one sketch must be counted in bins in the other.
+
+        The population stability index uses 'n_psi_buckets' buckets holding about the same
+        number of base values, made of whole bins; empty buckets count as 0.01 % of the values.
+
+        Returns:
+            dict: for every column, {"ks_statistic", "ks_statistic_error", "pvalue", "psi"}
+        """
+        try:
+            numeric_columns = [column for column in columns if column in self.numeric_columns]
+            base_positions = [self.numeric_columns.index(column) for column in numeric_columns]
+            current_positions = [current.numeric_columns.index(column) for column in numeric_columns]
+            base_counts, current_counts = self.counts[base_positions], current.counts[current_positions]
+            if current.n_bins != self.n_bins or current.log_gamma != self.log_gamma:
+                raise Exception("Only sketches with the same settings can be compared.")
+
+            statistics, psi = self.compare_counts(base_counts, current_counts, n_psi_buckets)
+            n1, n2 = base_counts.sum(axis=1), current_counts.sum(axis=1)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                fractions = np.maximum(base_counts / n1[:, None], current_counts / n2[:, None])
+            # the bins holding a single value add nothing to the error bound
+            is_single_value = (np.minimum(self.bin_min[base_positions], current.bin_min[current_positions])
+                               == np.maximum(self.bin_max[base_positions], current.bin_max[current_positions]))
+            fractions[is_single_value] = 0
+            errors = np.nan_to_num(fractions).max(axis=1, initial=0)
+
+            # the columns counted by value : the sorted distinct values are the bins, D is exact
+            other_columns = [column for column in columns if column not in numeric_columns]
+            for column in other_columns:
+                values = sorted(set(self.value_counts[column]) | set(current.value_counts[column]))
+                counts = np.array([[self.value_counts[column].get(value, 0) for value in values],
+                                   [current.value_counts[column].get(value, 0) for value in values]], dtype=np.int64)
+                other_statistics, other_psi = self.compare_counts(counts[:1], counts[1:], n_psi_buckets)
+                statistics, psi = np.append(statistics, other_statistics), np.append(psi, other_psi)
+                errors = np.append(errors, 0.0)
+                n1, n2 = np.append(n1, counts[0].sum()), np.append(n2, counts[1].sum())
+
+            statistics, pvalues = ks_pvalues(statistics, n1, n2)
+            comparison = dict()
+            for position, column in enumerate(numeric_columns + other_columns):
+                comparison[column] = {
+                    "ks_statistic" : float(statistics[position]),
+                    "ks_statistic_error" : float(errors[position]),
+                    "pvalue" : float(pvalues[position]),
+                    "psi" : float(psi[position]),
+                }
+            return comparison
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def compare_counts(self, base_counts:np.ndarray, current_counts:np.ndarray, n_psi_buckets:int) -> tuple:
+        """KS statistic at the bin edges and population stability index of rows of bin counts.
+
+        Returns:
+            tuple: (statistics, psi), 1D arrays with one value per row
+        """
+        try:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                base_cdf = np.cumsum(base_counts, axis=1) / base_counts.sum(axis=1)[:, None]
+                current_cdf = np.cumsum(current_counts, axis=1) / current_counts.sum(axis=1)[:, None]
+            statistics = np.abs(base_cdf - current_cdf).max(axis=1, initial=0)
+
+            # bucket of every bin : number of base deciles (for 10 buckets) below the bin
+            buckets = np.minimum((np.nan_to_num(base_cdf) * n_psi_buckets).astype(np.int64), n_psi_buckets - 1)
+            rows = np.repeat(np.arange(base_counts.shape[0]), base_counts.shape[1])
+            flat_buckets = (rows * n_psi_buckets + buckets.ravel())
+            size = base_counts.shape[0] * n_psi_buckets
+            base_buckets = np.bincount(flat_buckets, weights=base_counts.ravel(), minlength=size)
+            current_buckets = np.bincount(flat_buckets, weights=current_counts.ravel(), minlength=size)
+            base_buckets = base_buckets.reshape(-1, n_psi_buckets)
+            current_buckets = current_buckets.reshape(-1, n_psi_buckets)
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                base_p = np.maximum(base_buckets / base_buckets.sum(axis=1, keepdims=True), 1e-4)
+                current_p = np.maximum(current_buckets / current_buckets.sum(axis=1, keepdims=True), 1e-4)
+            psi = ((current_p - base_p) * np.log(current_p / base_p)).sum(axis=1)
+            return statistics, psi
+        except Exception as e:
+            raise SensorException(e, sys)
@@ -0,0 +1,172 @@
+import os
+import sys
+import json
+import time
+import hashlib
+from sensor.logger import logging
+from sensor import utils
+from sensor.exception import SensorException
+
+
+# bump when a stage changes in a way its config does not show, so that older entries are not reused
+STAGE_CACHE_VERSION = 4
+RUN_MANIFEST_FILE_NAME = "run_manifest.yaml"
+
+
+def get_fingerprint(stage:str, config, artifact_dir:str, inputs:list | None = None) -> str:
+    """Returns the sha256 of the name of a stage, of its config and of its inputs, e.g. the
+    fingerprints of the stages it reads from. The directory of the run is left out of the
+    paths of the config, so the same stage of two runs has the same fingerprint.
+
+    Args:
+        stage (str): name of the stage
+        config : config object of the stage
+        artifact_dir (str): artifact directory of the run
+        inputs (list, optional): anything else the outputs depend on, serializable as json
+    """
+    try:
+        settings = json.dumps(vars(config), sort_keys=True, default=str).replace(artifact_dir, "")
+        key = hashlib.sha256(f"v{STAGE_CACHE_VERSION}".encode())
+        for part in [stage, settings, json.dumps(inputs or [], sort_keys=True, default=str)]:
+            key.update(part.encode())
+            key.update(b"\0")
+        return key.hexdigest()
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def get_file_fingerprint(file_path:str | None) -> dict | None:
+    """Returns the path, size and modification time of a file, None if there is no such file."""
+    if file_path is None or not os.path.exists(file_path):
+        return None
+    stat = os.stat(file_path)
+    return {"path" : os.path.realpath(file_path), "size" : stat.st_size, "mtime_ns" : stat.st_mtime_ns}
+
+
+class PipelineRun:
+    """Runs the stages of a training pipeline run, skipping the ones already completed with the
+    same fingerprint, see 'get_fingerprint'.
+
+    A stage is reused from :
+    - the manifest of the run itself, when a run is resumed by its id : the completed stages
+      are skipped and the pipeline goes on from the first stage which failed or changed;
+    - the stage cache, shared by all the runs, which maps a fingerprint to the artifact of the
+      run which completed it, e.g. an earlier attempt of a retried pipeline.
+
+    The artifact of a reused stage is the one of the run which produced it, so its files are
+    read where they are; an entry whose files were deleted is a miss. The run manifest lists
+    every stage with its fingerprint, status ("completed", "resumed", "cache_hit" or
+    "failed"), the run its artifact comes from and its time, and is rewritten after every
+    stage, so it is complete even when the run fails.
+    """
+
+    def __init__(self, run_id:str, artifact_dir:str, stage_cache_dir:str | None = None, resume:bool = False):
+        """
+        run_id : id of the run, the name of its artifact directory
+        artifact_dir : artifact directory of the run
+        stage_cache_dir : directory of the stage cache; None to reuse the stages of the resumed run only
+        resume : if True, the stages completed by an earlier attempt of this run are reused
+        """
+        try:
+            self.run_id = run_id
+            self.artifact_dir = artifact_dir
+            self.stage_cache_dir = stage_cache_dir
+            self.manifest_path = os.path.join(artifact_dir, RUN_MANIFEST_FILE_NAME)
+
+            self.previous_stages = dict()
+            if resume:
+                if not os.path.exists(self.manifest_path):
+                    raise Exception(f"No run to resume : {self.manifest_path} not found.")
+                self.previous_stages = {stage["stage"] : stage
+                                        for stage in utils.read_yaml_file(self.manifest_path)["stages"]}
+                logging.info(f"Resuming run {run_id}, stages of the earlier attempt : {list(self.previous_stages)}")
+            self.manifest = {"run_id" : run_id, "resumed" : resume, "stages" : []}
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get_artifact_path(self, stage:str) -> str:
+        return os.path.join(self.artifact_dir, "stages", f"{stage}.pkl")
+
+
+    def get_cache_entry_path(self, stage:str, fingerprint:str) -> str:
+        return os.path.join(self.stage_cache_dir, stage, f"{fingerprint}.pkl")
+
+
+    @staticmethod
+    def load_artifact(file_path:str):
+        """Returns the artifact saved at 'file_path', None if there is none or a file it names is missing."""
+        try:
+            if not os.path.exists(file_path):
+                return None
+            artifact = utils.load_object(file_path=file_path)
+            for value in vars(artifact).values():
+                if isinstance(value, str) and os.path.isabs(value) and not os.path.exists(value):
+                    logging.info(f"{file_path} is not reused, {value} was deleted")
+                    return None
+            return artifact
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def find_artifact(self, stage:str, fingerprint:str) -> tuple:
+        """Returns the artifact of an earlier completion of 'stage' with 'fingerprint', its status
+        and the id of the run which produced it; (None, None, None) if there is none."""
+        try:
+            previous = self.previous_stages.get(stage)
+            if previous is not None and previous["fingerprint"] == fingerprint and previous["status"] != "failed":
+                artifact = self.load_artifact(previous["artifact_path"])
+                if artifact is not None:
+                    return artifact, "resumed", previous["source_run_id"]
+            if self.stage_cache_dir is not None:
+                entry_path = self.get_cache_entry_path(stage, fingerprint)
+                artifact = self.load_artifact(entry_path)
+                if artifact is not None:
+                    return artifact, "cache_hit", utils.read_yaml_file(f"{entry_path}.yaml")["run_id"]
+            return None, None, None
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def write_manifest(self) -> None:
+        utils.write_yaml_file(file_path=self.manifest_path, data=self.manifest)
+
+
+    def run_stage(self, stage:str, run_function, fingerprint:str | None = None):
+        """Returns the artifact of 'stage' : the one of an earlier completion with the same
+        fingerprint if any, else the one returned by 'run_function', which is then saved to the
+        stage cache. A stage without a fingerprint, e.g. one reading or writing the model
+        registry, always runs."""
+        try:
+            start_time = time.perf_counter()
+            record = {"stage" : stage, "fingerprint" : fingerprint, "status" : "completed",
+                      "source_run_id" : self.run_id, "artifact_path" : self.get_artifact_path(stage)}
+            self.manifest["stages"].append(record)
+
+            artifact = None
+            if fingerprint is not None:
+                artifact, status, source_run_id = self.find_artifact(stage, fingerprint)
+                if artifact is not None:
+                    record.update(status=status, source_run_id=source_run_id)
+                    logging.info(f"Stage {stage} skipped ({status}), artifact of run {source_run_id} reused.")
+
+            if artifact is None:
+                try:
+                    artifact = run_function()
+                except Exception:
+                    record.update(status="failed", seconds=time.perf_counter() - start_time)
+                    self.write_manifest()
+                    raise
+
+            utils.save_object(file_path=record["artifact_path"], obj=artifact)
+            if fingerprint is not None and self.stage_cache_dir is not None and record["status"] == "completed":
+                entry_path = self.get_cache_entry_path(stage, fingerprint)
+                # the artifact is written last, an entry is only read once it is there
+                utils.write_yaml_file(file_path=f"{entry_path}.yaml", data={"run_id" : self.run_id, "stage" : stage})
+                utils.save_object(file_path=entry_path, obj=artifact)
+
+            record["seconds"] = time.perf_counter() - start_time
+            self.write_manifest()
+            return artifact
+        except Exception as e:
+            raise SensorException(e, sys)
@@ -0,0 +1,146 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import numpy as np
+from sensor.feature_store import FeatureStore
+from sensor.stage_cache import get_file_fingerprint
+from sensor.logger import logging
+from sensor import utils
+from sensor.exception import SensorException
+
+
+# bump when the transformation changes in a way the settings do not show, so that older entries are not reused
+TRANSFORMATION_CACHE_VERSION = 4
+
+
+class TransformationCache:
+    """Local cache of the outputs of the data transformation : the fitted transformer, the label
+    encoder, the reference sketch and the transformed arrays. An entry is keyed by the sha256 of
+    the input data and of the transformation settings, so a run on the same data with the same
+    settings, e.g. a retry, reuses the outputs of the earlier run instead of fitting and
+    resampling again. The feature store is identified by its manifest and the files its
+    partitions were committed with, which are never rewritten, so the key does not read the
+    data itself; the train and test index files are hashed.
+
+    Every entry is a directory named after its key. It is written under a temporary name and
+    renamed once complete, so a failed run leaves no entry behind. The files are copied in and
+    out of the cache rather than linked : a run rewriting a restored file in place, e.g. with
+    np.save, would otherwise rewrite the entry too. Entries are evicted least recently used first
+    once there are more than 'max_entries' of them or they take more than 'max_bytes'.
+    """
+
+    def __init__(self, cache_dir:str, max_entries:int = 5, max_bytes:int = 2 << 30):
+        """
+        cache_dir : directory of the cache entries
+        max_entries : largest number of entries kept
+        max_bytes : largest total size of the entries kept
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+
+    def get_key(self, feature_store:FeatureStore, index_paths:list, settings:dict) -> str:
+        """Returns the sha256 of the manifest of the feature store, i.e. its partitions, their
+        row counts and the watermark, of the path, size and modification time of the columnar
+        meta file of every partition, written last when a partition is committed, of the content
+        of the index files and of the settings.
+
+        Args:
+            feature_store (FeatureStore): store holding the input data
+            index_paths (list): index files of the splits written by the data ingestion
+            settings (dict): settings of the transformation, serializable as json
+        """
+        try:
+            key = hashlib.sha256(f"v{TRANSFORMATION_CACHE_VERSION}".encode())
+            key.update(json.dumps(settings, sort_keys=True, default=str).encode())
+            partitions = [get_file_fingerprint(os.path.join(partition_path, utils.COLUMNAR_META_FILE_NAME))
+                          for partition_path in feature_store.get_partition_paths()]
+            key.update(json.dumps([feature_store.read_manifest(), partitions], sort_keys=True, default=str).encode())
+            for file_path in index_paths:
+                key.update(os.path.basename(file_path).encode())
+                with open(file_path, "rb") as f:
+                    for block in iter(lambda: f.read(1 << 20), b""):
+                        key.update(block)
+            return key.hexdigest()
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get_entry_dir(self, key:str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+
+    @staticmethod
+    def copy_file(source_path:str, destination_path:str) -> None:
+        """Copies 'source_path' to a temporary file renamed to 'destination_path', so a file
+        already there, possibly linked elsewhere, is replaced rather than written through."""
+        try:
+            os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+            tmp_path = f"{destination_path}.tmp-{os.getpid()}"
+            shutil.copy2(source_path, tmp_path)
+            os.replace(tmp_path, destination_path)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def restore(self, key:str, file_paths:list) -> bool:
+        """Puts the cached files of 'key' at 'file_paths', matched by file name.
+
+        Returns:
+            bool: False when there is no complete entry for 'key', nothing is restored then
+        """
+        try:
+            entry_dir = self.get_entry_dir(key)
+            source_paths = [os.path.join(entry_dir, os.path.basename(file_path)) for file_path in file_paths]
+            if not all(os.path.exists(source_path) for source_path in source_paths):
+                return False
+
+            for source_path, file_path in zip(source_paths, file_paths):
+                self.copy_file(source_path, file_path)
+            # the modification time of the entry is its last use
+            os.utime(entry_dir)
+            logging.info(f"Transformation outputs restored from the cache : {entry_dir}")
+            return True
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def store(self, key:str, file_paths:list) -> None:
+        """Adds the files at 'file_paths' to the cache under 'key', then evicts the entries over the limits."""
+        try:
+            entry_dir = self.get_entry_dir(key)
+            if not os.path.exists(entry_dir):
+                tmp_entry_dir = f"{entry_dir}.tmp-{os.getpid()}"
+                shutil.rmtree(tmp_entry_dir, ignore_errors=True)
+                for file_path in file_paths:
+                    self.copy_file(file_path, os.path.join(tmp_entry_dir, os.path.basename(file_path)))
+                os.replace(tmp_entry_dir, entry_dir)
+                logging.info(f"Transformation outputs added to the cache : {entry_dir}")
+            self.evict()
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def evict(self) -> None:
+        """Removes the least recently used entries until the cache is within 'max_entries' and 'max_bytes'."""
+        try:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                entry_dir = os.path.join(self.cache_dir, name)
+                if ".tmp-" in name or not os.path.isdir(entry_dir):
+                    continue
+                size = sum(os.path.getsize(os.path.join(entry_dir, file_name)) for file_name in os.listdir(entry_dir))
+                entries.append((os.path.getmtime(entry_dir), size, entry_dir))
+
+            # most recently used first : the entries past the limits are the oldest ones
+            entries.sort(reverse=True)
+            total_sizes = np.cumsum([size for _, size, _ in entries])
+            for position, (_, _, entry_dir) in enumerate(entries):
+                if position >= self.max_entries or (position > 0 and total_sizes[position] > self.max_bytes):
+                    logging.info(f"Evicting the transformation cache entry : {entry_dir}")
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+        except Exception as e:
+            raise SensorException(e, sys)
@@ -0,0 +1,275 @@
+import os
+import sys
+import time
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import xgboost as xgb
+from xgboost.callback import EarlyStopping, TrainingCallback
+from sklearn.metrics import f1_score
+from sensor.logger import logging
+from sensor.xgboost_engine import build_matrix, get_booster_params, predict_labels
+from sensor.exception import SensorException
+
+
+# the first candidate is always XGBClassifier's defaults, so tuning never validates worse than them
+DEFAULT_PARAMS = {"max_depth" : 6, "learning_rate" : 0.3, "subsample" : 1.0, "colsample_bytree" : 1.0,
+                  "min_child_weight" : 1.0, "reg_lambda" : 1.0}
+
+
+def get_fit_params(y:np.ndarray, class_weights:dict | None) -> tuple:
+    """Returns the XGBClassifier parameters and the sample weights of 'class_weights', see
+    DataTransformation.get_class_weights : a binary target is weighted by 'scale_pos_weight'
+    and any other by per sample weights.
+
+    Returns:
+        tuple: (dict of parameters, sample weights or None)
+    """
+    if class_weights is not None and class_weights["scale_pos_weight"] is not None:
+        return {"scale_pos_weight" : class_weights["scale_pos_weight"]}, None
+    if class_weights is not None:
+        classes = np.array(sorted(class_weights["class_weights"]))
+        weights = np.array([class_weights["class_weights"][c] for c in classes])
+        return dict(), weights[np.searchsorted(classes, y)]
+    return dict(), None
+
+
+# boosting rounds at which the trials are compared for pruning
+RUNGS = [10, 30, 90, 270, 810]
+
+
+class _TrialCallback(TrainingCallback):
+    """Stops a trial past the deadline of the search, or when its validation loss at a rung is
+    above the threshold of that rung. The validation loss at every rung is recorded."""
+
+    def __init__(self, deadline:float, rung_thresholds:dict):
+        super().__init__()
+        self.deadline = deadline
+        self.rung_thresholds = rung_thresholds
+        self.rung_losses = dict()
+        self.status = "complete"
+
+    def after_iteration(self, model, epoch:int, evals_log:dict) -> bool:
+        n_rounds = epoch + 1
+        loss = float(evals_log["validation_0"]["logloss"][-1])
+        if n_rounds in RUNGS:
+            self.rung_losses[n_rounds] = loss
+        if time.time() > self.deadline:
+            self.status = "timeout"
+            return True
+        if n_rounds in self.rung_thresholds and loss > self.rung_thresholds[n_rounds]:
+            self.status = "pruned"
+            return True
+        return False
+
+
+def _run_trial(trial:dict) -> dict:
+    """Fits one candidate on the fit rows and scores it on the validation rows. The arrays are
+    memory mapped, so every worker reads the same pages of the page cache, and the quantized
+    matrices of the fit and validation rows are built 'chunk_size' rows at a time, so no worker
+    holds a float copy of its rows."""
+    try:
+        start_time = time.perf_counter()
+        x = np.load(trial["x_path"], mmap_mode="r")
+        y = np.load(trial["y_path"], mmap_mode="r")
+        fit_rows, validation_rows = np.load(trial["fit_index_path"]), np.load(trial["validation_index_path"])
+        chunk_size = trial["chunk_size"]
+
+        params, sample_weight = get_fit_params(y, trial["class_weights"])
+        booster_params = get_booster_params(dict(params, **trial["params"], n_jobs=trial["n_threads"]),
+                                            n_classes=int(np.max(y)) + 1)
+        booster_params["eval_metric"] = "logloss"
+        dfit = build_matrix(x, y, booster_params, rows=fit_rows, sample_weight=sample_weight, chunk_size=chunk_size)
+        dvalidation = build_matrix(x, y, booster_params, rows=validation_rows, chunk_size=chunk_size, ref=dfit)
+        callback = _TrialCallback(trial["deadline"], trial["rung_thresholds"])
+        # early stopping first : xgboost calls no other callback once one stops the training, and
+        # the best iteration of a trial stopped at its first round would not be set
+        booster = xgb.train(booster_params, dfit, num_boost_round=trial["max_estimators"],
+                            evals=[(dvalidation, "validation_0")],
+                            callbacks=[EarlyStopping(rounds=trial["early_stopping_rounds"]), callback], verbose_eval=False)
+        del dfit, dvalidation
+
+        result = {"number" : trial["number"], "params" : trial["params"], "status" : callback.status,
+                  "rung_losses" : callback.rung_losses, "n_rounds" : int(booster.num_boosted_rounds()),
+                  "best_iteration" : int(booster.best_iteration), "validation_loss" : float(booster.best_score),
+                  "validation_f1" : None}
+        if callback.status != "pruned":
+            y_pred = predict_labels(booster, x, rows=validation_rows, chunk_size=chunk_size,
+                                    iteration_range=(0, booster.best_iteration + 1))
+            result["validation_f1"] = float(f1_score(y_true=y[validation_rows], y_pred=y_pred))
+        result["seconds"] = time.perf_counter() - start_time
+        return result
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+class HyperparameterSearch:
+    """Random search of XGBClassifier parameters under a wall clock budget.
+
+    The candidates run on a pool of 'n_jobs' processes, with the cores split evenly between
+    them. Every candidate is fitted on a stratified part of the training rows with early
+    stopping on the validation loss of the other rows, and ranked by its validation F1. The
+    training arrays are .npy files opened memory mapped by every worker, so they are held once
+    by the page cache whatever the number of workers, and read 'chunk_size' rows at a time
+    into the quantized matrices of the native API; only the row indices and the results go
+    through the pool.
+
+    The validation rows are cut from the training arrays as saved, so they must be real rows :
+    with SMOTE resampling they would hold synthetic ones, and ModelTrainer only tunes with the
+    "class_weight" and "none" resampling methods.
+
+    Weak candidates are pruned : at every rung of RUNGS boosting rounds, a candidate whose
+    validation loss is above the 'prune_quantile' of the losses of the finished candidates at
+    that rung is stopped. The thresholds are taken when a candidate is submitted. No candidate
+    is submitted past the budget, and running ones stop at their next boosting round.
+
+    The workers are forked from a forkserver, as in sensor.validation_executor.ValidationExecutor;
+    with 1 job the candidates run in this process.
+    """
+
+    def __init__(self, n_trials:int = 20, n_jobs:int = 1, time_budget:float = 600, validation_size:float = 0.2,
+                 max_estimators:int = 500, early_stopping_rounds:int = 20, prune_quantile:float = 0.5,
+                 min_trials_to_prune:int = 4, chunk_size:int = 50000, random_state:int = 42):
+        """
+        n_trials : largest number of candidates, the first being DEFAULT_PARAMS
+        n_jobs : number of worker processes
+        time_budget : seconds after which no candidate is submitted and running ones stop
+        validation_size : fraction of the training rows held out for early stopping and ranking
+        max_estimators : largest number of boosting rounds of a candidate
+        early_stopping_rounds : rounds without a better validation loss before a candidate stops
+        prune_quantile : quantile of the losses at a rung above which a candidate is pruned
+        min_trials_to_prune : finished candidates needed at a rung before pruning there
+        chunk_size : rows read at a time from the memory mapped arrays
+        random_state : seed of the candidates and of the validation split
+        """
+        self.n_trials = n_trials
+        self.n_jobs = n_jobs
+        self.time_budget = time_budget
+        self.validation_size = validation_size
+        self.max_estimators = max_estimators
+        self.early_stopping_rounds = early_stopping_rounds
+        self.prune_quantile = prune_quantile
+        self.min_trials_to_prune = min_trials_to_prune
+        self.chunk_size = chunk_size
+        self.random_state = random_state
+
+
+    def get_candidates(self) -> list:
+        """Returns 'n_trials' parameter sets, DEFAULT_PARAMS first, the others drawn at random."""
+        try:
+            rng = np.random.default_rng(self.random_state)
+            candidates = [dict(DEFAULT_PARAMS)]
+            for _ in range(self.n_trials - 1):
+                candidates.append({
+                    "max_depth" : int(rng.integers(3, 11)),
+                    "learning_rate" : float(np.exp(rng.uniform(np.log(0.02), np.log(0.3)))),
+                    "subsample" : float(rng.uniform(0.6, 1.0)),
+                    "colsample_bytree" : float(rng.uniform(0.5, 1.0)),
+                    "min_child_weight" : float(np.exp(rng.uniform(np.log(1), np.log(10)))),
+                    "reg_lambda" : float(np.exp(rng.uniform(np.log(0.1), np.log(10)))),
+                })
+            return candidates[:self.n_trials]
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def split(self, y:np.ndarray) -> tuple:
+        """Returns the sorted fit and validation rows, 'validation_size' of every class held out."""
+        try:
+            rng = np.random.default_rng(self.random_state)
+            validation_rows = []
+            for label in np.unique(y):
+                rows = np.flatnonzero(y == label)
+                n_validation = int(round(rows.shape[0] * self.validation_size))
+                validation_rows.append(rng.choice(rows, n_validation, replace=False))
+            validation_rows = np.sort(np.concatenate(validation_rows))
+            fit_rows = np.setdiff1d(np.arange(y.shape[0]), validation_rows)
+            return fit_rows, validation_rows
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get_rung_thresholds(self, results:list) -> dict:
+        """Returns the pruning threshold of every rung reached by at least 'min_trials_to_prune' finished candidates."""
+        thresholds = dict()
+        for rung in RUNGS:
+            losses = [result["rung_losses"][rung] for result in results if rung in result["rung_losses"]]
+            if len(losses) >= self.min_trials_to_prune:
+                thresholds[rung] = float(np.quantile(losses, self.prune_quantile))
+        return thresholds
+
+
+    def search(self, x_path:str, y_path:str, work_dir:str, class_weights:dict | None = None) -> tuple:
+        """Runs the candidates on the memory mapped arrays saved at 'x_path' and 'y_path'.
+
+        Args:
+            x_path (str): .npy file of the training features
+            y_path (str): .npy file of the encoded training target
+            work_dir (str): directory of the fit and validation index files
+            class_weights (dict, optional): class weights, see DataTransformation.get_class_weights
+
+        Returns:
+            tuple: (best result, results of all the candidates in the order they were submitted)
+        """
+        try:
+            start_time = time.time()
+            deadline = start_time + self.time_budget
+            fit_rows, validation_rows = self.split(np.load(y_path, mmap_mode="r"))
+            os.makedirs(work_dir, exist_ok=True)
+            fit_index_path = os.path.join(work_dir, "fit_index.npy")
+            validation_index_path = os.path.join(work_dir, "validation_index.npy")
+            np.save(fit_index_path, fit_rows)
+            np.save(validation_index_path, validation_rows)
+
+            candidates = self.get_candidates()
+            n_threads = max(1, (os.cpu_count() or 1) // self.n_jobs)
+            logging.info(f"Searching {len(candidates)} candidates on {self.n_jobs} jobs of {n_threads} threads, "
+                         f"budget {self.time_budget} s, {fit_rows.shape[0]} fit and {validation_rows.shape[0]} validation rows")
+
+            results = []
+            def get_trial(number:int) -> dict:
+                return {"number" : number, "params" : candidates[number], "x_path" : x_path, "y_path" : y_path,
+                        "fit_index_path" : fit_index_path, "validation_index_path" : validation_index_path,
+                        "class_weights" : class_weights, "deadline" : deadline, "n_threads" : n_threads,
+                        "rung_thresholds" : self.get_rung_thresholds(results),
+                        "max_estimators" : self.max_estimators, "early_stopping_rounds" : self.early_stopping_rounds,
+                        "chunk_size" : self.chunk_size}
+
+            def log_result(result:dict) -> None:
+                results.append(result)
+                logging.info(f"Trial {result['number']} {result['status']} after {result['n_rounds']} rounds : "
+                             f"validation f1 {result['validation_f1']}, loss {result['validation_loss']:.5f}")
+
+            if self.n_jobs <= 1:
+                for number in range(len(candidates)):
+                    if time.time() > deadline:
+                        break
+                    log_result(_run_trial(get_trial(number)))
+            else:
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload(["sensor.tuning"])
+                with ProcessPoolExecutor(max_workers=self.n_jobs, mp_context=context) as pool:
+                    next_number, running = 0, set()
+                    while next_number < len(candidates) or len(running) > 0:
+                        while next_number < len(candidates) and len(running) < self.n_jobs and time.time() < deadline:
+                            running.add(pool.submit(_run_trial, get_trial(next_number)))
+                            next_number += 1
+                        if time.time() >= deadline:
+                            next_number = len(candidates)
+                        if len(running) == 0:
+                            break
+                        done, running = wait(running, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            log_result(future.result())
+
+            results.sort(key=lambda result: result["number"])
+            scored = [result for result in results if result["validation_f1"] is not None]
+            if len(scored) == 0:
+                raise Exception(f"No candidate finished within the time budget of {self.time_budget} s.")
+            # best validation f1, then lowest validation loss
+            best_result = max(scored, key=lambda result: (result["validation_f1"], -result["validation_loss"]))
+            logging.info(f"Best trial {best_result['number']} : {best_result['params']}, "
+                         f"validation f1 {best_result['validation_f1']}, {time.time() - start_time:.1f} s")
+            return best_result, results
+        except Exception as e:
+            raise SensorException(e, sys)
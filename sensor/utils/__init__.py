@@ -1,23 +1,186 @@
 
 import os, sys
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from itertools import repeat
+from typing import Iterator
 import yaml
 import dill
 import pandas as pd
 import numpy as np
 from sensor.logger import logging
 from sensor.exception import SensorException
-from sensor.config import mongo_client
+from sensor.config import mongo_client, TARGET_COLUMN
+from sensor.schema import SCHEMA_COLUMNS, SCHEMA_DTYPES, FEATURE_DTYPE, NA_VALUES
 
 
-# extract data from database and return a dataframe
-def get_dataframe_from_collection(db_name : str, collection_name : str) -> pd.DataFrame :
+COLUMNAR_META_FILE_NAME = "columns.yaml"
+
+# keys sampled per range by 'get_partition_queries' to place the range boundaries
+PARTITION_SAMPLES_PER_RANGE = 100
+
+
+# extract data from database chunk by chunk
+def iter_dataframe_from_collection(db_name : str, collection_name : str, batch_size : int = 10000,
+                                   projection : list | None = None, query : dict | None = None,
+                                   limit : int = 0) -> Iterator[pd.DataFrame] :
+    """
+    Description : 
+    Streams the documents stored in mongodb and yields them as pandas dataframes of at most
+    'batch_size' rows. Feature columns are converted to float32 (non numeric values such as
+    "na" become np.nan) and the target column is kept as it is. '_id' is excluded on the server.
+
+    Params : 
+    db_name : database name
+    collection_name : collection name
+    batch_size : number of documents fetched per round trip and rows per yielded chunk
+    projection : list of field names to fetch; all the fields if None
+    query : mongodb filter applied to the collection
+    limit : maximum number of documents to read; 0 means no limit
+    ========================================
+
+    yields : pandas.DataFrame 
+    """
+    
+    try :
+        if projection is None:
+            mongo_projection = {"_id" : 0}
+        else:
+            mongo_projection = {field : 1 for field in projection}
+            mongo_projection["_id"] = 0
+
+        cursor = mongo_client[db_name][collection_name].find(
+            query or {}, mongo_projection, batch_size=batch_size, limit=limit)
+
+        columns = list(projection) if projection is not None else None
+        documents = []
+        for document in cursor:
+            documents.append(document)
+            if len(documents) == batch_size:
+                chunk = _documents_to_dataframe(documents, columns)
+                columns = list(chunk.columns)
+                documents = []
+                yield chunk
+
+        if len(documents) > 0:
+            yield _documents_to_dataframe(documents, columns)
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def _documents_to_dataframe(documents : list, columns : list | None) -> pd.DataFrame :
+    df = pd.DataFrame.from_records(documents, columns=columns)
+    for column in df.columns:
+        if column != TARGET_COLUMN:
+            df[column] = pd.to_numeric(df[column], errors="coerce").astype(FEATURE_DTYPE)
+    return df
+
+
+def get_latest_key_from_collection(db_name : str, collection_name : str, key : str = "_id"):
     """
     Description : 
-    Retrieves data stored in mongodb and converts to a pandas dataframe
+    Returns the largest value of 'key' in the collection or None if the collection is empty.
 
     Params : 
     db_name : database name
     collection_name : collection name
+    key : indexed field, e.g. '_id' or an insert timestamp
+    ========================================
+
+    returns : value of the key 
+    """
+    
+    try :
+        cursor = mongo_client[db_name][collection_name].find({}, {key : 1}).sort(key, -1).limit(1)
+        for document in cursor:
+            return document.get(key)
+        return None
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def get_partition_queries(db_name : str, collection_name : str, n_partitions : int,
+                          query : dict | None = None, partition_key : str = "_id") -> list[dict] :
+    """
+    Description : 
+    Splits the collection into 'n_partitions' contiguous ranges of 'partition_key' holding
+    roughly the same number of documents and returns one mongodb filter per range, in key order.
+    The boundaries are evenly spaced quantiles of the keys of 'PARTITION_SAMPLES_PER_RANGE'
+    documents per range picked by $sample, so the server never walks the key index up to a
+    rank as skip() would.
+
+    Params : 
+    db_name : database name
+    collection_name : collection name
+    n_partitions : number of ranges
+    query : mongodb filter applied to the collection
+    partition_key : indexed field used to split the collection
+    ========================================
+
+    returns : list of mongodb filters 
+    """
+    
+    try :
+        collection = mongo_client[db_name][collection_name]
+        query = query or {}
+        n_samples = min(collection.count_documents(query), PARTITION_SAMPLES_PER_RANGE * n_partitions)
+
+        # boundary keys at evenly spaced ranks of the sampled keys
+        bounds = []
+        if n_partitions > 1 and n_samples > 0:
+            pipeline = ([{"$match" : query}] if query else []) + [{"$sample" : {"size" : n_samples}},
+                                                                  {"$project" : {partition_key : 1}}]
+            keys = sorted(document[partition_key] for document in collection.aggregate(pipeline))
+            for i in range(1, n_partitions):
+                key = keys[i * len(keys) // n_partitions]
+                if len(bounds) == 0 or key != bounds[-1]:
+                    bounds.append(key)
+
+        lower_bounds = [None] + bounds
+        upper_bounds = bounds + [None]
+        queries = []
+        for lower, upper in zip(lower_bounds, upper_bounds):
+            key_range = dict()
+            if lower is not None:
+                key_range["$gte"] = lower
+            if upper is not None:
+                key_range["$lt"] = upper
+            partition_query = {partition_key : key_range} if key_range else {}
+            if query and partition_query:
+                partition_query = {"$and" : [query, partition_query]}
+            queries.append(partition_query or query)
+
+        return queries
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def get_dataframe_from_collection(db_name : str, collection_name : str, batch_size : int = 10000,
+                                  projection : list | None = None, query : dict | None = None,
+                                  n_workers : int = 1, executor : str = "thread") -> pd.DataFrame :
+    """
+    Description : 
+    Retrieves data stored in mongodb and converts to a pandas dataframe. The cursor is read
+    in batches and every chunk is copied into preallocated float32 columns, so the whole
+    collection is never held as python dicts.
+
+    With 'n_workers' > 1 the collection is split into '_id' ranges which are read at the
+    same time, each on its own connection. The output columns are allocated once from the
+    document count of every range and each range is written at its own offset, so the
+    output does not depend on which partition finishes first and is never concatenated.
+    Threads write straight into the output columns; processes return their block, which is
+    copied at its offset as soon as it arrives, the collection being cut into 4 ranges per
+    worker to bound the blocks held at the same time.
+
+    Params : 
+    db_name : database name
+    collection_name : collection name
+    batch_size : number of documents fetched per round trip
+    projection : list of field names to fetch; the columns of sensor.schema if None
+    query : mongodb filter applied to the collection
+    n_workers : number of partitions read in parallel
+    executor : "thread" or "process"; processes also spread the BSON decoding over cores
     ========================================
 
     returns : pandas.DataFrame 
@@ -25,16 +188,137 @@ def get_dataframe_from_collection(db_name : str, collection_name : str) -> pd.Da
     
     try :
         logging.info(f"Reading data from database {db_name} and collection {collection_name}")
-        df = pd.DataFrame(list(mongo_client[db_name][collection_name].find()))
-        logging.info(f"Found columns : {df.columns}")
-        if '_id' in df.columns:
-            df = df.drop(columns=['_id'])
-            logging.info("_id column dropped.")
+
+        if n_workers <= 1:
+            df = _read_collection_block(db_name, collection_name, batch_size, projection, query)
+        else:
+            n_partitions = n_workers if executor == "thread" else 4 * n_workers
+            queries = get_partition_queries(db_name, collection_name, n_partitions, query=query)
+            logging.info(f"Reading {len(queries)} partitions with {n_workers} {executor} workers...")
+
+            # the counts are taken first so that the columns can be allocated once;
+            # documents inserted while reading are left for the next run
+            collection = mongo_client[db_name][collection_name]
+            counts = [collection.count_documents(partition_query) for partition_query in queries]
+            offsets = np.cumsum([0] + counts)
+            columns = _get_collection_columns(projection)
+            if offsets[-1] == 0:
+                return pd.DataFrame()
+            arrays = _allocate_columns(columns, int(offsets[-1]))
+
+            n_read = [0] * len(queries)
+            if executor == "process":
+                pool = ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context("spawn"))
+                with pool:
+                    futures = {pool.submit(_read_collection_block, db_name, collection_name, batch_size,
+                                           columns, partition_query, n_rows) : i
+                               for i, (partition_query, n_rows) in enumerate(zip(queries, counts))}
+                    for future in as_completed(futures):
+                        i = futures.pop(future)
+                        block = future.result()
+                        n_read[i] = block.shape[0]
+                        for column, array in arrays.items():
+                            array[offsets[i]:offsets[i] + n_read[i]] = block[column].to_numpy()
+                        del block
+            else:
+                with ThreadPoolExecutor(max_workers=n_workers) as pool:
+                    n_read = list(pool.map(_fill_collection_block,
+                                           repeat(db_name), repeat(collection_name), repeat(batch_size),
+                                           repeat(columns), queries, repeat(arrays), offsets[:-1], counts))
+
+            # ranges with fewer documents than counted (deleted while reading) leave gaps, which
+            # are closed by moving the next ranges down, in place
+            end = 0
+            for offset, n_rows in zip(offsets, n_read):
+                if offset != end:
+                    for array in arrays.values():
+                        array[end:end + n_rows] = array[offset:offset + n_rows]
+                end += n_rows
+            df = pd.DataFrame({column : array[:end] for column, array in arrays.items()}, copy=False)
+
+        logging.info(f"Found {df.shape[0]} rows and columns : {df.columns}")
         return df
     except Exception as e:
         raise SensorException(e, sys)
 
 
+def _get_collection_columns(projection : list | None) -> list :
+    # the columns of the chunks : the projection, or the declared schema, so that every chunk
+    # has every column even when its documents lack some fields
+    return list(projection) if projection is not None else list(SCHEMA_COLUMNS)
+
+
+def _allocate_columns(columns : list, n_rows : int) -> dict :
+    return {column : np.empty(n_rows, dtype=object if column == TARGET_COLUMN else FEATURE_DTYPE)
+            for column in columns}
+
+
+def _fill_collection_block(db_name : str, collection_name : str, batch_size : int, projection : list | None,
+                           query : dict | None, arrays : dict, offset : int, n_rows : int) -> int :
+    # writes at most 'n_rows' documents of 'query' into 'arrays' from 'offset'; returns the number written
+    if n_rows == 0:
+        return 0
+    start = offset
+    for chunk in iter_dataframe_from_collection(db_name, collection_name, batch_size=batch_size,
+                                                projection=projection, query=query, limit=n_rows):
+        end = start + len(chunk)
+        for column, array in arrays.items():
+            array[start:end] = chunk[column].to_numpy()
+        start = end
+    return start - offset
+
+
+def _read_collection_block(db_name : str, collection_name : str, batch_size : int,
+                           projection : list | None, query : dict | None, n_rows : int | None = None) -> pd.DataFrame :
+    # the count is taken first so that the columns can be allocated once;
+    # documents inserted while reading are left for the next run
+    if n_rows is None:
+        n_rows = mongo_client[db_name][collection_name].count_documents(query or {})
+    if n_rows == 0:
+        return pd.DataFrame()
+
+    columns = _get_collection_columns(projection)
+    arrays = _allocate_columns(columns, n_rows)
+    n_read = _fill_collection_block(db_name, collection_name, batch_size, columns, query, arrays, 0, n_rows)
+
+    # fewer documents than counted (deleted while reading)
+    return pd.DataFrame({column : array[:n_read] for column, array in arrays.items()}, copy=False)
+
+
+
+def read_sensor_csv(file_path:str, usecols:list | None = None, skiprows=None, nrows:int | None = None,
+                    chunksize:int | None = None, feature_dtype=FEATURE_DTYPE) -> pd.DataFrame | Iterator[pd.DataFrame]:
+    """Reads a csv file of sensor data using the declared schema : the feature columns are
+    parsed straight into float32 with the "na"/"nan" strings read as np.nan, and the target
+    column is read as text.
+
+    Args:
+        file_path (str): csv file path
+        usecols (list, optional): columns to read; all the columns of the file if None
+        skiprows (optional): passed to pd.read_csv
+        nrows (int, optional): number of rows to read
+        chunksize (int, optional): if given, an iterator of dataframes of 'chunksize' rows is returned
+        feature_dtype (optional): dtype of the feature columns, float32 by default
+
+    Raises:
+        Exception: if the file holds a column which is not part of the schema
+
+    Returns:
+        pd.DataFrame | Iterator[pd.DataFrame]: parsed data
+    """
+    try:
+        header = pd.read_csv(file_path, nrows=0).columns
+        unexpected_columns = [column for column in header if column not in SCHEMA_DTYPES]
+        if len(unexpected_columns) > 0:
+            raise Exception(f"Unexpected columns found in {file_path} : {unexpected_columns}")
+
+        dtypes = {column : SCHEMA_DTYPES[column] if column == TARGET_COLUMN else feature_dtype
+                  for column in header}
+        return pd.read_csv(file_path, usecols=usecols, skiprows=skiprows, nrows=nrows, chunksize=chunksize,
+                           dtype=dtypes, na_values=NA_VALUES)
+    except Exception as e:
+        raise SensorException(e, sys)
+
 
 def write_yaml_file(file_path:str, data:dict) ->  None:
     """Write the data to a yaml file.
@@ -60,6 +344,22 @@ def write_yaml_file(file_path:str, data:dict) ->  None:
         raise SensorException(e, sys)
 
 
+def read_yaml_file(file_path:str) -> dict:
+    """Read a yaml file written by 'write_yaml_file'.
+
+    Args:
+        file_path (str): file path
+
+    Returns :
+        dict : content of the file
+    """
+    try:
+        with open(file_path, "r") as f:
+            return yaml.safe_load(f)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
 def save_object(file_path:str, obj:object) -> None:
     try:
         logging.info(f"Saving object to path : {file_path}...")
@@ -90,9 +390,88 @@ def save_numpy_array(file_path:str, array):
         raise SensorException(e, sys)
 
 
-def load_numpy_array(file_path:str):
+def load_numpy_array(file_path:str, mmap_mode:str | None = None):
     try:
+        if mmap_mode is not None:
+            return np.load(file_path, mmap_mode=mmap_mode)
         with open(file_path, "rb") as obj:
             return np.load(obj)
     except Exception as e:
-        raise SensorException(e, sys)
\ No newline at end of file
+        raise SensorException(e, sys)
+
+
+def save_columnar(dir_path:str, df:pd.DataFrame) -> None:
+    """Saves the dataframe as one .npy file per column plus a 'columns.yaml' file holding
+    the column order and dtypes. Text columns are stored as fixed width unicode arrays.
+
+    Args:
+        dir_path (str): directory of the columnar table
+        df (pd.DataFrame): data to be saved
+    """
+    try:
+        logging.info(f"Saving {df.shape} dataframe to columnar dir {dir_path}...")
+        os.makedirs(dir_path, exist_ok=True)
+
+        dtypes = dict()
+        for column in df.columns:
+            array = df[column].to_numpy()
+            if array.dtype.kind not in "biuf":
+                array = array.astype(str)
+            np.save(os.path.join(dir_path, f"{column}.npy"), array, allow_pickle=False)
+            dtypes[column] = array.dtype.str
+
+        write_yaml_file(file_path=os.path.join(dir_path, COLUMNAR_META_FILE_NAME),
+                        data={"columns" : list(df.columns), "dtypes" : dtypes, "n_rows" : df.shape[0]})
+        logging.info("Saved successfully.")
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def read_columnar_meta(dir_path:str) -> dict:
+    """Returns the columns, dtypes and row count of a columnar table saved by 'save_columnar'."""
+    try:
+        with open(os.path.join(dir_path, COLUMNAR_META_FILE_NAME), "r") as f:
+            return yaml.safe_load(f)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def get_columnar_columns(dir_path:str) -> list:
+    """Returns the column names of a columnar table saved by 'save_columnar'."""
+    try:
+        return read_columnar_meta(dir_path)["columns"]
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def load_columnar_array(dir_path:str, column:str, mmap_mode:str | None = None) -> np.ndarray:
+    try:
+        return np.load(os.path.join(dir_path, f"{column}.npy"), mmap_mode=mmap_mode, allow_pickle=False)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def load_columnar(dir_path:str, columns:list | None = None, mmap_mode:str | None = None) -> pd.DataFrame:
+    """Loads a columnar table saved by 'save_columnar'. Only the requested columns are read.
+
+    Args:
+        dir_path (str): directory of the columnar table
+        columns (list, optional): columns to load; all the columns if None
+        mmap_mode (str, optional): passed to np.load, e.g. "r" to memory map the columns
+
+    Returns:
+        pd.DataFrame: loaded data
+    """
+    try:
+        available_columns = get_columnar_columns(dir_path)
+        if columns is None:
+            columns = available_columns
+
+        missing_columns = [column for column in columns if column not in available_columns]
+        if len(missing_columns) > 0:
+            raise Exception(f"Columns not found in {dir_path} : {missing_columns}")
+
+        data = {column : load_columnar_array(dir_path, column, mmap_mode=mmap_mode) for column in columns}
+        return pd.DataFrame(data, copy=False)
+    except Exception as e:
+        raise SensorException(e, sys)
@@ -0,0 +1,363 @@
+import sys
+import math
+import multiprocessing
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from sensor.drift import ks_2samp_columns, ks_2samp_sort_keys, float32_sort_keys
+from sensor.feature_store import FeatureStore
+from sensor.sketch import ColumnSketch
+from sensor.logger import logging
+from sensor.exception import SensorException
+
+
+# shared memory blocks attached by the current process, by name
+_attached_blocks = dict()
+
+
+def _attach_block(name:str) -> shared_memory.SharedMemory:
+    """Attaches the shared memory block 'name' without registering it with the resource tracker
+    from a worker : the executor which created the block unlinks it. The workers share the
+    tracker of the executor's process, so unregistering the block after attaching it would
+    drop the executor's own registration too; before Python 3.13, which has 'track', the
+    registration is skipped instead."""
+    if multiprocessing.parent_process() is None:
+        return shared_memory.SharedMemory(name=name)
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def _attach_array(name:str, shape:tuple, dtype:str) -> np.ndarray:
+    if name not in _attached_blocks:
+        _attached_blocks[name] = _attach_block(name)
+    return np.ndarray(shape, dtype=dtype, buffer=_attached_blocks[name].buf)
+
+
+def _load_rows(dataset:dict, columns:list) -> np.ndarray:
+    """Returns the rows of 'columns' of a shared memory block, read in place when they follow each other."""
+    array = _attach_array(dataset["name"], dataset["shape"], dataset["dtype"])
+    positions = [dataset["positions"][column] for column in columns]
+    if positions == list(range(positions[0], positions[0] + len(positions))):
+        return array[positions[0]:positions[0] + len(positions)]
+    return array[positions]
+
+
+def _load_block(dataset:dict, columns:list) -> np.ndarray:
+    """Returns the values of 'columns' as a (n_rows, n_columns) array. Shared arrays are read
+    in place; feature store splits are read by the worker through the memory mapped partitions."""
+    if dataset["source"] == "shared_memory":
+        return _load_rows(dataset, columns).T
+    feature_store = FeatureStore(dataset["feature_store_dir"])
+    df = feature_store.load(columns=columns, rows=np.load(dataset["index_path"]))
+    return df.to_numpy()
+
+
+def _count_nulls(dataset:dict, columns:list) -> np.ndarray:
+    if dataset["source"] == "shared_memory":
+        block = _load_block(dataset, columns)
+        if block.dtype.kind != "f":
+            return np.zeros(len(columns), dtype=np.int64)
+        return np.isnan(block).sum(axis=0)
+    feature_store = FeatureStore(dataset["feature_store_dir"])
+    df = feature_store.load(columns=columns, rows=np.load(dataset["index_path"]))
+    return df.isnull().sum().to_numpy()
+
+
+def _drift_pvalues(base:dict, current:dict, columns:list) -> np.ndarray:
+    if base.get("sort_keys", False):
+        _, pvalues = ks_2samp_sort_keys(_load_rows(base, columns),
+                                        float32_sort_keys(_load_block(current, columns)))
+    else:
+        _, pvalues = ks_2samp_columns(_load_block(base, columns), _load_block(current, columns))
+    return pvalues
+
+
+def _sketch_rows(dataset:dict, start:int, stop:int, relative_accuracy:float, chunk_size:int) -> ColumnSketch:
+    """Sketches the rows start:stop of a feature store split, 'chunk_size' rows at a time."""
+    sketch = ColumnSketch(dataset["numeric_columns"],
+                          [column for column in dataset["columns"] if column not in dataset["numeric_columns"]],
+                          relative_accuracy=relative_accuracy)
+    rows = np.load(dataset["index_path"], mmap_mode="r")[start:stop]
+    for chunk in FeatureStore(dataset["feature_store_dir"]).iter_chunks(chunk_size, rows=np.asarray(rows)):
+        sketch.update(chunk)
+    return sketch
+
+
+class ValidationExecutor:
+    """Runs the per-column checks of the data validation over blocks of columns on a pool of
+    processes, several datasets at a time.
+
+    Dataframes are copied once into shared memory, one row per column, and the workers read
+    their block of columns in place; train and test splits of the feature store can instead be
+    read by the workers themselves from the memory mapped partitions. Only the column names go
+    to the workers and only the per-column results come back. Columns which are not numeric
+    are checked in this process.
+
+    The workers are forked from a forkserver which imports this module and the main module once;
+    as with any process pool, the main script must keep its work under 'if __name__ == "__main__"'.
+    Starting the pool takes about as long as these imports, so it pays off on large datasets.
+    Use it as a context manager so that the pool and the shared memory are always released.
+    """
+
+    def __init__(self, n_jobs:int, chunk_size:int = 50000, blocks_per_job:int = 4):
+        """
+        n_jobs : number of worker processes; with 1 the tasks run in this process
+        chunk_size : rows per block of columns read from the feature store, as in the out of core mode
+        blocks_per_job : blocks of columns per worker, so that faster workers pick up more blocks
+        """
+        try:
+            self.n_jobs = n_jobs
+            self.chunk_size = chunk_size
+            self.blocks_per_job = blocks_per_job
+            self.datasets = dict()
+            self.other_columns = dict()
+            self.shared_blocks = []
+            self.pool = None
+            if self.n_jobs > 1:
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload(["__main__", "sensor.validation_executor"])
+                self.pool = ProcessPoolExecutor(max_workers=n_jobs, mp_context=context)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def share_array(self, array:np.ndarray) -> dict:
+        """Copies a 2D array, one row per column, into a new shared memory block and returns
+        what the workers need to attach to it."""
+        try:
+            block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+            self.shared_blocks.append(block)
+            shared_array = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            shared_array[:] = array
+            del shared_array
+            return {"source" : "shared_memory", "name" : block.name, "shape" : array.shape, "dtype" : array.dtype.str}
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def add_dataframe(self, key:str, df:pd.DataFrame) -> None:
+        """Copies the numeric columns of 'df' into a shared memory block."""
+        try:
+            numeric_columns = [column for column in df.columns if pd.api.types.is_numeric_dtype(df[column])]
+            dtype = np.result_type(*[df[column].dtype for column in numeric_columns]) \
+                if len(numeric_columns) > 0 else np.dtype(np.float32)
+            shape = (len(numeric_columns), df.shape[0])
+
+            block = shared_memory.SharedMemory(create=True, size=max(1, math.prod(shape) * dtype.itemsize))
+            self.shared_blocks.append(block)
+            array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+            for position, column in enumerate(numeric_columns):
+                array[position] = df[column].to_numpy()
+            del array
+
+            logging.info(f"Copied {shape[0]} columns of {key} to shared memory : {block.name}")
+            self.datasets[key] = {
+                "source" : "shared_memory",
+                "name" : block.name, "shape" : shape, "dtype" : dtype.str,
+                "positions" : {column : position for position, column in enumerate(numeric_columns)},
+                "columns" : list(df.columns),
+                "numeric_columns" : numeric_columns,
+                "dtypes" : {column : df[column].dtype.str for column in numeric_columns},
+                "n_rows" : df.shape[0],
+            }
+            # kept out of the dataset description, which is sent to the workers with every task
+            self.other_columns[key] = df[[column for column in df.columns if column not in numeric_columns]]
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def add_reference_profile(self, key:str, profile) -> None:
+        """Copies the sorted keys of the float32 columns of a sensor.reference_profile.ReferenceProfile
+        into a shared memory block; the drift tests against this dataset start from these keys."""
+        try:
+            dataset = self.share_array(profile.sort_keys)
+            logging.info(f"Copied the sort keys of {len(profile.key_columns)} columns of {key} to shared memory : {dataset['name']}")
+            dataset.update({
+                "sort_keys" : True,
+                "positions" : {column : position for position, column in enumerate(profile.key_columns)},
+                "columns" : profile.columns,
+                "numeric_columns" : profile.key_columns,
+                "dtypes" : {column : np.dtype(np.float32).str for column in profile.key_columns},
+                "n_rows" : profile.sort_keys.shape[1],
+            })
+            self.datasets[key] = dataset
+            self.other_columns[key] = profile.other_df
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def add_feature_store_split(self, key:str, feature_store:FeatureStore, index_path:str) -> None:
+        """Registers the rows listed in 'index_path'; the workers read them from the feature store."""
+        try:
+            dtypes = feature_store.get_dtypes()
+            self.datasets[key] = {
+                "source" : "feature_store",
+                "feature_store_dir" : feature_store.feature_store_dir,
+                "index_path" : index_path,
+                "columns" : feature_store.get_columns(),
+                "numeric_columns" : [column for column in feature_store.get_columns()
+                                     if np.dtype(dtypes[column]).kind in "biuf"],
+                "dtypes" : dtypes,
+                "n_rows" : np.load(index_path, mmap_mode="r").shape[0],
+            }
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def get_blocks(self, keys:list, columns:list) -> list:
+        """Splits 'columns' in blocks, small enough for the feature store splits among 'keys'
+        to load about 'chunk_size' rows worth of values per block."""
+        try:
+            block_size = max(1, math.ceil(len(columns) / (max(1, self.n_jobs) * self.blocks_per_job)))
+            for key in keys:
+                dataset = self.datasets[key]
+                if dataset["source"] == "feature_store":
+                    block_size = min(block_size, max(1, self.chunk_size * len(columns) // max(1, dataset["n_rows"])))
+            return [columns[start:start + block_size] for start in range(0, len(columns), block_size)]
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def run(self, tasks:list) -> list:
+        """Runs every (function, *args) task and returns the results in the same order."""
+        try:
+            if self.pool is None:
+                return [function(*args) for function, *args in tasks]
+            futures = [self.pool.submit(function, *args) for function, *args in tasks]
+            return [future.result() for future in futures]
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def null_percent(self, keys:list) -> dict:
+        """Returns, for every dataset of 'keys', the fraction of null values of every column,
+        as a pd.Series in the column order of the dataset."""
+        try:
+            tasks, owners = [], []
+            for key in keys:
+                dataset = self.datasets[key]
+                numeric_columns = dataset["numeric_columns"] if dataset["source"] == "shared_memory" \
+                    else dataset["columns"]
+                for block in self.get_blocks([key], numeric_columns):
+                    tasks.append((_count_nulls, dataset, block))
+                    owners.append((key, block))
+
+            null_counts = {key : dict() for key in keys}
+            for (key, block), counts in zip(owners, self.run(tasks)):
+                null_counts[key].update(zip(block, counts))
+
+            null_percent = dict()
+            for key in keys:
+                dataset = self.datasets[key]
+                if dataset["source"] == "shared_memory":
+                    null_counts[key].update(self.other_columns[key].isnull().sum())
+                counts = pd.Series([null_counts[key][column] for column in dataset["columns"]],
+                                   index=dataset["columns"], dtype=np.int64)
+                null_percent[key] = counts / dataset["n_rows"]
+            return null_percent
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def drift_pvalues(self, base_key:str, keys:list, columns:list) -> dict:
+        """Returns, for every dataset of 'keys', the ks_2samp p-value of every numeric column of
+        'columns' against the same column of the 'base_key' dataset, NaN values left out. The
+        columns which are not numeric in both datasets are left to the caller, see 'load'."""
+        try:
+            base = self.datasets[base_key]
+            tasks, owners = [], []
+            for key in keys:
+                current = self.datasets[key]
+                numeric_columns = [column for column in columns if column in base["numeric_columns"]
+                                   and column in current["numeric_columns"]]
+                if base.get("sort_keys", False):
+                    # the keys are only comparable with float32 values
+                    numeric_columns = [column for column in numeric_columns
+                                       if current["dtypes"][column] == base["dtypes"][column]]
+                for block in self.get_blocks([base_key, key], numeric_columns):
+                    tasks.append((_drift_pvalues, base, current, block))
+                    owners.append((key, block))
+
+            pvalues = {key : dict() for key in keys}
+            for (key, block), block_pvalues in zip(owners, self.run(tasks)):
+                pvalues[key].update(zip(block, block_pvalues))
+            return pvalues
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def sketch(self, keys:list, relative_accuracy:float = 0.01) -> dict:
+        """Returns a ColumnSketch of every feature store split of 'keys'. Every worker sketches
+        a range of rows and the sketches are merged here."""
+        try:
+            tasks, owners = [], []
+            for key in keys:
+                dataset = self.datasets[key]
+                if dataset["source"] != "feature_store":
+                    raise Exception(f"Only feature store splits can be sketched, not {key}.")
+                n_parts = max(1, self.n_jobs)
+                bounds = np.linspace(0, dataset["n_rows"], n_parts + 1).astype(np.int64)
+                for start, stop in zip(bounds[:-1], bounds[1:]):
+                    tasks.append((_sketch_rows, dataset, int(start), int(stop), relative_accuracy, self.chunk_size))
+                    owners.append(key)
+
+            sketches = dict()
+            for key, sketch in zip(owners, self.run(tasks)):
+                if key in sketches:
+                    sketches[key].merge(sketch)
+                else:
+                    sketches[key] = sketch
+            return sketches
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def load(self, key:str, columns:list) -> pd.DataFrame:
+        """Loads a few columns of a dataset in this process."""
+        try:
+            dataset = self.datasets[key]
+            if dataset["source"] == "feature_store":
+                return FeatureStore(dataset["feature_store_dir"]).load(columns=columns,
+                                                                      rows=np.load(dataset["index_path"]))
+            numeric_columns = [column for column in columns if column in dataset["positions"]]
+            df = self.other_columns[key].copy()
+            if len(numeric_columns) > 0:
+                array = _attach_array(dataset["name"], dataset["shape"], dataset["dtype"])
+                for column in numeric_columns:
+                    df[column] = array[dataset["positions"][column]].copy()
+                del array
+            return df[columns]
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+    def close(self) -> None:
+        """Stops the workers and frees the shared memory."""
+        try:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
+            for block in self.shared_blocks:
+                attached = _attached_blocks.pop(block.name, None)
+                if attached is not None:
+                    attached.close()
+                block.close()
+                block.unlink()
+            self.shared_blocks = []
+        except Exception as e:
+            raise SensorException(e, sys)
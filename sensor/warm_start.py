@@ -0,0 +1,125 @@
+import os
+import sys
+import hashlib
+import numpy as np
+from sensor.feature_store import FeatureStore
+from sensor.sketch import ColumnSketch
+from sensor.config import TARGET_COLUMN
+from sensor.logger import logging
+from sensor import utils
+from sensor.exception import SensorException
+
+
+def get_rows_digest(rows:np.ndarray, n_rows:int) -> str:
+    """Returns the sha256 of the sorted row positions of 'rows' below 'n_rows'."""
+    try:
+        return hashlib.sha256(np.ascontiguousarray(np.sort(rows[rows < n_rows]), dtype=np.int64).tobytes()).hexdigest()
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def set_lineage(model, feature_store_dir:str, n_feature_store_rows:int, n_warm_starts:int, test_rows_digest:str) -> None:
+    """Saves in the booster of 'model' the feature store and the number of its rows the model was
+    trained on, the digest of the test rows among them (see 'get_rows_digest') and the number
+    of warm starts since its last full training. The booster attributes are saved with the
+    model, so the next run knows which rows are new and whether the old rows kept their set."""
+    try:
+        model.get_booster().set_attr(feature_store_dir=os.path.realpath(feature_store_dir),
+                                     n_feature_store_rows=str(n_feature_store_rows),
+                                     n_warm_starts=str(n_warm_starts),
+                                     test_rows_digest=test_rows_digest)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def get_lineage(model) -> dict | None:
+    """Returns the attributes saved by 'set_lineage', None for a model saved without them."""
+    try:
+        attributes = model.get_booster().attributes()
+        if "n_feature_store_rows" not in attributes:
+            return None
+        return {"feature_store_dir" : attributes["feature_store_dir"],
+                "n_feature_store_rows" : int(attributes["n_feature_store_rows"]),
+                "n_warm_starts" : int(attributes["n_warm_starts"]),
+                "test_rows_digest" : attributes.get("test_rows_digest")}
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def plan_warm_start(model_resolver, feature_store:FeatureStore, train_rows:np.ndarray, test_rows:np.ndarray,
+                    full_retrain_every:int, full_retrain_drift_share:float, drift_pvalue_threshold:float,
+                    min_class_rows:int = 0, chunk_size:int = 50000) -> dict:
+    """Decides whether the latest model of the registry, the champion, keeps boosting on the
+    training rows added to the feature store since it was trained, or a new model is trained on
+    all the rows. A full training is done when there is no champion with a lineage (see
+    'set_lineage'), the feature store is not the one the champion was trained on, the rows the
+    champion saw are not split as they were then (so that none of its training rows is scored
+    as a test row), there are no new rows, 'full_retrain_every' warm starts were done since the
+    last full training, the new training rows have a single class or less than 'min_class_rows'
+    rows of a class (the rows the resampling needs, 0 without resampling), or more than
+    'full_retrain_drift_share' of the columns of the new rows drifted from the champion's
+    reference sketch.
+
+    The new rows are resampled alone : SMOTE fills the minority class up to the majority class,
+    so they are as balanced as the champion's resampled training rows were. Without resampling
+    the class weights are the ones of all the training rows, as for the champion.
+
+    Returns:
+        dict: "warm_start", "reason", "champion_dir", "n_seen_rows", "n_warm_starts", "new_train_rows"
+            (sorted positions of the new training rows), "reference_sketch" (champion's sketch
+            merged with the sketch of the new rows; None for a full training)
+    """
+    try:
+        plan = {"warm_start" : False, "champion_dir" : model_resolver.get_latest_dir(), "n_seen_rows" : 0,
+                "n_warm_starts" : 0, "new_train_rows" : None, "reference_sketch" : None}
+
+        def full_training(reason:str) -> dict:
+            logging.info(f"Full training : {reason}")
+            return dict(plan, reason=reason)
+
+        if plan["champion_dir"] is None:
+            return full_training("no champion model")
+        lineage = get_lineage(utils.load_object(file_path=model_resolver.get_latest_model_path()))
+        if lineage is None:
+            return full_training("the champion model has no lineage")
+        n_rows = sum(feature_store.get_partition_sizes())
+        if lineage["feature_store_dir"] != os.path.realpath(feature_store.feature_store_dir) \
+                or lineage["n_feature_store_rows"] > n_rows:
+            return full_training("the champion model was trained on another feature store")
+        if lineage["test_rows_digest"] != get_rows_digest(test_rows, lineage["n_feature_store_rows"]):
+            return full_training("the rows the champion model was trained on are not split as they were")
+        if lineage["n_warm_starts"] >= full_retrain_every:
+            return full_training(f"scheduled, {lineage['n_warm_starts']} warm starts since the last full training")
+
+        new_train_rows = train_rows[train_rows >= lineage["n_feature_store_rows"]]
+        if new_train_rows.shape[0] == 0:
+            return full_training("no new training rows")
+        if min_class_rows > 0:
+            target = feature_store.load(columns=[TARGET_COLUMN], rows=new_train_rows)[TARGET_COLUMN]
+            class_counts = target.value_counts()
+            if class_counts.shape[0] < 2 or class_counts.min() < min_class_rows:
+                return full_training(f"too few rows of a class to resample the new training rows : "
+                                     f"{class_counts.to_dict()}, at least {min_class_rows} needed")
+
+        reference_sketch_path = model_resolver.get_latest_reference_sketch_path()
+        if reference_sketch_path is None:
+            return full_training("the champion model has no reference sketch")
+        reference_sketch = utils.load_object(file_path=reference_sketch_path)
+        new_sketch = ColumnSketch(reference_sketch.numeric_columns, reference_sketch.other_columns,
+                                  relative_accuracy=reference_sketch.relative_accuracy,
+                                  min_value=reference_sketch.min_value, max_value=reference_sketch.max_value)
+        sketch_columns = reference_sketch.numeric_columns + reference_sketch.other_columns
+        for chunk in feature_store.iter_chunks(chunk_size, columns=sketch_columns, rows=new_train_rows):
+            new_sketch.update(chunk)
+
+        comparison = reference_sketch.compare(new_sketch, [column for column in sketch_columns if column != TARGET_COLUMN])
+        n_drifted = sum(result["pvalue"] <= drift_pvalue_threshold for result in comparison.values())
+        if n_drifted > full_retrain_drift_share * len(comparison):
+            return full_training(f"{n_drifted} of {len(comparison)} columns drifted in the new rows")
+
+        reference_sketch.merge(new_sketch)
+        return dict(plan, warm_start=True, reason=f"{new_train_rows.shape[0]} new training rows",
+                    n_seen_rows=lineage["n_feature_store_rows"], n_warm_starts=lineage["n_warm_starts"],
+                    new_train_rows=new_train_rows, reference_sketch=reference_sketch)
+    except Exception as e:
+        raise SensorException(e, sys)
@@ -0,0 +1,150 @@
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+import xgboost as xgb
+from xgboost import XGBClassifier
+from sensor.logger import logging
+from sensor.exception import SensorException
+
+
+# XGBClassifier parameters which are not booster parameters
+_SKLEARN_ONLY_PARAMS = ["n_estimators", "n_jobs", "early_stopping_rounds", "callbacks", "eval_metric",
+                        "missing", "enable_categorical"]
+
+
+class ArrayBatches(xgb.DataIter):
+    """Feeds XGBoost 'chunk_size' rows at a time of 2D feature and 1D label arrays, e.g. memory
+    mapped .npy files, so that the DMatrix is built without a copy of the whole arrays. With
+    'rows', only these rows are fed, e.g. the fit rows of a fold, so a subset is not copied
+    whole either; the sample weights are indexed as the rows of 'x'. With a 'cache_prefix'
+    the DMatrix built from it is held on disk (external memory)."""
+
+    def __init__(self, x:np.ndarray, y:np.ndarray, sample_weight:np.ndarray | None = None,
+                 chunk_size:int = 50000, cache_prefix:str | None = None, rows:np.ndarray | None = None):
+        self.x = x
+        self.y = y
+        self.sample_weight = sample_weight
+        self.chunk_size = chunk_size
+        self.rows = rows
+        self.n_rows = x.shape[0] if rows is None else rows.shape[0]
+        self.start = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data) -> bool:
+        if self.start >= self.n_rows:
+            return False
+        rows = slice(self.start, self.start + self.chunk_size)
+        if self.rows is not None:
+            rows = self.rows[rows]
+        input_data(data=np.asarray(self.x[rows]), label=np.asarray(self.y[rows]),
+                   weight=None if self.sample_weight is None else self.sample_weight[rows])
+        self.start += self.chunk_size
+        return True
+
+    def reset(self) -> None:
+        self.start = 0
+
+
+def get_booster_params(params:dict, n_classes:int) -> dict:
+    """Returns the xgboost.train parameters of the XGBClassifier 'params' for a target of 'n_classes' classes."""
+    booster_params = {name : value for name, value in params.items() if name not in _SKLEARN_ONLY_PARAMS}
+    booster_params.setdefault("objective", "binary:logistic" if n_classes <= 2 else "multi:softprob")
+    if n_classes > 2:
+        booster_params["num_class"] = n_classes
+    if params.get("n_jobs") is not None:
+        booster_params["nthread"] = params["n_jobs"]
+    return booster_params
+
+
+def build_matrix(x:np.ndarray, y:np.ndarray, booster_params:dict, rows:np.ndarray | None = None,
+                 sample_weight:np.ndarray | None = None, chunk_size:int = 50000,
+                 ref:xgb.QuantileDMatrix | None = None) -> xgb.QuantileDMatrix:
+    """Returns the QuantileDMatrix of 'rows' of the arrays, all of them if None, built
+    'chunk_size' rows at a time; a validation matrix takes the bins of its training one, 'ref'."""
+    if not hasattr(xgb, "QuantileDMatrix"):
+        raise Exception(f"Training from chunks needs xgboost>=1.7, found {xgb.__version__}.")
+    matrix_params = {"nthread" : booster_params.get("nthread")}
+    if "max_bin" in booster_params:
+        matrix_params["max_bin"] = booster_params["max_bin"]
+    return xgb.QuantileDMatrix(ArrayBatches(x, y, sample_weight, chunk_size, rows=rows), ref=ref, **matrix_params)
+
+
+def predict_labels(booster:xgb.Booster, x:np.ndarray, rows:np.ndarray | None = None, chunk_size:int = 50000,
+                   iteration_range:tuple = (0, 0)) -> np.ndarray:
+    """Returns the labels XGBClassifier.predict gives for 'rows' of 'x', all of them if None,
+    predicted 'chunk_size' rows at a time."""
+    n_rows = x.shape[0] if rows is None else rows.shape[0]
+    labels = []
+    for start in range(0, n_rows, chunk_size):
+        chunk = slice(start, start + chunk_size) if rows is None else rows[start:start + chunk_size]
+        probabilities = booster.inplace_predict(np.asarray(x[chunk]), iteration_range=iteration_range)
+        labels.append(np.argmax(probabilities, axis=1) if probabilities.ndim == 2 else (probabilities > 0.5).astype(np.int64))
+    return np.concatenate(labels or [np.empty(0, dtype=np.int64)])
+
+
+def train_classifier(x:np.ndarray, y:np.ndarray, params:dict, sample_weight:np.ndarray | None = None,
+                     external_memory:bool = False, chunk_size:int = 50000, cache_dir:str | None = None,
+                     xgb_model:xgb.Booster | None = None, rows:np.ndarray | None = None) -> XGBClassifier:
+    """Trains the same model as XGBClassifier(**params).fit(x, y) with the native API : the
+    quantized DMatrix of the 'hist' tree method is built chunk by chunk from the arrays by a
+    QuantileDMatrix, which never holds a float copy of the data, and the booster is trained
+    by xgboost.train. The booster is returned as a fitted XGBClassifier, so the saved model is
+    used as any other.
+
+    Args:
+        x (np.ndarray): 2D array of the features, can be memory mapped
+        y (np.ndarray): encoded labels 0 .. n_classes - 1
+        params (dict): XGBClassifier parameters
+        sample_weight (np.ndarray, optional): weight of every row
+        external_memory (bool): keep the quantized pages in a temporary directory of 'cache_dir'
+            rather than in memory, for data larger than memory
+        chunk_size (int): rows per batch given to XGBoost
+        cache_dir (str, optional): directory of the external memory pages; the system temporary directory if None
+        xgb_model (xgb.Booster, optional): fitted booster the new trees are added to
+        rows (np.ndarray, optional): rows of the arrays to train on, all of them if None
+
+    Returns:
+        XGBClassifier: fitted model
+    """
+    try:
+        if not hasattr(xgb, "QuantileDMatrix"):
+            raise Exception(f"The native training engine needs xgboost>=1.7, found {xgb.__version__}.")
+
+        booster_params = get_booster_params(params, n_classes=int(np.max(y)) + 1)
+        num_boost_round = params.get("n_estimators") or 100
+
+        matrix_params = {"nthread" : booster_params.get("nthread")}
+        if "max_bin" in booster_params:
+            matrix_params["max_bin"] = booster_params["max_bin"]
+
+        matrix_dir = None
+        try:
+            if external_memory:
+                if cache_dir is not None:
+                    os.makedirs(cache_dir, exist_ok=True)
+                matrix_dir = tempfile.mkdtemp(prefix="dmatrix-", dir=cache_dir)
+                batches = ArrayBatches(x, y, sample_weight, chunk_size, cache_prefix=os.path.join(matrix_dir, "cache"),
+                                       rows=rows)
+                # ExtMemQuantileDMatrix since xgboost 3.0, an iterator DMatrix before
+                if hasattr(xgb, "ExtMemQuantileDMatrix"):
+                    dtrain = xgb.ExtMemQuantileDMatrix(batches, **matrix_params)
+                else:
+                    dtrain = xgb.DMatrix(batches, nthread=matrix_params["nthread"])
+            else:
+                dtrain = build_matrix(x, y, booster_params, rows=rows, sample_weight=sample_weight, chunk_size=chunk_size)
+
+            logging.info(f"Training {num_boost_round} rounds with the native API "
+                         f"({'external memory' if external_memory else 'in memory'}) : {booster_params}")
+            booster = xgb.train(booster_params, dtrain, num_boost_round=num_boost_round, xgb_model=xgb_model)
+            del dtrain
+        finally:
+            if matrix_dir is not None:
+                shutil.rmtree(matrix_dir, ignore_errors=True)
+
+        model = XGBClassifier(**params)
+        model.load_model(bytearray(booster.save_raw("json")))
+        return model
+    except Exception as e:
+        raise SensorException(e, sys)
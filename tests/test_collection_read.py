@@ -0,0 +1,99 @@
+import mongomock
+import numpy as np
+import pandas as pd
+import pytest
+from sensor import utils
+from sensor.config import TARGET_COLUMN
+from sensor.schema import FEATURE_COLUMNS, SCHEMA_COLUMNS
+
+
+DB_NAME = "APS"
+COLLECTION_NAME = "SENSOR_DATA"
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    """Collection of an in process mongomock client, used by sensor.utils."""
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(utils, "mongo_client", client)
+    return client[DB_NAME][COLLECTION_NAME]
+
+
+def insert_documents(collection, n_documents:int, seed:int = 0) -> None:
+    """Inserts documents with a few sensor values; the first one holds the target only."""
+    rng = np.random.default_rng(seed)
+    documents = [{TARGET_COLUMN : "neg"}]
+    for i in range(1, n_documents):
+        document = {TARGET_COLUMN : "pos" if rng.random() < 0.1 else "neg"}
+        for column in FEATURE_COLUMNS[:4]:
+            if rng.random() < 0.8:
+                document[column] = float(rng.integers(0, 1000))
+        document[FEATURE_COLUMNS[4]] = "na"
+        documents.append(document)
+    collection.insert_many(documents)
+
+
+@pytest.mark.parametrize("n_partitions", [1, 3, 8])
+def test_partition_queries_cover_the_collection(collection, n_partitions):
+    insert_documents(collection, 1000)
+    queries = utils.get_partition_queries(DB_NAME, COLLECTION_NAME, n_partitions)
+    assert len(queries) == n_partitions
+    counts = [collection.count_documents(query) for query in queries]
+    assert sum(counts) == 1000
+    # the boundaries are quantiles of 100 sampled keys per range
+    assert min(counts) > 0.5 * 1000 / n_partitions
+
+    ids = [[document["_id"] for document in collection.find(query, {"_id" : 1}).sort("_id", 1)] for query in queries]
+    for lower, upper in zip(ids[:-1], ids[1:]):
+        assert lower[-1] < upper[0]
+
+
+def test_partition_queries_of_an_empty_collection(collection):
+    assert utils.get_partition_queries(DB_NAME, COLLECTION_NAME, 4) == [{}]
+
+
+def test_partitioned_read_matches_the_single_cursor_read(collection):
+    insert_documents(collection, 1500)
+    expected = utils.get_dataframe_from_collection(DB_NAME, COLLECTION_NAME, batch_size=100)
+    df = utils.get_dataframe_from_collection(DB_NAME, COLLECTION_NAME, batch_size=100, n_workers=4)
+
+    # every column of the schema, even the ones missing from the first document
+    assert list(df.columns) == SCHEMA_COLUMNS
+    assert df.shape[0] == 1500
+    pd.testing.assert_frame_equal(df, expected)
+    assert (df[FEATURE_COLUMNS[:5]].dtypes == np.float32).all()
+    assert df.loc[0, FEATURE_COLUMNS[:5]].isnull().all()
+    assert df[FEATURE_COLUMNS[4]].isnull().all()
+    assert df[FEATURE_COLUMNS[0]].notnull().mean() > 0.7
+
+
+def test_iter_dataframe_yields_float32_chunks(collection):
+    insert_documents(collection, 1000)
+    chunks = list(utils.iter_dataframe_from_collection(DB_NAME, COLLECTION_NAME, batch_size=400))
+
+    assert [chunk.shape[0] for chunk in chunks] == [400, 400, 200]
+    # without a projection, every chunk has the columns of the first one, '_id' excluded
+    columns = list(chunks[0].columns)
+    assert "_id" not in columns and set(columns) == {TARGET_COLUMN, *FEATURE_COLUMNS[:5]}
+    df = pd.concat(chunks, ignore_index=True)
+    assert all(list(chunk.columns) == columns for chunk in chunks)
+    assert (df[FEATURE_COLUMNS[:5]].dtypes == np.float32).all()
+    # non numeric values become missing, the target is kept as it is
+    assert df[FEATURE_COLUMNS[4]].isnull().all()
+    assert set(df[TARGET_COLUMN]) == {"neg", "pos"}
+
+    expected = pd.DataFrame(list(collection.find({}, {"_id" : 0})))
+    np.testing.assert_array_equal(df[FEATURE_COLUMNS[0]].to_numpy(),
+                                  expected[FEATURE_COLUMNS[0]].to_numpy(dtype=np.float32))
+
+
+def test_iter_dataframe_with_projection_query_and_limit(collection):
+    insert_documents(collection, 1000)
+    projection = [FEATURE_COLUMNS[1], TARGET_COLUMN, FEATURE_COLUMNS[0]]
+    chunks = list(utils.iter_dataframe_from_collection(DB_NAME, COLLECTION_NAME, batch_size=30, projection=projection,
+                                                       query={TARGET_COLUMN : "pos"}, limit=50))
+
+    assert [chunk.shape[0] for chunk in chunks] == [30, 20]
+    assert all(list(chunk.columns) == projection for chunk in chunks)
+    assert all((chunk[TARGET_COLUMN] == "pos").all() for chunk in chunks)
+    assert all((chunk[projection[::2]].dtypes == np.float32).all() for chunk in chunks)
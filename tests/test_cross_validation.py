@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from sensor.exception import SensorException
+from sensor.cross_validation import CrossValidation
+
+
+def test_folds_are_stratified():
+    y = np.repeat([0, 1, 2], [103, 21, 7])
+    folds = CrossValidation(n_folds=4).split(y)
+    assert len(folds) == 4
+    np.testing.assert_array_equal(np.sort(np.concatenate(folds)), np.arange(y.shape[0]))
+    for label in [0, 1, 2]:
+        counts = [int((y[fold] == label).sum()) for fold in folds]
+        assert max(counts) - min(counts) <= 1
+
+
+def test_one_fold_is_refused():
+    with pytest.raises(SensorException, match="at least 2 folds"):
+        CrossValidation(n_folds=1).split(np.zeros(10))
+
+
+@pytest.mark.parametrize("n_jobs", [1, 3])
+def test_evaluate_scores_every_fold(tmp_path, monkeypatch, n_jobs):
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=(300, 4)).astype(np.float32)
+    y = (x[:, 0] + rng.normal(scale=0.7, size=300) > 0.8).astype(np.int64)
+    np.save(str(tmp_path / "x.npy"), x)
+    np.save(str(tmp_path / "y.npy"), y)
+
+    summary = CrossValidation(n_folds=3, n_jobs=n_jobs, chunk_size=64).evaluate(
+        str(tmp_path / "x.npy"), str(tmp_path / "y.npy"), {"n_estimators" : 10, "max_depth" : 3},
+        work_dir=str(tmp_path / "cross_validation"))
+
+    assert summary["n_folds"] == 3
+    assert [fold["fold"] for fold in summary["folds"]] == [0, 1, 2]
+    assert sum(fold["n_validation_rows"] for fold in summary["folds"]) == 300
+    assert all(fold["n_fit_rows"] + fold["n_validation_rows"] == 300 for fold in summary["folds"])
+    scores = np.array([fold["f1_validation_score"] for fold in summary["folds"]])
+    assert summary["f1_mean"] == pytest.approx(scores.mean())
+    # sample variance of the fold scores
+    assert summary["f1_variance"] == pytest.approx(((scores - scores.mean()) ** 2).sum() / 2)
+    assert summary["f1_variance"] > 0
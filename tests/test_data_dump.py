@@ -0,0 +1,34 @@
+import os
+import sys
+import mongomock
+import numpy as np
+import pandas as pd
+from sensor.config import TARGET_COLUMN
+from sensor.schema import FEATURE_COLUMNS
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_dump import dump_csv_to_collection
+
+
+def test_dump_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({column : rng.integers(0, 10**9, 2300).astype(np.float64) for column in FEATURE_COLUMNS[:5]})
+    df.loc[rng.random(2300) < 0.2, FEATURE_COLUMNS[1]] = np.nan
+    df.insert(0, TARGET_COLUMN, np.where(rng.random(2300) < 0.1, "pos", "neg"))
+    file_path = str(tmp_path / "sensor.csv")
+    df.to_csv(file_path, index=False, na_rep="na")
+
+    table = mongomock.MongoClient()["APS"]["SENSOR_DATA"]
+    # chunks smaller than the file, more of them than workers
+    assert dump_csv_to_collection(file_path, table, chunk_size=300, n_workers=3) == 2300
+    assert table.count_documents({}) == 2300
+
+    documents = list(table.find({}, {"_id" : 0}))
+    assert all(set(document) == set(df.columns) for document in documents)
+    # the inserts are unordered : compare the rows sorted by their values
+    dumped = pd.DataFrame.from_records(documents, columns=list(df.columns)).fillna(np.nan)
+    sort_columns = [TARGET_COLUMN] + FEATURE_COLUMNS[:5]
+    pd.testing.assert_frame_equal(dumped.sort_values(sort_columns, ignore_index=True),
+                                  df.sort_values(sort_columns, ignore_index=True))
+    assert all(document[FEATURE_COLUMNS[1]] is None for document in documents
+               if pd.isnull(document[FEATURE_COLUMNS[1]]))
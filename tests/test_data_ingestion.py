@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sensor.config import TARGET_COLUMN
+from sensor.entity.config_entity import DataIngestionConfig, TrainingPipelineConfig
+from sensor.feature_store import FeatureStore
+from sensor.components.data_ingestion import DataIngestion
+
+
+def get_frame(n_rows:int, positive_share:float, seed:int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({f"sensor_{i}" : rng.lognormal(0, 1, n_rows).astype(np.float32) for i in range(3)})
+    df[TARGET_COLUMN] = np.where(rng.random(n_rows) < positive_share, "pos", "neg")
+    return df
+
+
+@pytest.fixture
+def data_ingestion(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    config = DataIngestionConfig(TrainingPipelineConfig())
+    config.incremental = True
+    config.chunk_size = 700
+    return DataIngestion(config)
+
+
+def test_hashed_split_is_stratified(tmp_path, data_ingestion):
+    feature_store = FeatureStore(str(tmp_path / "feature_store"))
+    # small partitions with few positives : the rounding is carried from one partition to the next
+    for i, n_rows in enumerate([3000, 250, 180, 400]):
+        feature_store.append(get_frame(n_rows, 0.017, seed=i), watermark=i)
+    target = feature_store.load(columns=[TARGET_COLUMN])[TARGET_COLUMN].to_numpy()
+
+    train_rows, test_rows = data_ingestion.get_split_index(feature_store)
+    np.testing.assert_array_equal(np.sort(np.concatenate([train_rows, test_rows])), np.arange(target.shape[0]))
+    for label in ["pos", "neg"]:
+        n_rows = (target == label).sum()
+        assert (target[test_rows] == label).sum() == round(0.2 * n_rows)
+
+
+def test_hashed_split_keeps_the_set_of_old_rows(tmp_path, data_ingestion):
+    feature_store = FeatureStore(str(tmp_path / "feature_store"))
+    feature_store.append(get_frame(2000, 0.05, seed=0), watermark=0)
+    train_rows, test_rows = data_ingestion.get_split_index(feature_store)
+
+    feature_store.append(get_frame(300, 0.05, seed=1), watermark=1)
+    new_train_rows, new_test_rows = data_ingestion.get_split_index(feature_store)
+    np.testing.assert_array_equal(new_train_rows[new_train_rows < 2000], train_rows)
+    np.testing.assert_array_equal(new_test_rows[new_test_rows < 2000], test_rows)
@@ -0,0 +1,154 @@
+import warnings
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.preprocessing import LabelEncoder
+from sensor.config import TARGET_COLUMN
+from sensor.entity.artifact_entity import DataIngestionArtifact
+from sensor.entity.config_entity import DataTransformationConfig, TrainingPipelineConfig
+from sensor import utils
+from sensor.feature_store import FeatureStore
+from sensor.tuning import get_fit_params
+from sensor.components.data_transformation import DataTransformation
+
+
+# the imputer warns when it drops the all missing column
+pytestmark = pytest.mark.filterwarnings("ignore:Skipping features without any observed values")
+
+
+def get_data_transformation(tmp_path, n_rows:int = 400) -> tuple:
+    """Returns a DataTransformation over a feature store of skewed float32 columns with missing
+    values, a constant and an all missing column, and the training rows."""
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({f"sensor_{i}" : rng.lognormal(i % 3, 1.5, n_rows).round(i) for i in range(5)})
+    for i in range(5):
+        df.loc[rng.random(n_rows) < 0.15 * (i % 3), f"sensor_{i}"] = np.nan
+    df["constant"] = 2.0
+    df["all_missing"] = np.nan
+    df = df.astype(np.float32)
+    df[TARGET_COLUMN] = np.where(rng.random(n_rows) < 0.2, "pos", "neg")
+
+    feature_store = FeatureStore(str(tmp_path / "feature_store"))
+    feature_store.append(df, watermark=n_rows)
+    train_rows = np.sort(rng.choice(n_rows, int(n_rows * 0.8), replace=False))
+    train_file_path = str(tmp_path / "train_index.npy")
+    np.save(train_file_path, train_rows)
+
+    data_ingestion_artifact = DataIngestionArtifact(feature_store_file_path=feature_store.feature_store_dir,
+                                                    train_path=train_file_path, test_path=None)
+    config = DataTransformationConfig(TrainingPipelineConfig())
+    return DataTransformation(config, data_ingestion_artifact), feature_store, train_rows
+
+
+def test_fit_from_profile_matches_pipeline_fit(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data_transformation, feature_store, train_rows = get_data_transformation(tmp_path)
+    feature_columns = [column for column in feature_store.get_columns() if column != TARGET_COLUMN]
+    train_df = feature_store.load(columns=feature_columns, rows=train_rows)
+
+    expected = DataTransformation.get_data_transformer_object().fit(train_df)
+    pipeline = data_transformation.fit_transformer_from_profile(
+        DataTransformation.get_data_transformer_object(), feature_store, train_rows, feature_columns)
+
+    assert list(pipeline.feature_names_in_) == feature_columns
+    np.testing.assert_array_equal(pipeline.named_steps["Imputer"].statistics_,
+                                  expected.named_steps["Imputer"].statistics_.astype(np.float64))
+    for attribute in ["center_", "scale_"]:
+        np.testing.assert_allclose(getattr(pipeline.named_steps["RobustScaler"], attribute),
+                                   getattr(expected.named_steps["RobustScaler"], attribute), rtol=1e-6)
+    test_df = feature_store.load(columns=feature_columns)
+    output = pipeline.transform(test_df)
+    assert output.shape == (test_df.shape[0], len(feature_columns) - 1)
+    np.testing.assert_allclose(output, expected.transform(test_df), rtol=1e-5, atol=1e-6)
+
+
+def test_fit_from_profile_does_not_warn(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data_transformation, feature_store, train_rows = get_data_transformation(tmp_path)
+    feature_columns = [column for column in feature_store.get_columns() if column != TARGET_COLUMN]
+    with warnings.catch_warnings(record=True) as record:
+        warnings.simplefilter("always")
+        data_transformation.fit_transformer_from_profile(
+            DataTransformation.get_data_transformer_object(), feature_store, train_rows, feature_columns)
+    assert [str(warning.message) for warning in record] == []
+
+
+def test_set_fitted_state_refuses_other_sklearn_versions(monkeypatch):
+    monkeypatch.setattr("sklearn.__version__", "0.24.2")
+    with pytest.raises(Exception, match="cannot be fitted from the column profile"):
+        DataTransformation.set_fitted_state(DataTransformation.get_data_transformer_object(), ["a"], ["a"],
+                                            np.zeros(1), np.ones(1))
+
+
+def test_fit_from_profile_falls_back_to_pipeline_fit(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data_transformation, feature_store, train_rows = get_data_transformation(tmp_path)
+    feature_columns = [column for column in feature_store.get_columns() if column != TARGET_COLUMN]
+    train_df = feature_store.load(columns=feature_columns, rows=train_rows)
+    expected = DataTransformation.get_data_transformer_object().fit(train_df)
+
+    monkeypatch.setattr("sklearn.__version__", "0.24.2")
+    pipeline = data_transformation.fit_transformer_from_profile(
+        DataTransformation.get_data_transformer_object(), feature_store, train_rows, feature_columns)
+    test_df = feature_store.load(columns=feature_columns)
+    np.testing.assert_array_equal(pipeline.transform(test_df), expected.transform(test_df))
+
+
+def test_class_weights_of_a_binary_target():
+    label_encoder = LabelEncoder().fit(["neg", "pos"])
+    target_arr = label_encoder.transform(np.array(["neg"] * 80 + ["pos"] * 20))
+    class_weights = DataTransformation(None, None).get_class_weights(target_arr, label_encoder)
+
+    assert class_weights["class_counts"] == {0 : 80, 1 : 20}
+    assert class_weights["class_weights"] == {0 : 0.625, 1 : 2.5}
+    assert class_weights["labels"] == {"neg" : 0, "pos" : 1}
+    # negatives per positive, the weight XGBoost gives to the positive class
+    assert class_weights["scale_pos_weight"] == 4.0
+    assert get_fit_params(target_arr, class_weights) == ({"scale_pos_weight" : 4.0}, None)
+
+
+def test_transform_in_place_matches_pipeline_transform(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data_transformation, feature_store, train_rows = get_data_transformation(tmp_path)
+    # several chunks, the last one partial
+    data_transformation.data_transformation_config.chunk_size = 70
+    feature_columns = [column for column in feature_store.get_columns() if column != TARGET_COLUMN]
+    pipeline = DataTransformation.get_data_transformer_object().fit(
+        feature_store.load(columns=feature_columns, rows=train_rows))
+
+    rows = np.arange(sum(feature_store.get_partition_sizes()))
+    output = data_transformation.transform_in_place(pipeline, feature_store, rows)
+    expected = pipeline.transform(feature_store.load(columns=feature_columns, rows=rows))
+    assert output.dtype == np.float32
+    np.testing.assert_array_equal(output, expected)
+
+
+@pytest.mark.parametrize("mode", ["default", "float32", "out_of_core"])
+def test_saved_arrays_are_memory_mapped_apart(tmp_path, monkeypatch, mode):
+    monkeypatch.chdir(tmp_path)
+    data_transformation, feature_store, train_rows = get_data_transformation(tmp_path)
+    test_rows = np.setdiff1d(np.arange(sum(feature_store.get_partition_sizes())), train_rows)
+    np.save(str(tmp_path / "test_index.npy"), test_rows)
+    data_transformation.data_ingestion_artifact.test_file_path = str(tmp_path / "test_index.npy")
+    config = data_transformation.data_transformation_config
+    config.resampling_method = "none"
+    config.float32 = mode == "float32"
+    config.out_of_core = mode == "out_of_core"
+    config.chunk_size = 70
+    data_transformation.transform_and_save()
+
+    metadata = utils.read_yaml_file(config.transformed_metadata_path)
+    label_encoder = utils.load_object(config.target_encoder_path)
+    for name, features_path, target_path, rows in [
+            ("train", config.transformed_train_path, config.transformed_train_target_path, train_rows),
+            ("test", config.transformed_test_path, config.transformed_test_target_path, test_rows)]:
+        features = utils.load_numpy_array(features_path, mmap_mode="r")
+        target = utils.load_numpy_array(target_path, mmap_mode="r")
+        assert isinstance(features, np.memmap) and isinstance(target, np.memmap)
+        assert features.flags.c_contiguous
+        assert features.shape == (metadata[f"n_{name}_rows"], len(metadata["feature_names"]))
+        assert (features.dtype.str, target.dtype.str) == (metadata["dtypes"][f"{name}_features"],
+                                                         metadata["dtypes"][f"{name}_target"])
+        np.testing.assert_array_equal(target, label_encoder.transform(
+            feature_store.load(columns=[TARGET_COLUMN], rows=rows)[TARGET_COLUMN]))
+    assert not metadata["train_resampled"] and not metadata["test_resampled"]
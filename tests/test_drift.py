@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from scipy.stats import ks_2samp
+from sensor.drift import ks_2samp_columns
+
+
+def get_samples(n1:int, n2:int, dtype, seed:int = 0) -> tuple:
+    """Returns base and current columns : some shifted, rounded so that values repeat, with NaN values."""
+    rng = np.random.default_rng(seed)
+    base = rng.normal(size=(n1, 6))
+    current = rng.normal(size=(n2, 6)) + np.linspace(0, 0.2, 6)
+    base[:, 1], current[:, 1] = base[:, 1].round(1), current[:, 1].round(1)
+    base[rng.random(n1) < 0.1, 2] = np.nan
+    current[rng.random(n2) < 0.3, 3] = np.nan
+    return base.astype(dtype), current.astype(dtype)
+
+
+def scipy_ks(base:np.ndarray, current:np.ndarray, **kwargs) -> tuple:
+    results = [ks_2samp(b[~np.isnan(b)], c[~np.isnan(c)], **kwargs) for b, c in zip(base.T, current.T)]
+    return np.array([result.statistic for result in results]), np.array([result.pvalue for result in results])
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_ks_2samp_columns_matches_scipy(dtype):
+    base, current = get_samples(3000, 2000, dtype)
+    statistics, pvalues = ks_2samp_columns(base, current)
+    expected_statistics, expected_pvalues = scipy_ks(base, current, method="asymp")
+    np.testing.assert_allclose(statistics, expected_statistics, rtol=1e-12)
+    np.testing.assert_allclose(pvalues, expected_pvalues, rtol=1e-9, atol=1e-12)
+
+
+def test_large_samples_match_the_default_ks_2samp():
+    # over 10000 values ks_2samp uses the asymptotic distribution
+    base, current = get_samples(12000, 11000, np.float32, seed=1)
+    _, pvalues = ks_2samp_columns(base, current)
+    np.testing.assert_allclose(pvalues, scipy_ks(base, current)[1], rtol=1e-9, atol=1e-12)
+
+
+def test_stephens_pvalues_are_close_to_scipy():
+    for seed in range(5):
+        base, current = get_samples(3000, 2000, np.float32, seed=seed)
+        _, pvalues = ks_2samp_columns(base, current, exact_pvalues=False)
+        np.testing.assert_allclose(pvalues, scipy_ks(base, current, method="asymp")[1], atol=5e-3)
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sensor import utils
+from sensor.config import TARGET_COLUMN
+from sensor.exception import SensorException
+from sensor.feature_store import FeatureStore
+
+
+def get_frame(start:int, n_rows:int) -> pd.DataFrame:
+    return pd.DataFrame({"sensor_0" : np.arange(start, start + n_rows, dtype=np.float32),
+                         TARGET_COLUMN : np.where(np.arange(n_rows) % 5 == 0, "pos", "neg")})
+
+
+def test_append_chunks_commits_the_partitions_and_the_watermark(tmp_path):
+    feature_store = FeatureStore(str(tmp_path / "feature_store"))
+    feature_store.append(get_frame(0, 50), watermark=50)
+    # empty chunks add no partition
+    partition_paths = feature_store.append_chunks([get_frame(50, 30), get_frame(80, 0), get_frame(80, 20)], watermark=100)
+
+    assert partition_paths == [str(tmp_path / "feature_store" / "part-00001"), str(tmp_path / "feature_store" / "part-00002")]
+    manifest = {"partitions" : ["part-00000", "part-00001", "part-00002"], "partition_sizes" : [50, 30, 20], "watermark" : 100}
+    assert utils.read_yaml_file(feature_store.manifest_path) == manifest
+    # a new instance reads the committed manifest
+    reopened = FeatureStore(str(tmp_path / "feature_store"))
+    assert reopened.read_manifest() == manifest
+    assert reopened.get_watermark() == 100
+    np.testing.assert_array_equal(reopened.load(columns=["sensor_0"])["sensor_0"], np.arange(100, dtype=np.float32))
+
+
+def test_append_chunks_without_rows_keeps_the_watermark(tmp_path):
+    feature_store = FeatureStore(str(tmp_path / "feature_store"))
+    feature_store.append(get_frame(0, 50), watermark=50)
+    assert feature_store.append_chunks([get_frame(50, 0)], watermark=60) == []
+    assert FeatureStore(str(tmp_path / "feature_store")).read_manifest() == {
+        "partitions" : ["part-00000"], "partition_sizes" : [50], "watermark" : 50}
+
+
+def test_failed_append_chunks_commits_nothing(tmp_path):
+    feature_store = FeatureStore(str(tmp_path / "feature_store"))
+    feature_store.append(get_frame(0, 50), watermark=50)
+
+    def chunks():
+        yield get_frame(50, 30)
+        raise Exception("source read failed")
+    with pytest.raises(SensorException, match="source read failed"):
+        feature_store.append_chunks(chunks(), watermark=100)
+
+    # the partition written before the failure is not committed, and the rows are fetched again
+    reopened = FeatureStore(str(tmp_path / "feature_store"))
+    assert (reopened.get_watermark(), reopened.get_partition_sizes()) == (50, [50])
+    reopened.append_chunks([get_frame(50, 40)], watermark=90)
+    assert FeatureStore(str(tmp_path / "feature_store")).read_manifest() == {
+        "partitions" : ["part-00000", "part-00001"], "partition_sizes" : [50, 40], "watermark" : 90}
+    np.testing.assert_array_equal(reopened.load(columns=["sensor_0"])["sensor_0"], np.arange(90, dtype=np.float32))
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+from sklearn.preprocessing import LabelEncoder
+from sensor.entity.config_entity import ModelTrainingConfig, TrainingPipelineConfig
+from sensor.components.data_transformation import DataTransformation
+from sensor.components.model_trainer import ModelTrainer
+
+
+def get_arrays(n_classes:int) -> tuple:
+    """Tiny imbalanced float32 features and encoded labels; fewer rows than bins, so the
+    quantile sketch built from chunks has the same cuts as the one of the whole array."""
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=(240, 6)).astype(np.float32)
+    x[rng.random(x.shape) < 0.1] = np.nan
+    scores = np.nan_to_num(x[:, 0] + 0.5 * x[:, 1]) + rng.normal(scale=0.5, size=240)
+    y = np.digitize(scores, np.quantile(scores, [0.8, 0.95][:n_classes - 1])).astype(np.int64)
+    return x, y
+
+
+@pytest.mark.parametrize("n_classes", [2, 3])
+@pytest.mark.parametrize("engine", ["native", "external_memory"])
+def test_native_engines_predict_as_the_sklearn_engine(tmp_path, monkeypatch, n_classes, engine):
+    monkeypatch.chdir(tmp_path)
+    x, y = get_arrays(n_classes)
+    label_encoder = LabelEncoder().fit(y)
+    class_weights = DataTransformation(None, None).get_class_weights(y, label_encoder)
+    config = ModelTrainingConfig(TrainingPipelineConfig())
+    config.n_threads = 1
+    # several batches, the last one partial
+    config.chunk_size = 64
+    model_trainer = ModelTrainer(config, data_transformation_artifact=None)
+    params = {"n_estimators" : 20, "max_depth" : 3}
+
+    expected = model_trainer.train_model(x, y, class_weights=class_weights, params=params)
+    config.training_engine = engine
+    model = model_trainer.train_model(x, y, class_weights=class_weights, params=params)
+
+    np.testing.assert_array_equal(model_trainer.predict(model, x), model_trainer.predict(expected, x))
+    np.testing.assert_allclose(model.predict_proba(x), expected.predict_proba(x), rtol=1e-5, atol=1e-6)
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from imblearn.combine import SMOTETomek
+from imblearn.over_sampling import SMOTE
+from imblearn.under_sampling import TomekLinks
+from sensor.resampling import Resampler, get_query_chunk_size, nearest_neighbors, tomek_links
+
+
+def get_data(n_samples:int, n_features:int, n_classes:int, seed:int = 0) -> tuple:
+    """Returns overlapping gaussian classes, the first one the largest."""
+    rng = np.random.default_rng(seed)
+    y = np.where(rng.random(n_samples) < 0.7, 0, rng.integers(1, n_classes, n_samples))
+    X = rng.normal(size=(n_samples, n_features)) + 0.5 * y[:, None]
+    return X.astype(np.float32), y
+
+
+def get_imblearn_links(X:np.ndarray, y:np.ndarray) -> np.ndarray:
+    tomek = TomekLinks(sampling_strategy="all")
+    tomek.fit_resample(X, y)
+    is_link = np.ones(y.shape[0], dtype=bool)
+    is_link[tomek.sample_indices_] = False
+    return is_link
+
+
+@pytest.mark.parametrize("n_classes", [2, 3])
+@pytest.mark.parametrize("n_features", [4, 40])
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_tomek_links_match_imblearn(n_classes, n_features, n_jobs):
+    X, y = get_data(3000, n_features, n_classes)
+    expected = get_imblearn_links(X, y)
+    assert expected.sum() > 0
+    # chunks smaller than the query, so that several matrix products are joined
+    np.testing.assert_array_equal(tomek_links(X, y, chunk_size=500, n_jobs=n_jobs), expected)
+
+
+def test_query_chunks_fit_the_memory_budget():
+    # 57k samples : 470 MB per thread for chunks of 2048 samples
+    assert get_query_chunk_size(57000, n_jobs=1, memory_budget=256 * 2**20) == 1177
+    assert get_query_chunk_size(57000, n_jobs=4, memory_budget=256 * 2**20) == 294
+    assert get_query_chunk_size(10**9, n_jobs=4, memory_budget=256 * 2**20) == 1
+
+
+@pytest.mark.parametrize("n_jobs", [1, 3])
+def test_nearest_neighbors_with_a_small_memory_budget(n_jobs):
+    X, _ = get_data(1000, 8, 2)
+    query = np.arange(0, 1000, 3)
+    distances = ((X[query, None, :].astype(np.float64) - X[None, :, :]) ** 2).sum(axis=2)
+    distances[np.arange(query.shape[0]), query] = np.inf
+    # chunks of 12 samples for a single thread, 4 for three
+    neighbors = nearest_neighbors(X, query, n_jobs=n_jobs, memory_budget=4 * 1000 * 12)
+    np.testing.assert_array_equal(neighbors, distances.argmin(axis=1))
+
+
+def test_tomek_links_without_links():
+    X = np.array([[0.0], [0.1], [5.0], [5.1]], dtype=np.float32)
+    y = np.array([0, 0, 1, 1])
+    assert not tomek_links(X, y).any()
+
+
+def test_resampler_matches_smote_tomek():
+    X, y = get_data(2000, 10, 2)
+    expected_X, expected_y = SMOTETomek(sampling_strategy="minority", random_state=42,
+                                        tomek=TomekLinks(sampling_strategy="all")).fit_resample(X, y)
+    resampled_X, resampled_y = Resampler(SMOTE(sampling_strategy="minority", random_state=42),
+                                         chunk_size=700).fit_resample(X, y)
+    np.testing.assert_array_equal(resampled_y, expected_y)
+    np.testing.assert_array_equal(resampled_X, expected_X)
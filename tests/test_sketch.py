@@ -0,0 +1,76 @@
+import pickle
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import ks_2samp
+from sensor.sketch import ColumnSketch
+
+
+def get_frame(n_rows:int, shift:float, seed:int) -> pd.DataFrame:
+    """Returns a lognormal, a discrete, a normal and a mostly null column, moved by 'shift'."""
+    rng = np.random.default_rng(seed)
+    lognormal_with_nulls = rng.lognormal(shift, 1.0, n_rows)
+    lognormal_with_nulls[rng.random(n_rows) < 0.9] = np.nan
+    return pd.DataFrame({
+        "lognormal" : rng.lognormal(2 + shift, 1.5, n_rows),
+        "discrete" : rng.poisson(2 + shift, n_rows).astype(np.float64),
+        "normal" : rng.normal(shift, 1.0, n_rows),
+        "mostly_null" : lognormal_with_nulls,
+        "label" : np.where(rng.random(n_rows) < 0.1 + shift / 10, "pos", "neg"),
+    })
+
+
+NUMERIC_COLUMNS = ["lognormal", "discrete", "normal", "mostly_null"]
+
+
+def get_sketch(df:pd.DataFrame, relative_accuracy:float = 0.01) -> ColumnSketch:
+    sketch = ColumnSketch(NUMERIC_COLUMNS, other_columns=["label"], relative_accuracy=relative_accuracy)
+    sketch.update(df)
+    return sketch
+
+
+@pytest.mark.parametrize("shift", [0.0, 0.05, 0.5])
+@pytest.mark.parametrize("relative_accuracy", [0.01, 0.05])
+def test_ks_statistic_within_its_error_bound(shift, relative_accuracy):
+    base_df, current_df = get_frame(20000, 0.0, seed=0), get_frame(5000, shift, seed=1)
+    comparison = get_sketch(base_df, relative_accuracy).compare(get_sketch(current_df, relative_accuracy),
+                                                                NUMERIC_COLUMNS + ["label"])
+    for column in NUMERIC_COLUMNS + ["label"]:
+        base_values, current_values = base_df[column].dropna(), current_df[column].dropna()
+        if column == "label":
+            # ks_2samp needs ordered values, the labels are compared in sorted order
+            base_values, current_values = base_values == "pos", current_values == "pos"
+        exact = ks_2samp(base_values.to_numpy(dtype=np.float64), current_values.to_numpy(dtype=np.float64)).statistic
+        result = comparison[column]
+        assert result["ks_statistic"] <= exact + 1e-12, column
+        assert exact - result["ks_statistic"] <= result["ks_statistic_error"] + 1e-12, column
+
+
+def test_discrete_columns_have_no_error():
+    comparison = get_sketch(get_frame(5000, 0.0, seed=0)).compare(get_sketch(get_frame(5000, 0.5, seed=1)),
+                                                                  ["discrete", "label"])
+    assert comparison["discrete"]["ks_statistic_error"] == 0
+    assert comparison["label"]["ks_statistic_error"] == 0
+
+
+def test_merged_sketches_equal_the_sketch_of_all_the_rows():
+    df = get_frame(10000, 0.0, seed=0)
+    merged = get_sketch(df.iloc[:3000])
+    for start in range(3000, df.shape[0], 2500):
+        merged.merge(get_sketch(df.iloc[start:start + 2500]))
+    combined = get_sketch(df)
+
+    assert merged.n_rows == combined.n_rows
+    for name in ["counts", "bin_min", "bin_max", "null_counts"]:
+        np.testing.assert_array_equal(getattr(merged, name), getattr(combined, name))
+    assert merged.value_counts == combined.value_counts
+
+    current = get_sketch(get_frame(5000, 0.5, seed=1))
+    assert merged.compare(current, NUMERIC_COLUMNS + ["label"]) == combined.compare(current, NUMERIC_COLUMNS + ["label"])
+
+
+def test_pickled_sketch_is_unchanged():
+    sketch = get_sketch(get_frame(2000, 0.0, seed=0))
+    restored = pickle.loads(pickle.dumps(sketch))
+    for name in ["counts", "bin_min", "bin_max", "null_counts"]:
+        np.testing.assert_array_equal(getattr(restored, name), getattr(sketch, name))
@@ -0,0 +1,83 @@
+import os
+import pytest
+from sensor import utils
+from sensor.entity.artifact_entity import DataValidationArtifact
+from sensor.exception import SensorException
+from sensor.stage_cache import PipelineRun, RUN_MANIFEST_FILE_NAME, get_fingerprint
+
+
+class Stage:
+    """Stage writing a report file and counting its calls; fails while 'fail' is True."""
+
+    def __init__(self, artifact_dir, name:str):
+        self.report_file_path = os.path.join(artifact_dir, name, "report.yaml")
+        self.calls = 0
+        self.fail = False
+
+    def __call__(self) -> DataValidationArtifact:
+        self.calls += 1
+        if self.fail:
+            raise Exception("stage failed")
+        utils.write_yaml_file(file_path=self.report_file_path, data={"calls" : self.calls})
+        return DataValidationArtifact(report_file_path=self.report_file_path)
+
+
+def run(tmp_path, run_id:str, stages:list, resume:bool = False) -> PipelineRun:
+    pipeline_run = PipelineRun(run_id, str(tmp_path / "artifacts" / run_id), stage_cache_dir=str(tmp_path / "stage_cache"),
+                               resume=resume)
+    for name, stage in stages:
+        pipeline_run.run_stage(name, stage, fingerprint=f"{name}-fingerprint")
+    return pipeline_run
+
+
+def get_statuses(pipeline_run:PipelineRun) -> dict:
+    return {stage["stage"] : stage["status"] for stage in utils.read_yaml_file(pipeline_run.manifest_path)["stages"]}
+
+
+@pytest.fixture(autouse=True)
+def work_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
+def test_retry_resumes_from_the_failed_stage(tmp_path):
+    first, second = Stage(tmp_path / "outputs", "first"), Stage(tmp_path / "outputs", "second")
+    second.fail = True
+    with pytest.raises(SensorException, match="stage failed"):
+        run(tmp_path, "run", [("first", first), ("second", second)])
+    manifest = utils.read_yaml_file(str(tmp_path / "artifacts" / "run" / RUN_MANIFEST_FILE_NAME))
+    assert {stage["stage"] : stage["status"] for stage in manifest["stages"]} == {"first" : "completed", "second" : "failed"}
+
+    second.fail = False
+    pipeline_run = run(tmp_path, "run", [("first", first), ("second", second)], resume=True)
+    assert (first.calls, second.calls) == (1, 2)
+    assert get_statuses(pipeline_run) == {"first" : "resumed", "second" : "completed"}
+
+
+def test_other_run_reuses_the_stage_cache(tmp_path):
+    first = Stage(tmp_path / "outputs", "first")
+    run(tmp_path, "run_0", [("first", first)])
+    pipeline_run = run(tmp_path, "run_1", [("first", first)])
+    assert first.calls == 1
+    assert get_statuses(pipeline_run) == {"first" : "cache_hit"}
+    assert pipeline_run.manifest["stages"][0]["source_run_id"] == "run_0"
+
+
+def test_stage_with_deleted_files_runs_again(tmp_path):
+    first = Stage(tmp_path / "outputs", "first")
+    run(tmp_path, "run_0", [("first", first)])
+    os.remove(first.report_file_path)
+    pipeline_run = run(tmp_path, "run_1", [("first", first)])
+    assert first.calls == 2
+    assert get_statuses(pipeline_run) == {"first" : "completed"}
+
+
+def test_fingerprint_ignores_the_artifact_dir():
+    class Config:
+        def __init__(self, artifact_dir):
+            self.report_file_path = os.path.join(artifact_dir, "report.yaml")
+            self.threshold = 0.05
+
+    assert get_fingerprint("stage", Config("/a/run_0"), "/a/run_0") == get_fingerprint("stage", Config("/a/run_1"), "/a/run_1")
+    changed = Config("/a/run_1")
+    changed.threshold = 0.1
+    assert get_fingerprint("stage", Config("/a/run_0"), "/a/run_0") != get_fingerprint("stage", changed, "/a/run_1")
@@ -0,0 +1,89 @@
+import os
+import builtins
+import numpy as np
+import pandas as pd
+from sensor import utils
+from sensor.entity.artifact_entity import DataIngestionArtifact
+from sensor.entity.config_entity import DataTransformationConfig, TrainingPipelineConfig
+from sensor.feature_store import FeatureStore
+from sensor.transformation_cache import TransformationCache
+from sensor.components.data_transformation import DataTransformation
+
+
+def test_rewriting_restored_files_keeps_the_entry(tmp_path):
+    cache = TransformationCache(str(tmp_path / "cache"))
+    file_path = str(tmp_path / "run_1" / "train_features.npy")
+    os.makedirs(os.path.dirname(file_path))
+    np.save(file_path, np.arange(10))
+    cache.store("key", [file_path])
+
+    # a later run gets the entry, then rewrites the file in place
+    restored_path = str(tmp_path / "run_2" / "train_features.npy")
+    assert cache.restore("key", [restored_path])
+    np.save(restored_path, np.zeros(10))
+    np.save(file_path, np.ones(10))
+
+    assert cache.restore("key", [str(tmp_path / "run_3" / "train_features.npy")])
+    np.testing.assert_array_equal(np.load(str(tmp_path / "run_3" / "train_features.npy")), np.arange(10))
+
+
+def test_restore_replaces_an_existing_file(tmp_path):
+    cache = TransformationCache(str(tmp_path / "cache"))
+    file_path = str(tmp_path / "train_features.npy")
+    np.save(file_path, np.arange(10))
+    cache.store("key", [file_path])
+
+    # a file linked to another one is replaced, not written through
+    other_path = str(tmp_path / "other.npy")
+    np.save(other_path, np.zeros(3))
+    restored_path = str(tmp_path / "run" / "train_features.npy")
+    os.makedirs(os.path.dirname(restored_path))
+    os.link(other_path, restored_path)
+    assert cache.restore("key", [restored_path])
+    np.testing.assert_array_equal(np.load(restored_path), np.arange(10))
+    np.testing.assert_array_equal(np.load(other_path), np.zeros(3))
+    assert sorted(os.listdir(os.path.dirname(restored_path))) == ["train_features.npy"]
+
+
+def test_restore_without_an_entry(tmp_path):
+    cache = TransformationCache(str(tmp_path / "cache"))
+    assert not cache.restore("missing", [str(tmp_path / "train_features.npy")])
+
+
+def test_key_reads_the_manifest_and_the_index_files_only(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    feature_store = FeatureStore(str(tmp_path / "feature_store"))
+    feature_store.append(pd.DataFrame({"sensor_0" : np.arange(100, dtype=np.float32)}), watermark=100)
+    index_path = str(tmp_path / "train_index.npy")
+    np.save(index_path, np.arange(80))
+    cache = TransformationCache(str(tmp_path / "cache"))
+
+    opened, original_open = [], builtins.open
+    def recording_open(file, *args, **kwargs):
+        opened.append(str(file))
+        return original_open(file, *args, **kwargs)
+    with monkeypatch.context() as patch:
+        patch.setattr(builtins, "open", recording_open)
+        key = cache.get_key(FeatureStore(str(tmp_path / "feature_store")), [index_path], {"setting" : 1})
+    assert index_path in opened
+    assert not any(path.endswith("sensor_0.npy") for path in opened)
+
+    assert cache.get_key(FeatureStore(str(tmp_path / "feature_store")), [index_path], {"setting" : 1}) == key
+    assert cache.get_key(FeatureStore(str(tmp_path / "feature_store")), [index_path], {"setting" : 2}) != key
+    np.save(index_path, np.arange(70))
+    assert cache.get_key(FeatureStore(str(tmp_path / "feature_store")), [index_path], {"setting" : 1}) != key
+    np.save(index_path, np.arange(80))
+    feature_store.append(pd.DataFrame({"sensor_0" : np.arange(10, dtype=np.float32)}), watermark=110)
+    assert cache.get_key(FeatureStore(str(tmp_path / "feature_store")), [index_path], {"setting" : 1}) != key
+
+
+def test_restored_metadata_names_this_run_feature_store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    config = DataTransformationConfig(TrainingPipelineConfig())
+    utils.write_yaml_file(file_path=config.transformed_metadata_path,
+                          data={"feature_store_dir" : "/artifacts/earlier_run/feature_store", "n_train_rows" : 80})
+    data_ingestion_artifact = DataIngestionArtifact(feature_store_file_path=str(tmp_path / "feature_store"),
+                                                    train_path=None, test_path=None)
+    DataTransformation(config, data_ingestion_artifact).update_restored_metadata()
+    assert utils.read_yaml_file(config.transformed_metadata_path) == {
+        "feature_store_dir" : str(tmp_path / "feature_store"), "n_train_rows" : 80}
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sensor.components.data_transformation import DataTransformation
+from sensor.predictor import TransformerKernel, get_transform_function
+
+
+# the imputer warns when it drops the all missing column
+pytestmark = pytest.mark.filterwarnings("ignore:Skipping features without any observed values")
+
+
+def get_frame(n_rows:int = 500, dtype=np.float64, seed:int = 0) -> pd.DataFrame:
+    """Returns skewed sensor like columns with missing values, a constant and an all missing column."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({f"sensor_{i}" : rng.lognormal(i % 3, 1.5, n_rows) for i in range(6)})
+    for i in range(6):
+        df.loc[rng.random(n_rows) < 0.1 * (i % 3), f"sensor_{i}"] = np.nan
+    df["constant"] = 5.0
+    df["all_missing"] = np.nan
+    return df.astype(dtype)
+
+
+def fit_pipeline(df:pd.DataFrame):
+    return DataTransformation.get_data_transformer_object().fit(df)
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_kernel_matches_pipeline(dtype):
+    train_df, test_df = get_frame(dtype=dtype), get_frame(n_rows=300, dtype=dtype, seed=1)
+    pipeline = fit_pipeline(train_df)
+    kernel = TransformerKernel.from_pipeline(pipeline)
+
+    expected = pipeline.transform(test_df)
+    output = kernel.transform(test_df)
+    assert output.dtype == np.float32
+    assert output.shape == expected.shape
+    np.testing.assert_allclose(output, expected, rtol=1e-5, atol=1e-6)
+    assert kernel.check(pipeline, test_df)
+
+
+def test_kernel_fills_missing_values_and_drops_all_missing_columns():
+    train_df = get_frame()
+    pipeline = fit_pipeline(train_df)
+    kernel = TransformerKernel.from_pipeline(pipeline)
+    assert "all_missing" not in kernel.columns
+
+    test_df = get_frame(n_rows=50, seed=2)
+    test_df.iloc[:10] = np.nan
+    output = kernel.transform(test_df)
+    assert not np.isnan(output).any()
+    np.testing.assert_allclose(output, pipeline.transform(test_df), rtol=1e-5, atol=1e-6)
+
+
+def test_kernel_does_not_write_to_a_single_block_frame():
+    # all the columns in one float32 block : to_numpy returns a read only view of the frame's data
+    df = get_frame(dtype=np.float32).drop(columns=["all_missing"])
+    df = pd.DataFrame(df.to_numpy(), columns=df.columns)
+    pipeline = fit_pipeline(df)
+    before = df.copy()
+    output = TransformerKernel.from_pipeline(pipeline).transform(df)
+    pd.testing.assert_frame_equal(df, before)
+    np.testing.assert_allclose(output, pipeline.transform(df), rtol=1e-5, atol=1e-6)
+
+
+def test_check_returns_false_on_a_mismatch():
+    df = get_frame()
+    pipeline = fit_pipeline(df)
+    kernel = TransformerKernel.from_pipeline(pipeline)
+    kernel.fill_values = kernel.fill_values + 1
+    assert not kernel.check(pipeline, df)
+    # neither can transform a frame without their columns : not raised, the pipeline is used instead
+    renamed_df = df.rename(columns={"constant" : "renamed"})
+    assert not kernel.check(pipeline, renamed_df)
+    assert get_transform_function(pipeline, check_df=renamed_df) == pipeline.transform
+
+
+def test_get_transform_function_uses_the_kernel():
+    df = get_frame()
+    pipeline = fit_pipeline(df)
+    transform = get_transform_function(pipeline)
+    np.testing.assert_allclose(transform(df), pipeline.transform(df), rtol=1e-5, atol=1e-6)
+    assert transform != pipeline.transform
@@ -0,0 +1,56 @@
+import time
+import numpy as np
+import pytest
+from sensor.exception import SensorException
+from sensor.tuning import RUNGS, HyperparameterSearch, _run_trial
+
+
+@pytest.fixture
+def arrays(tmp_path) -> tuple:
+    """Paths of a tiny float32 training array and its noisy binary target."""
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=(400, 5)).astype(np.float32)
+    y = (x[:, 0] + x[:, 1] + rng.normal(scale=0.5, size=400) > 0).astype(np.int64)
+    np.save(str(tmp_path / "x.npy"), x)
+    np.save(str(tmp_path / "y.npy"), y)
+    return str(tmp_path / "x.npy"), str(tmp_path / "y.npy")
+
+
+def test_weak_candidates_are_pruned_at_a_rung(tmp_path, monkeypatch, arrays):
+    monkeypatch.chdir(tmp_path)
+    # every candidate above the lowest loss of the finished ones at a rung is stopped there
+    search = HyperparameterSearch(n_trials=8, max_estimators=40, early_stopping_rounds=40, prune_quantile=0.0,
+                                  min_trials_to_prune=2, chunk_size=64)
+    best_result, results = search.search(*arrays, work_dir=str(tmp_path / "tuning"))
+
+    assert [result["number"] for result in results] == list(range(8))
+    assert [result["status"] for result in results[:2]] == ["complete", "complete"]
+    pruned = [result for result in results if result["status"] == "pruned"]
+    assert len(pruned) > 0
+    for result in pruned:
+        assert result["n_rounds"] in RUNGS and result["validation_f1"] is None
+        thresholds = search.get_rung_thresholds([other for other in results if other["number"] < result["number"]])
+        assert result["rung_losses"][result["n_rounds"]] > thresholds[result["n_rounds"]]
+    assert best_result["status"] == "complete"
+
+
+def test_running_trial_stops_at_the_deadline(tmp_path, monkeypatch, arrays):
+    monkeypatch.chdir(tmp_path)
+    search = HyperparameterSearch()
+    fit_rows, validation_rows = search.split(np.load(arrays[1]))
+    np.save(str(tmp_path / "fit_index.npy"), fit_rows)
+    np.save(str(tmp_path / "validation_index.npy"), validation_rows)
+    result = _run_trial({"number" : 0, "params" : search.get_candidates()[0], "x_path" : arrays[0], "y_path" : arrays[1],
+                         "fit_index_path" : str(tmp_path / "fit_index.npy"),
+                         "validation_index_path" : str(tmp_path / "validation_index.npy"),
+                         "class_weights" : None, "deadline" : time.time() - 1, "n_threads" : 1, "rung_thresholds" : dict(),
+                         "max_estimators" : 100, "early_stopping_rounds" : 20, "chunk_size" : 64})
+    # the deadline is checked after every boosting round, and the trial is still scored
+    assert (result["status"], result["n_rounds"]) == ("timeout", 1)
+    assert result["validation_f1"] is not None
+
+
+def test_no_candidate_past_the_budget(tmp_path, monkeypatch, arrays):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(SensorException, match="No candidate finished within the time budget"):
+        HyperparameterSearch(n_trials=4, time_budget=-1).search(*arrays, work_dir=str(tmp_path / "tuning"))
@@ -0,0 +1,91 @@
+import multiprocessing
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from sensor import utils
+from sensor.config import TARGET_COLUMN
+from sensor.schema import FEATURE_COLUMNS
+from sensor.entity.artifact_entity import DataIngestionArtifact
+from sensor.entity.config_entity import DataValidationConfig, TrainingPipelineConfig
+from sensor.feature_store import FeatureStore
+from sensor.validation_executor import ValidationExecutor, _attach_block
+from sensor.components.data_validation import DataValidation
+
+
+def attach_and_get_tracker_calls(name:str) -> list:
+    """Attaches the block 'name' and returns the commands sent to the resource tracker meanwhile."""
+    calls = []
+    send = resource_tracker._resource_tracker._send
+    resource_tracker._resource_tracker._send = lambda command, name, rtype: calls.append(command)
+    try:
+        _attach_block(name).close()
+    finally:
+        resource_tracker._resource_tracker._send = send
+    return calls
+
+
+def test_workers_do_not_track_attached_blocks():
+    block = shared_memory.SharedMemory(create=True, size=16)
+    try:
+        context = multiprocessing.get_context("forkserver")
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            assert pool.submit(attach_and_get_tracker_calls, block.name).result() == []
+    finally:
+        block.close()
+        block.unlink()
+
+
+def test_executor_results_do_not_depend_on_the_workers():
+    rng = np.random.default_rng(0)
+    base = pd.DataFrame(rng.random((4000, 6)), columns=[f"sensor_{i}" for i in range(6)])
+    base.iloc[:100, 0] = np.nan
+    current = base + 0.05
+    results = []
+    for n_jobs in [1, 2]:
+        with ValidationExecutor(n_jobs=n_jobs, chunk_size=1000) as executor:
+            executor.add_dataframe("base", base)
+            executor.add_dataframe("current", current)
+            results.append((executor.null_percent(["base", "current"]),
+                            executor.drift_pvalues("base", ["current"], list(base.columns))))
+    assert results[0][0]["base"].equals(results[1][0]["base"])
+    assert results[0][1] == results[1][1]
+
+
+def write_sensor_csv(file_path, n_rows:int, shift:float, seed:int) -> None:
+    """Writes 'n_rows' rows of the first sensor columns : one almost always missing, one shifted by 'shift'."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({column : rng.lognormal(0, 1, n_rows).round(2) for column in FEATURE_COLUMNS[:6]})
+    df[FEATURE_COLUMNS[1]] += shift
+    df.loc[rng.random(n_rows) < 0.8, FEATURE_COLUMNS[2]] = np.nan
+    df.loc[rng.random(n_rows) < 0.1, FEATURE_COLUMNS[3]] = np.nan
+    df.insert(0, TARGET_COLUMN, np.where(rng.random(n_rows) < 0.1, "pos", "neg"))
+    df.to_csv(file_path, index=False, na_rep="na")
+
+
+def validate(tmp_path, run_id:str, n_jobs:int, out_of_core:bool) -> dict:
+    training_pipeline_config = TrainingPipelineConfig(run_id=run_id)
+    config = DataValidationConfig(training_pipeline_config)
+    config.base_file_path = str(tmp_path / "base.csv")
+    config.n_jobs = n_jobs
+    config.out_of_core = out_of_core
+    config.chunk_size = 300
+    data_ingestion_artifact = DataIngestionArtifact(str(tmp_path / "feature_store"), str(tmp_path / "train_index.npy"),
+                                                    str(tmp_path / "test_index.npy"))
+    DataValidation(config, data_ingestion_artifact).initiate_data_validation()
+    return utils.read_yaml_file(config.report_file_path)
+
+
+def test_parallel_validation_writes_the_same_report(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_sensor_csv(tmp_path / "base.csv", 1500, shift=0, seed=0)
+    write_sensor_csv(tmp_path / "current.csv", 1200, shift=0.3, seed=1)
+    FeatureStore(str(tmp_path / "feature_store")).append(utils.read_sensor_csv(str(tmp_path / "current.csv")), watermark=1200)
+    np.save(tmp_path / "train_index.npy", np.arange(0, 1200, 4))
+    np.save(tmp_path / "test_index.npy", np.setdiff1d(np.arange(1200), np.arange(0, 1200, 4)))
+
+    expected = validate(tmp_path, "serial", n_jobs=1, out_of_core=False)
+    assert expected["missing_values_in_train_data"] == [FEATURE_COLUMNS[2]]
+    assert not expected["data_drift_in_test_data"][FEATURE_COLUMNS[1]]["same_distribution"]
+    assert validate(tmp_path, "parallel", n_jobs=2, out_of_core=False) == expected
+    assert validate(tmp_path, "parallel_out_of_core", n_jobs=2, out_of_core=True) == expected
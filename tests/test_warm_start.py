@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+from xgboost import XGBClassifier
+from sensor import utils
+from sensor.config import TARGET_COLUMN
+from sensor.feature_store import FeatureStore
+from sensor.sketch import ColumnSketch
+from sensor.warm_start import get_rows_digest, plan_warm_start, set_lineage
+
+
+N_OLD_ROWS = 300
+
+
+class ChampionResolver:
+    """Registry holding a single champion, with the methods of ModelResolver plan_warm_start calls."""
+
+    def __init__(self, champion_dir):
+        self.champion_dir = champion_dir
+
+    def get_latest_dir(self):
+        return str(self.champion_dir)
+
+    def get_latest_model_path(self):
+        return str(self.champion_dir / "model.pkl")
+
+    def get_latest_reference_sketch_path(self):
+        return str(self.champion_dir / "reference_sketch.pkl")
+
+
+def get_frame(n_rows:int, n_positives:int, seed:int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({f"sensor_{i}" : rng.lognormal(0, 1, n_rows).astype(np.float32) for i in range(3)})
+    df[TARGET_COLUMN] = "neg"
+    df.loc[rng.choice(n_rows, n_positives, replace=False), TARGET_COLUMN] = "pos"
+    return df
+
+
+@pytest.fixture
+def warm_start_setup(tmp_path, monkeypatch):
+    """Returns a function appending new rows with 'n_positives' positives to a feature store whose
+    first N_OLD_ROWS rows a champion was trained on, and returning the arguments of plan_warm_start."""
+    monkeypatch.chdir(tmp_path)
+    feature_store = FeatureStore(str(tmp_path / "feature_store"))
+    old_df = get_frame(N_OLD_ROWS, 30, seed=0)
+    feature_store.append(old_df, watermark=N_OLD_ROWS)
+    test_rows = np.arange(0, N_OLD_ROWS, 5)
+
+    feature_columns = [column for column in old_df.columns if column != TARGET_COLUMN]
+    model = XGBClassifier(n_estimators=2).fit(old_df[feature_columns], old_df[TARGET_COLUMN] == "pos")
+    set_lineage(model, feature_store.feature_store_dir, N_OLD_ROWS, n_warm_starts=0,
+                test_rows_digest=get_rows_digest(test_rows, N_OLD_ROWS))
+    champion_dir = tmp_path / "saved_models" / "0"
+    utils.save_object(file_path=str(champion_dir / "model.pkl"), obj=model)
+    reference_sketch = ColumnSketch(feature_columns)
+    reference_sketch.update(old_df[feature_columns])
+    utils.save_object(file_path=str(champion_dir / "reference_sketch.pkl"), obj=reference_sketch)
+
+    def add_new_rows(n_rows:int, n_positives:int) -> tuple:
+        feature_store.append(get_frame(n_rows, n_positives, seed=1), watermark=N_OLD_ROWS + n_rows)
+        all_rows = np.arange(N_OLD_ROWS + n_rows)
+        return ChampionResolver(champion_dir), feature_store, np.setdiff1d(all_rows, test_rows), test_rows
+
+    return add_new_rows
+
+
+def plan(model_resolver, feature_store, train_rows, test_rows, min_class_rows:int) -> dict:
+    return plan_warm_start(model_resolver, feature_store, train_rows, test_rows, full_retrain_every=4,
+                           full_retrain_drift_share=0.2, drift_pvalue_threshold=0.05, min_class_rows=min_class_rows)
+
+
+@pytest.mark.parametrize("n_positives", [0, 3])
+def test_small_delta_falls_back_to_full_training_when_resampled(warm_start_setup, n_positives):
+    warm_start_plan = plan(*warm_start_setup(n_rows=40, n_positives=n_positives), min_class_rows=6)
+    assert not warm_start_plan["warm_start"]
+    assert warm_start_plan["reason"].startswith("too few rows of a class")
+
+
+def test_small_delta_warm_starts_without_resampling(warm_start_setup):
+    warm_start_plan = plan(*warm_start_setup(n_rows=40, n_positives=3), min_class_rows=0)
+    assert warm_start_plan["warm_start"]
+    np.testing.assert_array_equal(warm_start_plan["new_train_rows"], np.arange(N_OLD_ROWS, N_OLD_ROWS + 40))
+
+
+def test_delta_with_enough_minority_rows_warm_starts(warm_start_setup):
+    warm_start_plan = plan(*warm_start_setup(n_rows=40, n_positives=6), min_class_rows=6)
+    assert warm_start_plan["warm_start"]